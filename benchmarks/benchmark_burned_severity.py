@@ -0,0 +1,76 @@
+"""
+Compares the run times of the numpy and the numba backend of the BurnedSeverityPostProcessor on synthetic reflectances.
+
+    $ python benchmarks/benchmark_burned_severity.py --size 4000 --repeats 3
+"""
+import argparse
+import logging
+import numpy as np
+import time
+
+from multiply_post_processing import burned_severity_kernels
+from multiply_post_processing.burned_severity_post_processor import calc_geo_cbi, calc_scene_statistics
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+_NO_DATA = -9999
+_SCALE_FACTOR = 0.0001
+
+
+def _create_bands(size: int, seed: int = 42) -> list:
+    random_state = np.random.RandomState(seed)
+    bands = []
+    for i in range(6):
+        band = random_state.randint(0, 6000, size=(size, size))
+        band[random_state.rand(size, size) < 0.05] = _NO_DATA
+        bands.append(band)
+    # simulate a burned area: the post-fire scene (odd indexes) gets brighter in swir and darker in nir
+    burned = slice(size // 4, size // 2)
+    bands[2][burned, burned] += 3000
+    bands[3][burned, burned] += 3000
+    bands[5][burned, burned] -= 2000
+    return bands
+
+
+def _time(function, bands: list, repeats: int) -> float:
+    run_times = []
+    for i in range(repeats):
+        # the numpy implementation works partly in place, so every run gets fresh copies
+        band_copies = [band.copy() for band in bands]
+        start = time.perf_counter()
+        function(*band_copies, _NO_DATA, _SCALE_FACTOR)
+        run_times.append(time.perf_counter() - start)
+    return min(run_times)
+
+
+def _numpy_backend(smir_0, swir_0, smir_1, swir_1, nir_0, nir_1, no_data, scale_factor):
+    scene_statistics = calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, no_data, scale_factor)
+    return calc_geo_cbi(smir_0, swir_0, smir_1, swir_1, nir_0, nir_1, no_data, scale_factor, scene_statistics)
+
+
+def _numba_backend(smir_0, swir_0, smir_1, swir_1, nir_0, nir_1, no_data, scale_factor):
+    scene_statistics = burned_severity_kernels.calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, no_data,
+                                                                     scale_factor)
+    return burned_severity_kernels.calc_geo_cbi(smir_0, swir_0, smir_1, swir_1, nir_0, nir_1, no_data,
+                                                scale_factor, scene_statistics)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the BurnedSeverity backends')
+    parser.add_argument('-s', '--size', type=int, default=2000, help='Width and height of the synthetic scene.')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='Number of runs per backend. The best is kept.')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    bands = _create_bands(args.size)
+    numpy_time = _time(_numpy_backend, bands, args.repeats)
+    print(f'numpy: {numpy_time:.3f} s')
+    if not burned_severity_kernels.NUMBA_AVAILABLE:
+        print('numba: not available')
+    else:
+        # the first call compiles the kernels
+        _numba_backend(*[band[:8, :8] for band in bands], _NO_DATA, _SCALE_FACTOR)
+        numba_time = _time(_numba_backend, bands, args.repeats)
+        print(f'numba: {numba_time:.3f} s (speed-up {numpy_time / numba_time:.1f}x)')
+        numpy_result = _numpy_backend(*[band.copy() for band in bands], _NO_DATA, _SCALE_FACTOR)
+        numba_result = _numba_backend(*bands, _NO_DATA, _SCALE_FACTOR)
+        print(f'results identical: {np.array_equal(numpy_result, numba_result)}')
@@ -1,7 +1,23 @@
+import importlib
+import sys
+
 from .post_processor import EODataPostProcessor, PostProcessor, PostProcessorCreator, PostProcessorType, \
     VariablePostProcessor
 from .burned_severity_post_processor import BurnedSeverityPostProcessorCreator
 from .functional_diversity_metrics_post_processor import FunctionalDiversityMetricsPostProcessorCreator
-from .post_processing import add_post_processor_creator, get_available_indicators, get_post_processor_description,\
-    get_post_processor_names, run_post_processing, run_post_processor, get_post_processor_creators
+from .registry import add_post_processor_creator, get_available_indicators, get_post_processor_description, \
+    get_post_processor_names, get_post_processor_creators
 from .version import __version__
+
+# the post processing requires gdal, so it is only imported when a post processor is run
+_LAZY_ATTRIBUTES = {'run_post_processing': '.post_processing', 'run_post_processor': '.post_processing'}
+
+if sys.version_info < (3, 7):
+    # modules cannot provide attributes lazily before Python 3.7
+    from .post_processing import run_post_processing, run_post_processor
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    raise AttributeError(f'module {__name__} has no attribute {name}')
@@ -0,0 +1,162 @@
+"""
+Fused kernels for the BurnedSeverityPostProcessor. Instead of creating a full-size temporary array for every step of
+the derivation, each kernel runs the whole chain from the reflectances to the result in a single parallel loop over the
+pixels. The kernels require numba. They reproduce the arithmetic of the NumPy implementation in
+burned_severity_post_processor, including its casts to float32.
+"""
+import numpy as np
+
+from typing import Optional
+
+from multiply_post_processing.burned_severity_post_processor import _MEAN_MIRBI_1, _MEAN_NBR2_1, _MEAN_NIR_1
+from multiply_post_processing.reductions import MaskedMean
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+
+@njit
+def _mirbi(smir, swir, no_data, scale_factor):
+    if swir == no_data:
+        swir = -1
+    if smir == no_data:
+        smir = -1
+    return 10 * (swir * scale_factor) - 9.8 * (smir * scale_factor) + 2
+
+
+@njit
+def _normalized_difference(first, second, no_data, scale_factor):
+    if first == no_data:
+        first = -1
+    if second == no_data:
+        second = -1
+    first_scaled = first * scale_factor
+    second_scaled = second * scale_factor
+    valid = (first_scaled + second_scaled) != 0
+    if not valid:
+        first_scaled = 0.0
+        second_scaled = 0.2
+    return (first_scaled - second_scaled) / (first_scaled + second_scaled), valid
+
+
+@njit(parallel=True)
+def _scene_sums(smir_0, swir_0, smir_1, swir_1, nir_1, no_data, scale_factor):
+    mirbi_sum = 0.0
+    mirbi_count = 0
+    nbr2_sum = 0.0
+    nbr2_count = 0
+    nir_sum = 0.0
+    nir_count = 0
+    for i in prange(smir_0.shape[0]):
+        if swir_1[i] != no_data and swir_0[i] != no_data and smir_1[i] != no_data and smir_0[i] != no_data:
+            mirbi_sum += np.float64(np.float32(_mirbi(smir_1[i], swir_1[i], no_data, scale_factor)))
+            mirbi_count += 1
+            nbr2, valid = _normalized_difference(smir_1[i], swir_1[i], no_data, scale_factor)
+            if valid:
+                nbr2_sum += np.float64(np.float32(nbr2))
+                nbr2_count += 1
+        if nir_1[i] != no_data:
+            nir_sum += np.float64(nir_1[i])
+            nir_count += 1
+    return mirbi_sum, mirbi_count, nbr2_sum, nbr2_count, nir_sum, nir_count
+
+
+@njit(parallel=True)
+def _geo_cbi(smir_0, swir_0, smir_1, swir_1, nir_0, nir_1, no_data, scale_factor, mean_mirbi_1, mean_nbr2_1,
+             mean_nir_1):
+    geo_cbi = np.empty(smir_0.shape[0], dtype=np.float64)
+    for i in prange(smir_0.shape[0]):
+        geo_cbi[i] = no_data
+        if swir_1[i] == no_data or swir_0[i] == no_data or smir_1[i] == no_data or smir_0[i] == no_data:
+            continue
+        if nir_1[i] == no_data or nir_0[i] == no_data:
+            continue
+        mirbi_1 = np.float32(_mirbi(smir_1[i], swir_1[i], no_data, scale_factor))
+        if not mirbi_1 > mean_mirbi_1:
+            continue
+        mirbi_0 = np.float32(_mirbi(smir_0[i], swir_0[i], no_data, scale_factor))
+        if not np.float32(mirbi_1 - mirbi_0) > 0.25:
+            continue
+        nbr2_1, valid = _normalized_difference(smir_1[i], swir_1[i], no_data, scale_factor)
+        if not valid:
+            continue
+        nbr2_1 = np.float32(nbr2_1)
+        if not nbr2_1 < mean_nbr2_1:
+            continue
+        nbr2_0, valid = _normalized_difference(smir_0[i], swir_0[i], no_data, scale_factor)
+        if not valid:
+            continue
+        if not np.float64(np.float32(nbr2_1 - np.float32(nbr2_0))) < -0.05:
+            continue
+        if not nir_1[i] < mean_nir_1:
+            continue
+        if not nir_1[i] - nir_0[i] < -0.01:
+            continue
+        nbr_1, valid = _normalized_difference(nir_1[i], swir_1[i], no_data, scale_factor)
+        if not valid:
+            continue
+        nbr_0, valid = _normalized_difference(nir_0[i], swir_0[i], no_data, scale_factor)
+        if not valid:
+            continue
+        nbr_1 = np.float32(nbr_1)
+        nbr_0 = np.float32(nbr_0)
+        diff_nbr = np.float64(np.float32(nbr_0 - nbr_1))
+        value = diff_nbr / np.float64(np.float32(nbr_0 + np.float32(1.001)))
+        if value != no_data:
+            value *= 2.80278
+        if value != no_data:
+            value += 1.07541
+        if value > 3.0:
+            value = 3.0
+        geo_cbi[i] = value
+    return geo_cbi
+
+
+def _as_flat_array(array: np.array) -> np.array:
+    return np.ascontiguousarray(array, dtype=np.int64).ravel()
+
+
+def calc_scene_statistics(smir_0: np.array, swir_0: np.array, smir_1: np.array, swir_1: np.array, nir_1: np.array,
+                          no_data: float, scale_factor: float) -> dict:
+    """
+    Fused counterpart of burned_severity_post_processor.calc_scene_statistics. Sums are accumulated in a different
+    order than in the NumPy implementation, so the resulting means may differ in the last digits.
+    """
+    mirbi_sum, mirbi_count, nbr2_sum, nbr2_count, nir_sum, nir_count = \
+        _scene_sums(_as_flat_array(smir_0), _as_flat_array(swir_0), _as_flat_array(smir_1), _as_flat_array(swir_1),
+                    _as_flat_array(nir_1), no_data, scale_factor)
+    scene_statistics = {_MEAN_MIRBI_1: MaskedMean(no_data), _MEAN_NBR2_1: MaskedMean(no_data),
+                        _MEAN_NIR_1: MaskedMean(no_data)}
+    scene_statistics[_MEAN_MIRBI_1].add(mirbi_sum, mirbi_count)
+    scene_statistics[_MEAN_NBR2_1].add(nbr2_sum, nbr2_count)
+    scene_statistics[_MEAN_NIR_1].add(nir_sum, nir_count)
+    return scene_statistics
+
+
+def calc_geo_cbi(smir_0: np.array, swir_0: np.array, smir_1: np.array, swir_1: np.array, nir_0: np.array,
+                 nir_1: np.array, no_data: float, scale_factor: float, scene_statistics: Optional[dict] = None) \
+        -> np.array:
+    """
+    Fused counterpart of burned_severity_post_processor.calc_geo_cbi.
+    """
+    if scene_statistics is None:
+        scene_statistics = calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, no_data, scale_factor)
+    # the NumPy implementation compares the float32 indexes with the means in single precision
+    mean_mirbi_1 = np.float32(scene_statistics[_MEAN_MIRBI_1].get_mean())
+    mean_nbr2_1 = np.float32(scene_statistics[_MEAN_NBR2_1].get_mean())
+    mean_nir_1 = np.float64(scene_statistics[_MEAN_NIR_1].get_mean())
+    geo_cbi = _geo_cbi(_as_flat_array(smir_0), _as_flat_array(swir_0), _as_flat_array(smir_1),
+                       _as_flat_array(swir_1), _as_flat_array(nir_0), _as_flat_array(nir_1), no_data, scale_factor,
+                       mean_mirbi_1, mean_nbr2_1, mean_nir_1)
+    return geo_cbi.reshape(np.shape(smir_0))
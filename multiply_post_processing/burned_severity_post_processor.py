@@ -1,13 +1,16 @@
 from abc import ABCMeta
 import logging
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 import numpy as np
 
-from multiply_core.observations import ObservationsWrapper, DataTypeConstants, SENTINEL_2_MODEL_DATA_TYPE
 from multiply_core.variables import Variable
 from multiply_post_processing import EODataPostProcessor, PostProcessorCreator, PostProcessor, PostProcessorType
 from multiply_post_processing.indicators import get_indicator
+from multiply_post_processing.reductions import MaskedMean, merge_statistics
+
+if TYPE_CHECKING:
+    from multiply_core.observations import ObservationsWrapper
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH), Gonzalo Otón & Magí Franquesa (Universidad de Alcalá)'
 
@@ -19,9 +22,22 @@ _SENTINEL_2_DICT = {'no_data': -9999,'scale_factor': 0.0001, 'version': '_3', 'n
                     'smir': 'B11_sur.tif', 'swir': 'B12_sur.tif'}
 _LANDSAT_7_DICT = {'scale_factor': 0.0001, 'version': '_1'}
 _LANDSAT_8_DICT = {'scale_factor': 0.0001, 'version': '_1'}
-_DATA_DICTS = {DataTypeConstants.AWS_S2_L2: _SENTINEL_2_DICT, DataTypeConstants.S2_L2: _SENTINEL_2_DICT}
 _INDICATOR_NAMES = ['GeoCBI']
 _INDICATOR_DESCRIPTIONS = [get_indicator('GeoCBI')]
+_MEAN_MIRBI_1 = 'mean_mirbi_1'
+_MEAN_NBR2_1 = 'mean_nbr2_1'
+_MEAN_NIR_1 = 'mean_nir_1'
+_MIRBI = 'mirbi'
+_NBR2 = 'nbr2'
+_NBR2_MASK = 'nbr2_mask'
+_NBR = 'nbr'
+_NBR_MASK = 'nbr_mask'
+_DATE = 'date'
+_DATE_INDEX_NAMES = [_MIRBI, _NBR2, _NBR2_MASK, _NBR, _NBR_MASK]
+_BACKEND = 'backend'
+_DATA_TYPE = 'data_type'
+_NUMPY_BACKEND = 'numpy'
+_NUMBA_BACKEND = 'numba'
 
 logging.getLogger().setLevel(logging.INFO)
 
@@ -92,24 +108,260 @@ def calc_nbr2(smir, swir, Mask, no_data: float, scale_factor: float):
     return NBR2
 
 
-def mask_values(array, NoData):
-    if np.max(array) == NoData:
-        return NoData
-    y = np.ma.masked_values(array, NoData)
-    mean = y.mean()
+def _calc_defined_mask(band_0: np.array, band_1: np.array, no_data: float, scale_factor: float) -> np.array:
+    # the pixels for which calc_nbr and calc_nbr2 can derive a normalized difference of the bands
+    band_0 = np.where((band_0 == no_data), -1, band_0) * scale_factor
+    band_1 = np.where((band_1 == no_data), -1, band_1) * scale_factor
+    return (band_0 + band_1) != 0
+
+
+def calc_date_index(index_name: str, smir: np.array, swir: np.array, nir: np.array, no_data: float,
+                    scale_factor: float) -> np.array:
+    """
+    Derives an index of a single date that does not depend on the other date of a pair. Indices are not yet masked
+    with the pixels that are valid in both dates, so they can be reused for each pair the date is part of.
+    :param index_name: One of 'mirbi', 'nbr2', 'nbr2_mask', 'nbr' and 'nbr_mask'. The masks state where NBR2 and NBR
+    are defined.
+    """
+    all_valid = np.ones(np.shape(smir), dtype=np.bool_)
+    if index_name == _MIRBI:
+        return calc_mirbi(smir, swir, all_valid, no_data, scale_factor)
+    if index_name == _NBR2:
+        return calc_nbr2(smir, swir, all_valid, no_data, scale_factor)
+    if index_name == _NBR2_MASK:
+        return _calc_defined_mask(smir, swir, no_data, scale_factor)
+    if index_name == _NBR:
+        return calc_nbr(swir, nir, all_valid, no_data, scale_factor)
+    if index_name == _NBR_MASK:
+        return _calc_defined_mask(swir, nir, no_data, scale_factor)
+    raise ValueError(f'Unknown index {index_name}.')
+
+
+def calc_date_indices(smir: np.array, swir: np.array, nir: np.array, no_data: float, scale_factor: float) -> dict:
+    return {index_name: calc_date_index(index_name, smir, swir, nir, no_data, scale_factor)
+            for index_name in _DATE_INDEX_NAMES}
 
-    print(mean)
-    return mean
+
+def _mask(index: np.array, mask: np.array, no_data: float) -> np.array:
+    return np.where(mask, index, index.dtype.type(no_data))
+
+
+def mask_values(array, NoData):
+    masked_mean = MaskedMean(NoData)
+    masked_mean.update(array)
+    return masked_mean.get_mean()
+
+
+def _get_scene_statistics(mirbi_1: np.array, nbr2_1: np.array, nir_1: np.array, no_data: float) -> dict:
+    scene_statistics = {_MEAN_MIRBI_1: MaskedMean(no_data), _MEAN_NBR2_1: MaskedMean(no_data),
+                        _MEAN_NIR_1: MaskedMean(no_data)}
+    scene_statistics[_MEAN_MIRBI_1].update(mirbi_1)
+    scene_statistics[_MEAN_NBR2_1].update(nbr2_1)
+    scene_statistics[_MEAN_NIR_1].update(nir_1)
+    return scene_statistics
+
+
+def calc_scene_statistics(smir_0: np.array, swir_0: np.array, smir_1: np.array, swir_1: np.array, nir_1: np.array,
+                          no_data: float, scale_factor: float) -> dict:
+    s_mask = (swir_1 != no_data) * (swir_0 != no_data) * (smir_1 != no_data) * (smir_0 != no_data)
+    mirbi_1 = calc_mirbi(smir_1, swir_1, s_mask, no_data, scale_factor)
+    nbr2_1 = calc_nbr2(smir_1, swir_1, s_mask, no_data, scale_factor)
+    return _get_scene_statistics(mirbi_1, nbr2_1, nir_1, no_data)
+
+
+def calc_geo_cbi(smir_0: np.array, swir_0: np.array, smir_1: np.array, swir_1: np.array, nir_0: np.array,
+                 nir_1: np.array, no_data: float, scale_factor: float, scene_statistics: Optional[dict] = None) \
+        -> np.array:
+    indices_0 = calc_date_indices(smir_0, swir_0, nir_0, no_data, scale_factor)
+    indices_1 = calc_date_indices(smir_1, swir_1, nir_1, no_data, scale_factor)
+    return calc_geo_cbi_from_indices(smir_0, swir_0, smir_1, swir_1, nir_0, nir_1, indices_0, indices_1, no_data,
+                                     scene_statistics)
+
+
+def calc_geo_cbi_from_indices(smir_0: np.array, swir_0: np.array, smir_1: np.array, swir_1: np.array,
+                              nir_0: np.array, nir_1: np.array, indices_0: dict, indices_1: dict, no_data: float,
+                              scene_statistics: Optional[dict] = None) -> np.array:
+    """
+    Derives the GeoCBI of a pair of dates from their bands and the indices of the single dates as derived by
+    calc_date_indices. The indices are not altered.
+    """
+    logging.info('Calculating SWIR/SMIR Mask')
+    swir_mask = (swir_1 != no_data) * (swir_0 != no_data)
+    smir_mask = (smir_1 != no_data) * (smir_0 != no_data)
+    s_mask = swir_mask * smir_mask
+    logging.info('Calculating MIRBI')
+    mirbi_1 = _mask(indices_1[_MIRBI], s_mask, no_data)
+    mirbi_0 = _mask(indices_0[_MIRBI], s_mask, no_data)
+    logging.info('Calculating difMIRBI')
+    diff_mirbi = mirbi_1 - mirbi_0
+    diff_mirbi *= s_mask + no_data * np.invert(s_mask)
+    logging.info('Calculating NBR2')
+    # the mask is restricted to the pixels where NBR2 is defined in the later and then also in the earlier date
+    s_mask *= indices_1[_NBR2_MASK]
+    nbr2_1 = _mask(indices_1[_NBR2], s_mask, no_data)
+    s_mask *= indices_0[_NBR2_MASK]
+    nbr2_0 = _mask(indices_0[_NBR2], s_mask, no_data)
+    logging.info('Calculating difNBR2')
+    diff_nbr2 = nbr2_1 - nbr2_0
+    diff_nbr2 = diff_nbr2 * s_mask + no_data * np.invert(s_mask)
+    logging.info('Calculating NIR Mask')
+    nir_mask = (nir_1 != no_data) * (nir_0 != no_data)
+    logging.info('Calculating difNIR')
+    diff_nir = nir_1 - nir_0
+    diff_nir = diff_nir * nir_mask + no_data * np.invert(nir_mask)
+    if scene_statistics is None:
+        scene_statistics = _get_scene_statistics(mirbi_1, nbr2_1, nir_1, no_data)
+    mean_mirbi_1 = scene_statistics[_MEAN_MIRBI_1].get_mean()
+    mean_nbr2_1 = scene_statistics[_MEAN_NBR2_1].get_mean()
+    mean_nir_1 = scene_statistics[_MEAN_NIR_1].get_mean()
+
+    logging.info('Calculating Burned Mask')
+    mean_mirbi_mask = mirbi_1 > mean_mirbi_1
+    diff_mirbi_mask = diff_mirbi > 0.25
+    mean_nbr2_1_mask = nbr2_1 < mean_nbr2_1
+    diff_nbr2_mask = diff_nbr2 < -0.05
+    mean_nir_1_mask = nir_1 < mean_nir_1
+    diff_nir_mask = diff_nir < -0.01
+    burned_mask = s_mask * nir_mask * mean_mirbi_mask * diff_mirbi_mask * mean_nbr2_1_mask * diff_nbr2_mask * \
+                  mean_nir_1_mask * diff_nir_mask
+    logging.info('Calculating NBR')
+    burned_mask *= indices_1[_NBR_MASK]
+    nbr_1 = _mask(indices_1[_NBR], burned_mask, no_data)
+    burned_mask *= indices_0[_NBR_MASK]
+    nbr_0 = _mask(indices_0[_NBR], burned_mask, no_data)
+    logging.info('Calculating difNBR')
+    diff_nbr = (nbr_0 - nbr_1) * burned_mask + no_data * np.invert(burned_mask)
+    logging.info('Calculating RBR')
+    rbr = diff_nbr / (nbr_0 + 1.001)
+    rbr = rbr * burned_mask + no_data * np.invert(burned_mask)
+    geo_cbi = rbr
+    geo_cbi[geo_cbi != no_data] *= 2.80278
+    geo_cbi[geo_cbi != no_data] += 1.07541
+    geo_cbi[geo_cbi > 3.0] = 3.0
+    return geo_cbi
 
 
 class BurnedSeverityPostProcessor(EODataPostProcessor):
 
+    def __init__(self, indicator_names: List[str]):
+        super().__init__(indicator_names)
+        self._backend = _NUMPY_BACKEND
+
+    def set_parameters(self, parameters: dict):
+        """
+        Supported parameters are:
+        'backend': Either 'numpy' (default) or 'numba'. The numba backend derives the burned severity in fused
+        parallel kernels. If numba is not available, the numpy backend is used.
+        """
+        for parameter_name in parameters:
+            if parameter_name == _BACKEND:
+                self._set_backend(parameters[parameter_name])
+            else:
+                logging.info(f'Parameter {parameter_name} is not supported by post processor {self.get_name()}.')
+
+    def _set_backend(self, backend: str):
+        if backend == _NUMBA_BACKEND:
+            from multiply_post_processing.burned_severity_kernels import NUMBA_AVAILABLE
+            if not NUMBA_AVAILABLE:
+                logging.warning('Backend numba is not available. Falling back to numpy.')
+                backend = _NUMPY_BACKEND
+        elif backend != _NUMPY_BACKEND:
+            raise ValueError(f'Unknown backend {backend}. Must be one of {_NUMPY_BACKEND}, {_NUMBA_BACKEND}.')
+        self._backend = backend
+
+    def _get_strips(self, shape: Tuple[int, int]) -> Optional[List[Tuple[int, int]]]:
+        """
+        :return: The first and end rows of strips of the scene, so that an array of doubles covering a strip does not
+        exceed the memory threshold of the scratch space, or None if a double array of the whole scene does not exceed
+        it either
+        """
+        rows, columns = shape
+        if not self._scratch_space.exceeds_threshold(rows * columns * np.dtype(np.float64).itemsize):
+            return None
+        strip_rows = max(1, self._scratch_space.get_memory_threshold() // (columns * np.dtype(np.float64).itemsize))
+        return [(start, min(start + strip_rows, rows)) for start in range(0, rows, strip_rows)]
+
+    def _calc_scene_statistics(self, smir_0: np.array, swir_0: np.array, smir_1: np.array, swir_1: np.array,
+                               nir_1: np.array, no_data: float, scale_factor: float) -> dict:
+        if self._backend == _NUMBA_BACKEND:
+            from multiply_post_processing import burned_severity_kernels
+            return burned_severity_kernels.calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, no_data,
+                                                                 scale_factor)
+        strips = self._get_strips(np.shape(smir_0))
+        if strips is None:
+            return calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, no_data, scale_factor)
+        # the temporaries of the numpy implementation are scene sized, so large scenes are processed strip by strip
+        scene_statistics = None
+        for start, end in strips:
+            scene_statistics = merge_statistics(scene_statistics,
+                                                calc_scene_statistics(smir_0[start:end], swir_0[start:end],
+                                                                      smir_1[start:end], swir_1[start:end],
+                                                                      nir_1[start:end], no_data, scale_factor))
+        return scene_statistics
+
+    def _get_cached(self, date: Optional[str], name: str, function, *args):
+        if self._date_cache is None or date is None:
+            return function(*args)
+        return self._date_cache.get(date, name, function, *args)
+
+    def _calc_date_index(self, index_name: str, smir: np.array, swir: np.array, nir: np.array, no_data: float,
+                         scale_factor: float) -> np.array:
+        strips = self._get_strips(np.shape(smir))
+        if strips is None:
+            return calc_date_index(index_name, smir, swir, nir, no_data, scale_factor)
+        index = None
+        for start, end in strips:
+            strip_index = calc_date_index(index_name, smir[start:end], swir[start:end], nir[start:end], no_data,
+                                          scale_factor)
+            if index is None:
+                index = self._scratch_space.empty(np.shape(smir), strip_index.dtype)
+            index[start:end] = strip_index
+        return index
+
+    def _get_date_indices(self, date: Optional[str], smir: np.array, swir: np.array, nir: np.array, no_data: float,
+                          scale_factor: float) -> dict:
+        return {index_name: self._get_cached(date, index_name, self._calc_date_index, index_name, smir, swir, nir,
+                                             no_data, scale_factor)
+                for index_name in _DATE_INDEX_NAMES}
+
+    def _calc_geo_cbi(self, smir_0: np.array, swir_0: np.array, smir_1: np.array, swir_1: np.array,
+                      nir_0: np.array, nir_1: np.array, no_data: float, scale_factor: float,
+                      scene_statistics: Optional[dict], date_0: Optional[str] = None,
+                      date_1: Optional[str] = None) -> np.array:
+        if self._backend == _NUMBA_BACKEND:
+            from multiply_post_processing import burned_severity_kernels
+            return burned_severity_kernels.calc_geo_cbi(smir_0, swir_0, smir_1, swir_1, nir_0, nir_1, no_data,
+                                                        scale_factor, scene_statistics)
+        # the indices of a date are derived only once if the date is part of consecutive pairs
+        indices_0 = self._get_date_indices(date_0, smir_0, swir_0, nir_0, no_data, scale_factor)
+        indices_1 = self._get_date_indices(date_1, smir_1, swir_1, nir_1, no_data, scale_factor)
+        strips = self._get_strips(np.shape(smir_0))
+        if strips is None:
+            return calc_geo_cbi_from_indices(smir_0, swir_0, smir_1, swir_1, nir_0, nir_1, indices_0, indices_1,
+                                             no_data, scene_statistics)
+        if scene_statistics is None:
+            scene_statistics = self._calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, no_data,
+                                                           scale_factor)
+        geo_cbi = None
+        for start, end in strips:
+            strip_indices_0 = {name: indices_0[name][start:end] for name in indices_0}
+            strip_indices_1 = {name: indices_1[name][start:end] for name in indices_1}
+            strip_geo_cbi = calc_geo_cbi_from_indices(smir_0[start:end], swir_0[start:end], smir_1[start:end],
+                                                      swir_1[start:end], nir_0[start:end], nir_1[start:end],
+                                                      strip_indices_0, strip_indices_1, no_data, scene_statistics)
+            if geo_cbi is None:
+                geo_cbi = self._scratch_space.empty(np.shape(smir_0), strip_geo_cbi.dtype)
+            geo_cbi[start:end] = strip_geo_cbi
+        return geo_cbi
+
     @classmethod
     def get_num_time_steps(cls) -> int:
         return 2
 
     @classmethod
     def get_names_of_supported_eo_data_types(cls) -> List[str]:
+        # the observations are imported here, as importing them requires gdal
+        from multiply_core.observations import DataTypeConstants, SENTINEL_2_MODEL_DATA_TYPE
         return [SENTINEL_2_MODEL_DATA_TYPE, DataTypeConstants.AWS_S2_L2, DataTypeConstants.S2_L2]
 
     @classmethod
@@ -121,93 +373,82 @@ class BurnedSeverityPostProcessor(EODataPostProcessor):
 
     @staticmethod
     def _get_data_dict(data_type: str) -> Optional[dict]:
-        if data_type in _DATA_DICTS:
-            return _DATA_DICTS[data_type]
+        from multiply_core.observations import DataTypeConstants
+        if data_type in [DataTypeConstants.AWS_S2_L2, DataTypeConstants.S2_L2]:
+            return _SENTINEL_2_DICT
 
-    def process_observations(self, observations: ObservationsWrapper) -> dict:
+    def _get_pair_data_dict(self, observations: 'ObservationsWrapper') -> Optional[dict]:
         # If we do not have exactly two observations of the same data type wrapped we'll exit.
         if len(observations.dates) != 2:
             logging.info("Not exactly two observations provided. Exiting.")
-            return [np.array([], dtype=np.float64)]
+            return None
         data_type = observations.get_data_type(observations.dates[0])
         other_data_type = observations.get_data_type(observations.dates[1])
         if data_type != other_data_type:
             logging.warning('Found types of different data. Cannot determine burned severity. Exiting.')
-            return [np.array([], dtype=np.float64)]
-        data_dict = self._get_data_dict(data_type)
+            return None
+        return self._get_data_dict(data_type)
+
+    def _get_band(self, observations: 'ObservationsWrapper', date: str, band_name: str, data_dict: dict) -> np.array:
+        no_data = data_dict['no_data']
+        scale_factor = data_dict['scale_factor']
+        observations.set_no_data_value(date, band_name, no_data * scale_factor)
+        band = observations.get_band_data_by_name(date, band_name, False).observations
+        band /= scale_factor
+        int_band = self._scratch_space.empty(np.shape(band), np.int)
+        # assignment casts the same way as astype
+        int_band[...] = band
+        return int_band
+
+    def collect_scene_statistics(self, observations: 'ObservationsWrapper') -> Optional[dict]:
+        data_dict = self._get_pair_data_dict(observations)
+        if data_dict is None:
+            return None
         no_data = data_dict['no_data']
         scale_factor = data_dict['scale_factor']
-        observations.set_no_data_value(observations.dates[0], data_dict['smir'], no_data * scale_factor)
-        observations.set_no_data_value(observations.dates[0], data_dict['swir'], no_data * scale_factor)
-        observations.set_no_data_value(observations.dates[1], data_dict['smir'], no_data * scale_factor)
-        observations.set_no_data_value(observations.dates[1], data_dict['swir'], no_data * scale_factor)
-        smir_0 = observations.get_band_data_by_name(observations.dates[0], data_dict['smir'], False).observations
-        swir_0 = observations.get_band_data_by_name(observations.dates[0], data_dict['swir'], False).observations
-        smir_1 = observations.get_band_data_by_name(observations.dates[1], data_dict['smir'], False).observations
-        swir_1 = observations.get_band_data_by_name(observations.dates[1], data_dict['swir'], False).observations
-        smir_0 /= scale_factor
-        smir_1 /= scale_factor
-        swir_0 /= scale_factor
-        swir_1 /= scale_factor
-        smir_0 = smir_0.astype(np.int)
-        smir_1 = smir_1.astype(np.int)
-        swir_0 = swir_0.astype(np.int)
-        swir_1 = swir_1.astype(np.int)
-        logging.info('Calculating SWIR/SMIR Mask')
-        swir_mask = (swir_1 != no_data) * (swir_0 != no_data)
-        smir_mask = (smir_1 != no_data) * (smir_0 != no_data)
-        s_mask = swir_mask * smir_mask
-        logging.info('Calculating MIRBI')
-        mirbi_1 = calc_mirbi(smir_1, swir_1, s_mask, no_data, scale_factor)
-        mean_mirbi_1 = mask_values(mirbi_1, no_data)
-        mirbi_0 = calc_mirbi(smir_0, swir_0, s_mask, no_data, scale_factor)
-        logging.info('Calculating difMIRBI')
-        diff_mirbi = mirbi_1 - mirbi_0
-        diff_mirbi *= s_mask + no_data * np.invert(s_mask)
-        logging.info('Calculating NBR2')
-        nbr2_1 = calc_nbr2(smir_1, swir_1, s_mask, no_data, scale_factor)
-        mean_nbr2_1 = mask_values(nbr2_1, no_data)
-        nbr2_0 = calc_nbr2(smir_0, swir_0, s_mask, no_data, scale_factor)
-        logging.info('Calculating difNBR2')
-        diff_nbr2 = nbr2_1 - nbr2_0
-        diff_nbr2 = diff_nbr2 * s_mask + no_data * np.invert(s_mask)
-        observations.set_no_data_value(observations.dates[0], data_dict['nir'], no_data * scale_factor)
-        observations.set_no_data_value(observations.dates[1], data_dict['nir'], no_data * scale_factor)
-        nir_0 = observations.get_band_data_by_name(observations.dates[0], data_dict['nir'], False).observations
-        nir_1 = observations.get_band_data_by_name(observations.dates[1], data_dict['nir'], False).observations
-        nir_0 /= scale_factor
-        nir_1 /= scale_factor
-        nir_0 = nir_0.astype(np.int)
-        nir_1 = nir_1.astype(np.int)
-        logging.info('Calculating NIR Mask')
-        nir_mask = (nir_1 != no_data) * (nir_0 != no_data)
-        logging.info('Calculating NIR')
-        mean_nir_1 = mask_values(nir_1, no_data)
-        logging.info('Calculating difNIR')
-        diff_nir = nir_1 - nir_0
-        diff_nir = diff_nir * nir_mask + no_data * np.invert(nir_mask)
-
-        logging.info('Calculating Burned Mask')
-        mean_mirbi_mask = mirbi_1 > mean_mirbi_1
-        diff_mirbi_mask = diff_mirbi > 0.25
-        mean_nbr2_1_mask = nbr2_1 < mean_nbr2_1
-        diff_nbr2_mask = diff_nbr2 < -0.05
-        mean_nir_1_mask = nir_1 < mean_nir_1
-        diff_nir_mask = diff_nir < -0.01
-        burned_mask = s_mask * nir_mask * mean_mirbi_mask * diff_mirbi_mask * mean_nbr2_1_mask * diff_nbr2_mask * \
-                      mean_nir_1_mask * diff_nir_mask
-        logging.info('Calculating NBR')
-        nbr_1 = calc_nbr(swir_1, nir_1, burned_mask, no_data, scale_factor)
-        nbr_0 = calc_nbr(swir_0, nir_0, burned_mask, no_data, scale_factor)
-        logging.info('Calculating difNBR')
-        diff_nbr = (nbr_0 - nbr_1) * burned_mask + no_data * np.invert(burned_mask)
-        logging.info('Calculating RBR')
-        rbr = diff_nbr / (nbr_0 + 1.001)
-        rbr = rbr * burned_mask + no_data * np.invert(burned_mask)
-        geo_cbi = rbr
-        geo_cbi[geo_cbi != no_data] *= 2.80278
-        geo_cbi[geo_cbi != no_data] += 1.07541
-        geo_cbi[geo_cbi > 3.0] = 3.0
+        smir_0 = self._get_band(observations, observations.dates[0], data_dict['smir'], data_dict)
+        swir_0 = self._get_band(observations, observations.dates[0], data_dict['swir'], data_dict)
+        smir_1 = self._get_band(observations, observations.dates[1], data_dict['smir'], data_dict)
+        swir_1 = self._get_band(observations, observations.dates[1], data_dict['swir'], data_dict)
+        nir_1 = self._get_band(observations, observations.dates[1], data_dict['nir'], data_dict)
+        return self._calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, no_data, scale_factor)
+
+    def process_observations(self, observations: 'ObservationsWrapper', scene_statistics: Optional[dict] = None) \
+            -> dict:
+        data_dict = self._get_pair_data_dict(observations)
+        if data_dict is None:
+            return {}
+        date_data = [self.read_date(observations, date) for date in observations.dates]
+        return self.process_date_data(date_data, scene_statistics)
+
+    def supports_reading_dates(self) -> bool:
+        return True
+
+    def read_date(self, observations: 'ObservationsWrapper', date: str) -> dict:
+        data_type = observations.get_data_type(date)
+        date_data = {_DATA_TYPE: data_type, _DATE: date}
+        data_dict = self._get_data_dict(data_type)
+        if data_dict is None:
+            return date_data
+        for band in ['smir', 'swir', 'nir']:
+            date_data[band] = self._get_cached(date, data_dict[band], self._get_band, observations, date,
+                                               data_dict[band], data_dict)
+        return date_data
+
+    def process_date_data(self, date_data: List[dict], scene_statistics: Optional[dict] = None) -> dict:
+        if len(date_data) != 2:
+            logging.info("Not exactly two observations provided. Exiting.")
+            return {}
+        if date_data[0][_DATA_TYPE] != date_data[1][_DATA_TYPE]:
+            logging.warning('Found types of different data. Cannot determine burned severity. Exiting.')
+            return {}
+        data_dict = self._get_data_dict(date_data[0][_DATA_TYPE])
+        if data_dict is None:
+            return {}
+        geo_cbi = self._calc_geo_cbi(date_data[0]['smir'], date_data[0]['swir'], date_data[1]['smir'],
+                                     date_data[1]['swir'], date_data[0]['nir'], date_data[1]['nir'],
+                                     data_dict['no_data'], data_dict['scale_factor'], scene_statistics,
+                                     date_data[0].get(_DATE), date_data[1].get(_DATE))
         results = {'geocbi': geo_cbi}
         return results
 
@@ -232,6 +473,7 @@ class BurnedSeverityPostProcessorCreator(PostProcessorCreator):
 
     @classmethod
     def get_required_input_data_types(cls) -> List[str]:
+        from multiply_core.observations import SENTINEL_2_MODEL_DATA_TYPE
         return [SENTINEL_2_MODEL_DATA_TYPE]
 
     @classmethod
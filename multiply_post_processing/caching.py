@@ -0,0 +1,156 @@
+import copy
+import numpy as np
+import threading
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from multiply_post_processing.prefetching import _get_size
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+
+class DateCache(object):
+    """
+    Holds data per date and name, e.g., bands and indices derived from them. When observations are processed in pairs
+    of consecutive dates, each inner date is part of two pairs, so its data needs to be read and derived only once.
+    Data is evicted date by date: When data of more than max_dates dates is held, or, if max_bytes is given, the
+    held data exceeds it, all data of the least recently used date is evicted. The data of the most recently used date
+    is never evicted. The cache may be used from several threads. When a cache is passed to another process, e.g.,
+    along with a post processor, it arrives empty.
+    """
+
+    def __init__(self, max_dates: int = 2, max_bytes: Optional[int] = None):
+        if max_dates < 1:
+            raise ValueError('Cache must hold at least 1 date, but max_dates is {}.'.format(max_dates))
+        self._max_dates = max_dates
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # neither the lock nor the held data are passed on
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_entries'] = OrderedDict()
+        state['_num_bytes'] = 0
+        state['_hits'] = 0
+        state['_misses'] = 0
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, date: Hashable, name: str, function: Callable, *args) -> Any:
+        """
+        Returns the data of the date with the given name. If it is not held, it is derived by calling the function
+        with the args and put into the cache.
+        """
+        with self._lock:
+            if date in self._entries and name in self._entries[date]:
+                self._entries.move_to_end(date)
+                self._hits += 1
+                return self._entries[date][name]
+            self._misses += 1
+        # data is derived outside the lock, so other threads are not blocked meanwhile
+        value = function(*args)
+        with self._lock:
+            if date not in self._entries:
+                self._entries[date] = {}
+            if name not in self._entries[date]:
+                self._entries[date][name] = value
+                self._num_bytes += _get_size(value)
+            value = self._entries[date][name]
+            self._entries.move_to_end(date)
+            self._evict()
+            return value
+
+    def _evict(self):
+        while len(self._entries) > 1 and (len(self._entries) > self._max_dates or
+                                          (self._max_bytes is not None and self._num_bytes > self._max_bytes)):
+            _, date_entries = self._entries.popitem(last=False)
+            self._num_bytes -= _get_size(date_entries)
+
+    def contains(self, date: Hashable, name: str) -> bool:
+        with self._lock:
+            return date in self._entries and name in self._entries[date]
+
+    def evict(self, date: Hashable):
+        """
+        Evicts all data of the date.
+        """
+        with self._lock:
+            if date in self._entries:
+                self._num_bytes -= _get_size(self._entries.pop(date))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+
+    def get_num_hits(self) -> int:
+        """
+        :return: The number of times requested data was found in the cache
+        """
+        return self._hits
+
+    def get_num_misses(self) -> int:
+        """
+        :return: The number of times requested data had to be derived
+        """
+        return self._misses
+
+
+def _copy_band_data(band_data: Any) -> Any:
+    # readers may alter the arrays they get, e.g., scale them in place, so each one gets copies of them
+    if hasattr(band_data, '_replace'):
+        return band_data._replace(**{field: np.copy(value) for field, value in band_data._asdict().items()
+                                     if isinstance(value, np.ndarray)})
+    band_data = copy.copy(band_data)
+    for name, value in vars(band_data).items():
+        if isinstance(value, np.ndarray):
+            setattr(band_data, name, np.copy(value))
+    return band_data
+
+
+class SharedObservations(object):
+    """
+    Wraps observations that are read by several post processors, so that each band of a date is read and reprojected
+    only once. Bands are held in a date cache and each reader gets a copy. As the no-data value affects how a band is
+    read, bands are cached per no-data value. All other attributes are those of the wrapped observations.
+    """
+
+    def __init__(self, observations: Any, date_cache: DateCache, lock: Optional[threading.Lock] = None):
+        self._observations = observations
+        self._date_cache = date_cache
+        self._no_data_values = {}
+        self._lock = threading.Lock() if lock is None else lock
+
+    def set_date_cache(self, date_cache: DateCache):
+        self._date_cache = date_cache
+
+    def set_no_data_value(self, date: Hashable, band_name: str, no_data_value: float):
+        self._no_data_values[(date, band_name)] = no_data_value
+
+    def _read_band(self, date: Hashable, band_name: str, retrieve_uncertainty: bool) -> Any:
+        with self._lock:
+            if (date, band_name) in self._no_data_values:
+                self._observations.set_no_data_value(date, band_name, self._no_data_values[(date, band_name)])
+            return self._observations.get_band_data_by_name(date, band_name, retrieve_uncertainty)
+
+    def get_band_data_by_name(self, date: Hashable, band_name: str, retrieve_uncertainty: bool = True) -> Any:
+        no_data_value = self._no_data_values.get((date, band_name))
+        name = '{}_{}_{}'.format(band_name, no_data_value, retrieve_uncertainty)
+        band_data = self._date_cache.get(date, name, self._read_band, date, band_name, retrieve_uncertainty)
+        return _copy_band_data(band_data)
+
+    def get_observations_subset(self, start: Hashable, end: Hashable) -> 'SharedObservations':
+        return SharedObservations(self._observations.get_observations_subset(start, end), self._date_cache,
+                                  self._lock)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._observations, name)
@@ -1,13 +1,22 @@
 import click
 
 from multiply_post_processing.version import __version__
-from multiply_post_processing import get_available_indicators, get_post_processor_description, get_post_processor_names, \
-    run_post_processor, run_post_processing
-from typing import List
+from multiply_post_processing import get_available_indicators, get_post_processor_description, get_post_processor_names
+from typing import List, Tuple
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
 
+def _get_parameters(parameters: Tuple[str]) -> dict:
+    parameter_dict = {}
+    for parameter in parameters:
+        if '=' not in parameter:
+            raise click.BadParameter(f"Parameter '{parameter}' is not of the form <name=value>.")
+        name, value = parameter.split('=', 1)
+        parameter_dict[name.strip()] = value.strip()
+    return parameter_dict
+
+
 # noinspection PyShadowingBuiltins
 @click.command(name="run_processor")
 @click.argument('post_processor', metavar='<post_processor>')
@@ -27,15 +36,65 @@ __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 @click.option("-dg", "--destination_grid", metavar='<destination_grid>',
               help="A representation of the spatial reference system in which the output shall be given, either as "
                    "EPSG-code or as WKT representation. If not given, it is tried to derive this from <roi_grid>.")
+@click.option("-f", "--output_format", metavar='<output_format>', default='GeoTiff',
+              help="The format of the output files, either 'GeoTiff', 'COG' for Cloud-Optimized GeoTiffs with "
+                   "internal tiles, compression and overviews, or 'NetCDF' for a single datacube per post processor "
+                   "to which all dates are appended. Default is 'GeoTiff'.")
+@click.option("-c", "--compression", metavar='<compression>', default='DEFLATE',
+              help="The compression of COG output, one of 'DEFLATE', 'ZSTD', 'LZW' or 'NONE'. Default is 'DEFLATE'.")
+@click.option("-sd", "--scratch_directory", metavar='<scratch_directory>',
+              help="The directory in which memory-mapped scratch files are created. Defaults to the system's "
+                   "temporary directory.")
+@click.option("-st", "--scratch_threshold", metavar='<scratch_threshold>',
+              help="If given, large intermediate and output arrays of more than <scratch_threshold> MB are kept in "
+                   "memory-mapped files in the scratch directory instead of in memory.")
+@click.option("-ts", "--tile_size", metavar='<tile_size>',
+              help="If given, EO data post processors process the destination grid in tiles of at most "
+                   "<tile_size> x <tile_size> pixels. Use this to limit the memory consumption on large scenes.")
+@click.option("-p", "--parameter", "parameters", metavar='<name=value>', multiple=True,
+              help="A parameter to configure the post processing, e.g., 'backend=numba'. May be given multiple times.")
+@click.option("-w", "--workers", metavar='<workers>', default='1',
+              help="The number of processes among which the date pairs of EO data post processors are distributed. "
+                   "Default is 1.")
+@click.option("-pd", "--prefetch_depth", metavar='<prefetch_depth>', default='1',
+              help="The number of upcoming dates EO data post processors read in the background while processing the "
+                   "current date pair. 0 disables reading ahead. Default is 1.")
+@click.option("-pm", "--prefetch_memory", metavar='<prefetch_memory>',
+              help="If given, the dates read ahead may occupy at most about <prefetch_memory> MB.")
+@click.option("-wt", "--write_threads", metavar='<write_threads>', default='1',
+              help="The number of threads that write results in the background while processing continues. 0 writes "
+                   "results before processing continues. Default is 1.")
+@click.option("-inc", "--incremental", is_flag=True,
+              help="Keeps a manifest in the output directory and skips dates whose results are present and whose "
+                   "inputs and parameters have not changed. Use this to update outputs after new data has been added "
+                   "or to resume a run that has been stopped.")
 def run_processor(post_processor: str, input_path: str, output_path: str = None, roi: str = None,
-                  spatial_resolution: str = None, roi_grid: str = None, destination_grid: str = None):
+                  spatial_resolution: str = None, roi_grid: str = None, destination_grid: str = None,
+                  tile_size: str = None, parameters: Tuple[str] = (), workers: str = '1', prefetch_depth: str = '1',
+                  prefetch_memory: str = None, write_threads: str = '1', output_format: str = 'GeoTiff',
+                  compression: str = 'DEFLATE', scratch_directory: str = None, scratch_threshold: str = None,
+                  incremental: bool = False):
     """
     Runs post processor <post_processor> on data located at <input_path>.
     """
     if output_path is None:
         output_path = input_path
     spatial_resolution = int(spatial_resolution)
-    run_post_processor(post_processor, input_path, output_path, roi, spatial_resolution, roi_grid, destination_grid)
+    if tile_size is not None:
+        tile_size = int(tile_size)
+    if prefetch_memory is not None:
+        prefetch_memory = int(prefetch_memory)
+    if scratch_threshold is not None:
+        scratch_threshold = int(scratch_threshold)
+    # imported here, as the post processing requires gdal and listing post processors shall start quickly
+    from multiply_post_processing import run_post_processor
+    run_post_processor(post_processor, input_path, output_path, roi, spatial_resolution, roi_grid=roi_grid,
+                       destination_grid=destination_grid, tile_size=tile_size,
+                       parameters=_get_parameters(parameters), workers=int(workers),
+                       prefetch_depth=int(prefetch_depth), prefetch_memory=prefetch_memory,
+                       write_threads=int(write_threads), output_format=output_format, compression=compression,
+                       scratch_directory=scratch_directory, scratch_threshold=scratch_threshold,
+                       incremental=incremental)
 
 
 # noinspection PyShadowingBuiltins
@@ -57,16 +116,64 @@ def run_processor(post_processor: str, input_path: str, output_path: str = None,
 @click.option("-dg", "--destination_grid", metavar='<destination_grid>',
               help="A representation of the spatial reference system in which the output shall be given, either as "
                    "EPSG-code or as WKT representation. If not given, it is tried to derive this from <roi_grid>.")
+@click.option("-f", "--output_format", metavar='<output_format>', default='GeoTiff',
+              help="The format of the output files, either 'GeoTiff', 'COG' for Cloud-Optimized GeoTiffs with "
+                   "internal tiles, compression and overviews, or 'NetCDF' for a single datacube per post processor "
+                   "to which all dates are appended. Default is 'GeoTiff'.")
+@click.option("-c", "--compression", metavar='<compression>', default='DEFLATE',
+              help="The compression of COG output, one of 'DEFLATE', 'ZSTD', 'LZW' or 'NONE'. Default is 'DEFLATE'.")
+@click.option("-sd", "--scratch_directory", metavar='<scratch_directory>',
+              help="The directory in which memory-mapped scratch files are created. Defaults to the system's "
+                   "temporary directory.")
+@click.option("-st", "--scratch_threshold", metavar='<scratch_threshold>',
+              help="If given, large intermediate and output arrays of more than <scratch_threshold> MB are kept in "
+                   "memory-mapped files in the scratch directory instead of in memory.")
+@click.option("-ts", "--tile_size", metavar='<tile_size>',
+              help="If given, EO data post processors process the destination grid in tiles of at most "
+                   "<tile_size> x <tile_size> pixels. Use this to limit the memory consumption on large scenes.")
+@click.option("-p", "--parameter", "parameters", metavar='<name=value>', multiple=True,
+              help="A parameter to configure the post processing, e.g., 'backend=numba'. May be given multiple times.")
+@click.option("-w", "--workers", metavar='<workers>', default='1',
+              help="The number of processes among which the date pairs of EO data post processors are distributed. "
+                   "Default is 1.")
+@click.option("-pd", "--prefetch_depth", metavar='<prefetch_depth>', default='1',
+              help="The number of upcoming dates EO data post processors read in the background while processing the "
+                   "current date pair. 0 disables reading ahead. Default is 1.")
+@click.option("-pm", "--prefetch_memory", metavar='<prefetch_memory>',
+              help="If given, the dates read ahead may occupy at most about <prefetch_memory> MB.")
+@click.option("-wt", "--write_threads", metavar='<write_threads>', default='1',
+              help="The number of threads that write results in the background while processing continues. 0 writes "
+                   "results before processing continues. Default is 1.")
+@click.option("-inc", "--incremental", is_flag=True,
+              help="Keeps a manifest in the output directory and skips dates whose results are present and whose "
+                   "inputs and parameters have not changed. Use this to update outputs after new data has been added "
+                   "or to resume a run that has been stopped.")
 def process_indicators(indicator_names: List[str], input_path: str, output_path: str = None, roi: str = None,
-                       spatial_resolution: int = None, roi_grid: str = None, destination_grid: str = None):
+                       spatial_resolution: int = None, roi_grid: str = None, destination_grid: str = None,
+                       tile_size: str = None, parameters: Tuple[str] = (), workers: str = '1',
+                       prefetch_depth: str = '1', prefetch_memory: str = None, write_threads: str = '1',
+                       output_format: str = 'GeoTiff', compression: str = 'DEFLATE', scratch_directory: str = None,
+                       scratch_threshold: str = None, incremental: bool = False):
     """
     Retrieves indicators <indicator_names> on data located at <input_path>.
     """
-    print(type(indicators))
     if output_path is None:
         output_path = input_path
     spatial_resolution = int(spatial_resolution)
-    run_post_processing(indicator_names, input_path, output_path, roi, spatial_resolution, roi_grid, destination_grid)
+    if tile_size is not None:
+        tile_size = int(tile_size)
+    if prefetch_memory is not None:
+        prefetch_memory = int(prefetch_memory)
+    if scratch_threshold is not None:
+        scratch_threshold = int(scratch_threshold)
+    from multiply_post_processing import run_post_processing
+    run_post_processing(indicator_names.split(','), input_path, output_path, roi, spatial_resolution,
+                        roi_grid=roi_grid, destination_grid=destination_grid, tile_size=tile_size,
+                        parameters=_get_parameters(parameters), workers=int(workers),
+                        prefetch_depth=int(prefetch_depth), prefetch_memory=prefetch_memory,
+                        write_threads=int(write_threads), output_format=output_format, compression=compression,
+                        scratch_directory=scratch_directory, scratch_threshold=scratch_threshold,
+                        incremental=incremental)
 
 
 # noinspection PyShadowingBuiltins
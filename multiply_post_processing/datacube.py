@@ -0,0 +1,218 @@
+"""
+Reads and writes time series of variables and indicators as datacubes in NetCDF4. Requires the netCDF4 package.
+"""
+import numpy as np
+import os
+import threading
+
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import netCDF4
+    NETCDF4_AVAILABLE = True
+except ImportError:
+    NETCDF4_AVAILABLE = False
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+_TIME_UNITS = 'days since 1970-01-01 00:00:00'
+_EPOCH = datetime(1970, 1, 1)
+_TIME_CHUNK_SIZE = 16
+_SPATIAL_CHUNK_SIZE = 128
+_MAX_CHUNK_CACHE_SIZE = 512 * 1024 * 1024
+
+
+def _to_days(time: datetime) -> float:
+    return (time - _EPOCH).total_seconds() / 86400.
+
+
+class DataCubeWriter(object):
+    """
+    Appends time steps of indicators to a single NetCDF4 datacube with the dimensions time, y and x. Each indicator
+    becomes a variable of the cube. Variables are compressed and chunked for time series access: A chunk spans several
+    time steps, but only a part of the grid. Time steps are appended one by one, so the cube grows while dates are
+    processed and no more than one time step needs to be held in memory. The chunks of the current time steps are kept
+    in the chunk cache until they are complete, so they are compressed only once.
+    """
+
+    def __init__(self, file_name: str, geo_transform: tuple, projection: str, width: int, height: int,
+                 time_chunk_size: int = _TIME_CHUNK_SIZE, spatial_chunk_size: int = _SPATIAL_CHUNK_SIZE,
+                 compression_level: int = 4):
+        if not NETCDF4_AVAILABLE:
+            raise ImportError('Writing datacubes requires the netCDF4 package.')
+        directory = os.path.dirname(file_name)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._width = width
+        self._height = height
+        self._chunk_sizes = (time_chunk_size, min(spatial_chunk_size, height), min(spatial_chunk_size, width))
+        self._compression_level = compression_level
+        self._lock = threading.Lock()
+        self._data_set = netCDF4.Dataset(file_name, 'w', format='NETCDF4')
+        self._data_set.Conventions = 'CF-1.7'
+        self._data_set.createDimension('time', None)
+        self._data_set.createDimension('y', height)
+        self._data_set.createDimension('x', width)
+        self._data_set.createDimension('bounds', 2)
+        time = self._data_set.createVariable('time', np.float64, ('time',))
+        time.units = _TIME_UNITS
+        time.calendar = 'standard'
+        time.bounds = 'time_bounds'
+        self._data_set.createVariable('time_bounds', np.float64, ('time', 'bounds'))
+        x = self._data_set.createVariable('x', np.float64, ('x',))
+        x.standard_name = 'projection_x_coordinate'
+        x[:] = geo_transform[0] + (np.arange(width) + 0.5) * geo_transform[1]
+        y = self._data_set.createVariable('y', np.float64, ('y',))
+        y.standard_name = 'projection_y_coordinate'
+        y[:] = geo_transform[3] + (np.arange(height) + 0.5) * geo_transform[5]
+        crs = self._data_set.createVariable('crs', np.int32)
+        crs.spatial_ref = projection
+        crs.crs_wkt = projection
+        crs.GeoTransform = ' '.join([str(value) for value in geo_transform])
+
+    def _get_variable(self, name: str, data_type: np.dtype):
+        if name in self._data_set.variables:
+            return self._data_set.variables[name]
+        if np.dtype(data_type) == np.bool_:
+            data_type = np.uint8
+        variable = self._data_set.createVariable(name, data_type, ('time', 'y', 'x'), zlib=True,
+                                                 complevel=self._compression_level, shuffle=True,
+                                                 chunksizes=self._chunk_sizes)
+        variable.grid_mapping = 'crs'
+        chunk_size = self._chunk_sizes[0] * self._chunk_sizes[1] * self._chunk_sizes[2] * np.dtype(data_type).itemsize
+        num_chunks = int(np.ceil(self._height / self._chunk_sizes[1]) * np.ceil(self._width / self._chunk_sizes[2]))
+        variable.set_var_chunk_cache(size=min(chunk_size * num_chunks, _MAX_CHUNK_CACHE_SIZE),
+                                     nelems=max(2 * num_chunks + 1, 521))
+        return variable
+
+    def append(self, time: datetime, indicators: dict, time_bounds: Optional[Tuple[datetime, datetime]] = None):
+        """
+        Appends a time step.
+        :param time: The time of the time step
+        :param indicators: A dictionary of indicator names and arrays covering the grid of the cube
+        :param time_bounds: The start and end time of the period the time step refers to. If not given, both are the
+        time of the time step.
+        """
+        if time_bounds is None:
+            time_bounds = (time, time)
+        with self._lock:
+            time_variable = self._data_set.variables['time']
+            index = len(time_variable)
+            time_variable[index] = _to_days(time)
+            self._data_set.variables['time_bounds'][index, :] = [_to_days(time_bounds[0]),
+                                                                _to_days(time_bounds[1])]
+            for indicator_name in indicators:
+                data = np.asarray(indicators[indicator_name])
+                if data.shape != (self._height, self._width):
+                    raise ValueError(f'Indicator {indicator_name} has shape {data.shape}, but the datacube requires '
+                                     f'{(self._height, self._width)}.')
+                self._get_variable(indicator_name, data.dtype)[index, :, :] = data
+
+    def close(self):
+        with self._lock:
+            if self._data_set is not None:
+                self._data_set.close()
+                self._data_set = None
+
+
+class DataCubeReader(object):
+    """
+    Reads variables from a NetCDF4 datacube with the dimensions time, y and x, e.g., the stacks of biophysical
+    parameters produced by the inference engine. Data is read lazily, one time step at a time, so only the chunks
+    intersecting the requested time step and window are read and decompressed. Arrays are returned north up, with the
+    first row being the northernmost one.
+    """
+
+    def __init__(self, file_name: str, variable_names: List[str]):
+        if not NETCDF4_AVAILABLE:
+            raise ImportError('Reading datacubes requires the netCDF4 package.')
+        self._data_set = netCDF4.Dataset(file_name, 'r')
+        self._data_set.set_auto_mask(False)
+        self._variables = {}
+        for variable_name in variable_names:
+            if variable_name not in self._data_set.variables:
+                self.close()
+                raise ValueError(f'Datacube {file_name} does not contain variable {variable_name}.')
+            variable = self._data_set.variables[variable_name]
+            if len(variable.dimensions) != 3:
+                self.close()
+                raise ValueError(f'Variable {variable_name} of datacube {file_name} must have the dimensions time, y '
+                                 f'and x, but has {variable.dimensions}.')
+            self._variables[variable_name] = variable
+        reference_variable = self._data_set.variables[variable_names[0]]
+        time_dimension, y_dimension, x_dimension = reference_variable.dimensions
+        self._height = len(self._data_set.dimensions[y_dimension])
+        self._width = len(self._data_set.dimensions[x_dimension])
+        x = self._data_set.variables[x_dimension][:]
+        y = self._data_set.variables[y_dimension][:]
+        self._flip_y = self._height > 1 and y[1] > y[0]
+        x_resolution = (x[-1] - x[0]) / (self._width - 1) if self._width > 1 else 1.
+        y_resolution = abs(y[-1] - y[0]) / (self._height - 1) if self._height > 1 else 1.
+        self._geo_transform = (float(x[0] - x_resolution / 2), float(x_resolution), 0.,
+                               float(max(y[0], y[-1]) + y_resolution / 2), 0., -float(y_resolution))
+        self._projection = None
+        if 'grid_mapping' in reference_variable.ncattrs():
+            grid_mapping = self._data_set.variables[reference_variable.grid_mapping]
+            for attribute in ['crs_wkt', 'spatial_ref']:
+                if attribute in grid_mapping.ncattrs():
+                    self._projection = grid_mapping.getncattr(attribute)
+                    break
+        time = self._data_set.variables[time_dimension]
+        calendar = time.calendar if 'calendar' in time.ncattrs() else 'standard'
+        self._dates = list(netCDF4.num2date(time[:], time.units, calendar, only_use_cftime_datetimes=False,
+                                            only_use_python_datetimes=True))
+
+    def get_dates(self) -> List[datetime]:
+        return self._dates
+
+    def get_geo_transform(self) -> tuple:
+        return self._geo_transform
+
+    def get_projection(self) -> Optional[str]:
+        """
+        :return: The projection of the datacube in WKT representation, or None if the datacube does not provide one
+        """
+        return self._projection
+
+    def get_width(self) -> int:
+        return self._width
+
+    def get_height(self) -> int:
+        return self._height
+
+    def read(self, index: int, window: Optional[Tuple[int, int, int, int]] = None) -> dict:
+        """
+        Reads all variables of a time step.
+        :param index: The index of the time step
+        :param window: The x offset, y offset, width and height of the window to be read, in north up pixel
+        coordinates. If not given, the full extent is read.
+        :return: A dictionary of variable names and arrays
+        """
+        if window is None:
+            window = (0, 0, self._width, self._height)
+        x_offset, y_offset, width, height = window
+        if self._flip_y:
+            y_offset = self._height - y_offset - height
+        variable_data = {}
+        for variable_name in self._variables:
+            data = self._variables[variable_name][index, y_offset:y_offset + height, x_offset:x_offset + width]
+            if self._flip_y:
+                data = np.ascontiguousarray(data[::-1])
+            variable_data[variable_name] = data
+        return variable_data
+
+    def __iter__(self) -> Iterator[Tuple[datetime, dict]]:
+        for index, date in enumerate(self._dates):
+            yield date, self.read(index)
+
+    def close(self):
+        if self._data_set is not None:
+            self._data_set.close()
+            self._data_set = None
+
+    def __enter__(self) -> 'DataCubeReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
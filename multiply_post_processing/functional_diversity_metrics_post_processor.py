@@ -1,17 +1,17 @@
 import logging
+import math
+import multiprocessing
 from abc import ABCMeta, abstractmethod
 
 from multiply_post_processing import PostProcessorCreator, PostProcessor, VariablePostProcessor, PostProcessorType
 from multiply_post_processing.indicators import get_indicator
+from multiply_post_processing.scratch import ScratchSpace
 from multiply_core.variables import Variable
 import numpy as np
-from scipy.sparse.csgraph import minimum_spanning_tree
-from scipy import stats
-from scipy import spatial
-from scipy.spatial.distance import squareform, pdist
-from sklearn.neighbors import NearestNeighbors
-import sklearn.preprocessing as sk
-from typing import List
+from typing import List, Optional, Tuple
+
+# scipy and sklearn are imported where they are used, as importing them takes long and is not needed to describe the
+# post processor
 
 __author__ = "L.T.Hauser (University Leiden, NL), Tonio Fincke (Brockmann Consult GmbH)"
 
@@ -29,6 +29,14 @@ _INDICATOR_DESCRIPTIONS = [get_indicator(_CVH_NAME), get_indicator(_MNND_NAME),
                            get_indicator(_FE_NAME), get_indicator(_F_DIV_NAME)]
 _NO_DATA_VALUE = np.NaN
 _VALID_THRESHOLD = 95
+_PLOT_SIZE = 10
+_BANDS_PER_WORKER = 4
+_PLOT_CHUNK_SIZE = 128
+_OUTLIER_PERCENTILES = [5, 4, 3, 2, 1, 0]
+_WORKERS = 'workers'
+_PLOT_SIZE_PARAMETER = 'plot_size'
+_STRIDE = 'stride'
+_OVERLAP = 'overlap'
 
 
 def _pre_process(variables:  dict) -> dict:
@@ -42,6 +50,7 @@ def _pre_process_trait(trait: np.array) -> np.array:
     """
     Assign No-Data-Value and standardize
     """
+    import sklearn.preprocessing as sk
     trait[trait == 0] = _NO_DATA_VALUE
     reshaped_trait = trait.reshape(-1, 1)
     scale_all = sk.StandardScaler()
@@ -49,19 +58,60 @@ def _pre_process_trait(trait: np.array) -> np.array:
     return transformed_reshaped_trait.reshape(trait.shape)
 
 
+class PlotContext(object):
+    """
+    Holds the traits of a plot along with intermediate results that are required by several functions, so that these
+    are derived only once per plot.
+    """
+
+    def __init__(self, traits: np.array):
+        self._traits = traits
+        self._hull = None
+        self._hull_derived = False
+
+    def get_traits(self) -> np.array:
+        return self._traits
+
+    def get_hull(self) -> Optional['scipy.spatial.ConvexHull']:
+        """
+        :return: The convex hull of the traits or None, if it cannot be derived
+        """
+        if not self._hull_derived:
+            from scipy import spatial
+            self._hull_derived = True
+            try:
+                self._hull = spatial.ConvexHull(self._traits)
+            except:
+                self._hull = None
+        return self._hull
+
+
 class FunctionalDiversityMetricsFunction(metaclass=ABCMeta):
 
-    def __init__(self, rows: int, cols: int, x_offset: int, y_offset: int):
-        self._array = np.full((rows, cols), _NO_DATA_VALUE, dtype=np.float, order='C')
+    def __init__(self, rows: int, cols: int, x_offset: int, y_offset: int, x_size: Optional[int] = None,
+                 y_size: Optional[int] = None, scratch_space: Optional[ScratchSpace] = None):
+        """
+        :param x_offset: The number of rows that a value is set to before the row of a plot
+        :param y_offset: The number of columns that a value is set to before the column of a plot
+        :param x_size: The number of rows that a value is set to. Defaults to twice the x_offset.
+        :param y_size: The number of columns that a value is set to. Defaults to twice the y_offset.
+        :param scratch_space: If given, the output array is allocated in it
+        """
+        if scratch_space is None:
+            self._array = np.full((rows, cols), _NO_DATA_VALUE, dtype=np.float, order='C')
+        else:
+            self._array = scratch_space.full((rows, cols), _NO_DATA_VALUE, dtype=np.float)
         self._x_offset = x_offset
         self._y_offset = y_offset
+        self._x_size = 2 * x_offset if x_size is None else x_size
+        self._y_size = 2 * y_offset if y_size is None else y_size
 
     def get_array(self):
         return self._array
 
     def set_value(self, row: int, column: int, value: np.float):
-        self._array[(row - self._x_offset):(row + self._x_offset),
-                    (column - self._y_offset):(column + self._y_offset)] = value
+        self._array[(row - self._x_offset):(row - self._x_offset + self._x_size),
+                    (column - self._y_offset):(column - self._y_offset + self._y_size)] = value
 
     @classmethod
     @abstractmethod
@@ -80,6 +130,23 @@ class FunctionalDiversityMetricsFunction(metaclass=ABCMeta):
         :return: A functional diversity metric
         """
 
+    def _func_with_context(self, context: PlotContext) -> np.float:
+        """
+        Computes the functional diversity metric of a plot. Functions that can make use of intermediate results
+        shared with other functions override this.
+        """
+        return self._func(context.get_traits())
+
+    def apply_function_to_plots(self, plot_contexts: List[PlotContext], rows: List[int], columns: List[int]):
+        """
+        Applies the function to several plots. Functions that can evaluate plots in a batch override this.
+        :param plot_contexts: The contexts of the plots
+        :param rows: The center row of each plot
+        :param columns: The center column of each plot
+        """
+        for context, row, column in zip(plot_contexts, rows, columns):
+            self.set_value(row, column, self._func_with_context(context))
+
 
 class CVHFunction(FunctionalDiversityMetricsFunction):
 
@@ -88,10 +155,13 @@ class CVHFunction(FunctionalDiversityMetricsFunction):
         return _CVH_NAME
 
     def _func(self, traits: np.array) -> np.float:
-        try:
-            return spatial.ConvexHull(traits).volume
-        except:
+        return self._func_with_context(PlotContext(traits))
+
+    def _func_with_context(self, context: PlotContext) -> np.float:
+        hull = context.get_hull()
+        if hull is None:
             return _NO_DATA_VALUE
+        return hull.volume
 
 
 class MNNDFunction(FunctionalDiversityMetricsFunction):
@@ -101,6 +171,8 @@ class MNNDFunction(FunctionalDiversityMetricsFunction):
         return _MNND_NAME
 
     def _func(self, traits: np.array) -> np.float:
+        import sklearn.preprocessing as sk
+        from sklearn.neighbors import NearestNeighbors
         scaler = sk.StandardScaler()
         scaler.fit(traits)
         nestd = scaler.transform(traits)
@@ -108,6 +180,69 @@ class MNNDFunction(FunctionalDiversityMetricsFunction):
         ndistances, nindices = nnbrs.kneighbors(nestd)
         return np.mean(ndistances[:, 1])
 
+    def apply_function_to_plots(self, plot_contexts: List[PlotContext], rows: List[int], columns: List[int]):
+        traits, mask = _pad_plots([context.get_traits() for context in plot_contexts])
+        values = _batched_mnnd(traits, mask)
+        for value, row, column in zip(values, rows, columns):
+            self.set_value(row, column, value)
+
+
+def _pad_plots(traits_list: List[np.array]) -> Tuple[np.array, np.array]:
+    """
+    Stacks the traits of several plots with possibly different numbers of points into one array.
+    :return: An array of shape (plots, points, traits) that is padded with zeros and a boolean mask of shape
+    (plots, points) that is True for actual points
+    """
+    num_points = max(len(traits) for traits in traits_list)
+    num_traits = traits_list[0].shape[1]
+    padded_traits = np.zeros((len(traits_list), num_points, num_traits))
+    mask = np.zeros((len(traits_list), num_points), dtype=bool)
+    for i, traits in enumerate(traits_list):
+        padded_traits[i, :len(traits)] = traits
+        mask[i, :len(traits)] = True
+    return padded_traits, mask
+
+
+def _batched_squared_distances(traits: np.array) -> np.array:
+    """
+    :param traits: Traits of shape (plots, points, traits)
+    :return: The squared euclidean distances between all points of each plot, of shape (plots, points, points)
+    """
+    squared_distances = np.zeros((traits.shape[0], traits.shape[1], traits.shape[1]))
+    for coordinates in np.ascontiguousarray(traits.transpose(2, 0, 1)):
+        differences = coordinates[:, :, np.newaxis] - coordinates[:, np.newaxis, :]
+        squared_distances += differences * differences
+    return squared_distances
+
+
+def _batched_mnnd(traits: np.array, mask: np.array) -> np.array:
+    """
+    Computes the mean nearest neighbour distance of several plots at once. Like MNNDFunction._func, each plot is
+    standardised first, with features of constant value left unscaled. Nearest neighbours are then determined from
+    all pairwise distances, which for plots of at most 100 points is much cheaper than building a tree per plot.
+    :param traits: Padded traits of shape (plots, points, traits) as returned by _pad_plots
+    :param mask: The mask of actual points of shape (plots, points)
+    :return: The mean nearest neighbour distance per plot. Plots with fewer than two points are set to no data.
+    """
+    counts = np.sum(mask, axis=1)
+    n = np.maximum(counts, 1)[:, np.newaxis, np.newaxis]
+    weights = mask[:, :, np.newaxis]
+    mean = np.sum(traits * weights, axis=1, keepdims=True) / n
+    var = np.sum(((traits - mean) * weights) ** 2, axis=1, keepdims=True) / n
+    eps = np.finfo(np.float64).eps
+    constant = var <= n * eps * var + (n * mean * eps) ** 2
+    scale = np.where(constant, 1.0, np.sqrt(var))
+    standardised = (traits - mean) / scale
+    squared_distances = _batched_squared_distances(standardised)
+    squared_distances[~(mask[:, :, np.newaxis] & mask[:, np.newaxis, :])] = np.inf
+    diagonal = np.arange(traits.shape[1])
+    squared_distances[:, diagonal, diagonal] = np.inf
+    nearest_distances = np.sqrt(np.min(squared_distances, axis=2))
+    nearest_distances[~mask] = 0.
+    mnnd = np.sum(nearest_distances, axis=1) / np.maximum(counts, 1)
+    mnnd[counts < 2] = _NO_DATA_VALUE
+    return mnnd
+
 
 class FEFunction(FunctionalDiversityMetricsFunction):
 
@@ -116,6 +251,8 @@ class FEFunction(FunctionalDiversityMetricsFunction):
         return _FE_NAME
 
     def _func(self, traits: np.array) -> np.float:
+        from scipy.sparse.csgraph import minimum_spanning_tree
+        from scipy.spatial.distance import squareform, pdist
         undgraph = squareform(pdist(traits, 'euclidean'))
         mintree = minimum_spanning_tree(undgraph)
         mstmat = mintree.toarray().astype(float)
@@ -129,6 +266,61 @@ class FEFunction(FunctionalDiversityMetricsFunction):
         PEW = (mst / np.sum(mst))
         return np.mean((np.sum(np.minimum(PEW, ss)) - ss[0]) / (1 - ss[0]))
 
+    def apply_function_to_plots(self, plot_contexts: List[PlotContext], rows: List[int], columns: List[int]):
+        traits, mask = _pad_plots([context.get_traits() for context in plot_contexts])
+        values = _batched_fe(traits, mask)
+        for value, row, column in zip(values, rows, columns):
+            self.set_value(row, column, value)
+
+
+def _batched_minimum_spanning_tree_edges(distances: np.array, mask: np.array) -> np.array:
+    """
+    Runs Prim's algorithm on a stack of dense distance matrices. Like scipy's minimum_spanning_tree, distances of zero
+    are not considered as edges, so plots with duplicate points result in a minimum spanning forest.
+    :param distances: The distances between all points of each plot, of shape (plots, points, points)
+    :param mask: The mask of actual points of shape (plots, points). Actual points must precede padded points.
+    :return: The weights of the edges of the tree of each plot, of shape (plots, points - 1). Entries that do not
+    correspond to an edge are zero.
+    """
+    num_plots, num_points = mask.shape
+    plot_indexes = np.arange(num_plots)
+    distances = np.where((distances == 0) | ~(mask[:, :, np.newaxis] & mask[:, np.newaxis, :]), np.inf, distances)
+    in_tree = ~mask
+    in_tree[:, 0] = True
+    keys = distances[:, 0, :].copy()
+    edges = np.zeros((num_plots, max(num_points - 1, 0)))
+    for step in range(num_points - 1):
+        candidate_keys = np.where(in_tree, np.inf, keys)
+        next_points = np.argmin(candidate_keys, axis=1)
+        active = ~in_tree[plot_indexes, next_points]
+        weights = candidate_keys[plot_indexes, next_points]
+        # points that cannot be reached start a new tree of the forest
+        edges[:, step] = np.where(active & np.isfinite(weights), weights, 0.)
+        in_tree[plot_indexes, next_points] |= active
+        keys = np.where(active[:, np.newaxis], np.minimum(keys, distances[plot_indexes, next_points]), keys)
+    return edges
+
+
+def _batched_fe(traits: np.array, mask: np.array) -> np.array:
+    """
+    Computes the functional evenness of several plots at once, using the formula of FEFunction._func.
+    :param traits: Padded traits of shape (plots, points, traits) as returned by _pad_plots
+    :param mask: The mask of actual points of shape (plots, points)
+    :return: The functional evenness per plot. Plots without edges are set to no data.
+    """
+    edges = _batched_minimum_spanning_tree_edges(np.sqrt(_batched_squared_distances(traits)), mask)
+    is_edge = edges > 0
+    num_edges = np.sum(is_edge, axis=1)
+    fe = np.full(len(traits), _NO_DATA_VALUE)
+    has_edges = num_edges > 0
+    edges = edges[has_edges]
+    is_edge = is_edge[has_edges]
+    ss = 1 / num_edges[has_edges]
+    pew = edges / np.sum(edges, axis=1)[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fe[has_edges] = (np.sum(np.where(is_edge, np.minimum(pew, ss[:, np.newaxis]), 0.), axis=1) - ss) / (1 - ss)
+    return fe
+
 
 class FDIVFunction(FunctionalDiversityMetricsFunction):
 
@@ -137,59 +329,276 @@ class FDIVFunction(FunctionalDiversityMetricsFunction):
         return _F_DIV_NAME
 
     def _func(self, traits: np.array) -> np.float:
-        try:
-            cvh = spatial.ConvexHull(traits)
-            centroid = np.mean(traits[cvh.simplices, 0]), np.mean(traits[cvh.simplices, 1]), \
-                       np.mean(traits[cvh.simplices, 2])
-            eucdist = np.zeros(len(traits))
-            for i in range(len(traits)):
-                eucdist[i] = spatial.distance.euclidean(traits[i], centroid)
-            return np.mean(eucdist)
-        except:
+        return self._func_with_context(PlotContext(traits))
+
+    def _func_with_context(self, context: PlotContext) -> np.float:
+        hull = context.get_hull()
+        if hull is None:
             return _NO_DATA_VALUE
+        traits = context.get_traits()
+        # the centroid is the mean over the vertices of all simplices of the hull, in any number of dimensions
+        centroid = np.mean(traits[hull.simplices], axis=(0, 1))
+        return np.mean(np.sqrt(np.sum((traits - centroid) ** 2, axis=1)))
 
 
-def _get_functions(indicator_names: List[str], rows: int, columns: int, x_offset: int, y_offset: int) -> \
-        List[FunctionalDiversityMetricsFunction]:
+def _get_functions(indicator_names: List[str], rows: int, columns: int, x_offset: int, y_offset: int,
+                   x_size: Optional[int] = None, y_size: Optional[int] = None,
+                   scratch_space: Optional[ScratchSpace] = None) -> List[FunctionalDiversityMetricsFunction]:
     functions = []
     if _CVH_NAME in indicator_names:
-        functions.append(CVHFunction(rows, columns, x_offset, y_offset))
+        functions.append(CVHFunction(rows, columns, x_offset, y_offset, x_size, y_size, scratch_space))
     if _MNND_NAME in indicator_names:
-        functions.append(MNNDFunction(rows, columns, x_offset, y_offset))
+        functions.append(MNNDFunction(rows, columns, x_offset, y_offset, x_size, y_size, scratch_space))
     if _FE_NAME in indicator_names:
-        functions.append(FEFunction(rows, columns, x_offset, y_offset))
+        functions.append(FEFunction(rows, columns, x_offset, y_offset, x_size, y_size, scratch_space))
     if _F_DIV_NAME in indicator_names:
-        functions.append(FDIVFunction(rows, columns, x_offset, y_offset))
+        functions.append(FDIVFunction(rows, columns, x_offset, y_offset, x_size, y_size, scratch_space))
     return functions
 
 
-def _process(variable_data: dict, indicator_names: List[str]) -> dict:
-    x_size = 10
-    y_size = 10
-    x_offset = 5
-    y_offset = 5
-    first_var_name = list(variable_data.keys())[0]
-    first_var = variable_data[first_var_name]
-    num_vars = 3
+def _get_stride(plot_size: int, stride: Optional[int] = None, overlap: Optional[int] = None) -> int:
+    """
+    Determines the number of pixels by which plots are moved from the stride or the overlap of neighbouring plots.
+    If neither is given, plots do not overlap.
+    """
+    if plot_size < 2:
+        raise ValueError(f'Plot size must be at least 2, but is {plot_size}')
+    if overlap is not None:
+        if overlap < 0 or overlap >= plot_size:
+            raise ValueError(f'Overlap must be between 0 and {plot_size - 1}, but is {overlap}')
+        if stride is not None and stride != plot_size - overlap:
+            raise ValueError(f'Stride {stride} and overlap {overlap} do not match plot size {plot_size}')
+        return plot_size - overlap
+    if stride is None:
+        return plot_size
+    if stride < 1 or stride > plot_size:
+        raise ValueError(f'Stride must be between 1 and {plot_size}, but is {stride}')
+    return stride
+
+
+def _get_plot_starts(length: int, plot_size: int, stride: int) -> np.array:
+    """
+    :return: The first rows (or columns) of all plots whose center lies within the given length
+    """
+    return np.arange(0, length - plot_size // 2, stride)
+
+
+def _get_num_valids(data: np.array, plot_size: int, row_starts: np.array, column_starts: np.array) -> np.array:
+    """
+    Counts the valid pixels of all plots from a summed area table, so the count of each plot is derived from running
+    sums instead of from its own pixels. This keeps the cost independent of how much plots overlap.
+    :return: The number of valid pixels of shape (plot rows, plot columns)
+    """
+    summed_area_table = np.zeros((data.shape[0] + 1, data.shape[1] + 1), dtype=np.int64)
+    summed_area_table[1:, 1:] = np.cumsum(np.cumsum(np.isfinite(data), axis=0), axis=1)
+    row_ends = np.minimum(row_starts + plot_size, data.shape[0])
+    column_ends = np.minimum(column_starts + plot_size, data.shape[1])
+    return summed_area_table[row_ends][:, column_ends] - summed_area_table[row_starts][:, column_ends] - \
+        summed_area_table[row_ends][:, column_starts] + summed_area_table[row_starts][:, column_starts]
+
+
+def _process(variable_data: dict, indicator_names: List[str], workers: int = 1, plot_size: int = _PLOT_SIZE,
+             stride: Optional[int] = None, scratch_space: Optional[ScratchSpace] = None) -> dict:
+    """
+    Derives functional diversity metrics over plots of plot_size x plot_size pixels. Plots are moved by stride pixels
+    (by default plot_size, so that plots do not overlap). The value of a plot is set to the stride x stride pixels in
+    its center. If a scratch space is given, the output arrays are allocated in it.
+    """
+    stride = _get_stride(plot_size, stride)
+    if workers <= 1:
+        output = _process_band(variable_data, indicator_names, plot_size, stride, scratch_space=scratch_space)
+    else:
+        output = _process_bands_in_pool(variable_data, indicator_names, workers, plot_size, stride, scratch_space)
+    logging.info("Finished derival of functional diversity metrics")
+    return output
+
+
+def _get_bands(rows: int, workers: int, plot_size: int = _PLOT_SIZE, stride: int = _PLOT_SIZE) -> \
+        List[Tuple[int, int, int]]:
+    """
+    Splits the rows into bands of whole plot rows. Each worker receives several bands so that bands with many invalid
+    plots do not leave workers idle. Bands of overlapping plots overlap as well.
+    :return: A list of tuples holding the first row, the end row and the number of plot rows of each band
+    """
+    num_plot_rows = len(_get_plot_starts(rows, plot_size, stride))
+    plot_rows_per_band = max(1, math.ceil(num_plot_rows / (workers * _BANDS_PER_WORKER)))
+    bands = []
+    for first_plot_row in range(0, num_plot_rows, plot_rows_per_band):
+        num_band_plot_rows = min(plot_rows_per_band, num_plot_rows - first_plot_row)
+        start = first_plot_row * stride
+        end = min((first_plot_row + num_band_plot_rows - 1) * stride + plot_size, rows)
+        bands.append((start, end, num_band_plot_rows))
+    return bands
+
+
+def _process_band_in_worker(args: Tuple[dict, List[str], int, int, int, Optional[ScratchSpace]]) -> dict:
+    return _process_band(*args)
+
+
+def _process_bands_in_pool(variable_data: dict, indicator_names: List[str], workers: int,
+                           plot_size: int = _PLOT_SIZE, stride: int = _PLOT_SIZE,
+                           scratch_space: Optional[ScratchSpace] = None) -> dict:
+    """
+    Derives the metrics band by band in a pool of worker processes. As bands consist of whole plot rows, every plot
+    is evaluated on exactly the same pixels as in the serial case and the assembled results are identical.
+    """
+    first_var = list(variable_data.values())[0]
     rows = first_var.shape[0]
     columns = first_var.shape[1]
+    bands = _get_bands(rows, workers, plot_size, stride)
+    band_args = []
+    for start, end, num_plot_rows in bands:
+        band_variable_data = {}
+        for variable in variable_data:
+            band_variable_data[variable] = variable_data[variable][start:end]
+        band_args.append((band_variable_data, indicator_names, plot_size, stride, num_plot_rows, scratch_space))
+    output = {}
+    with multiprocessing.get_context('spawn').Pool(min(workers, len(bands))) as pool:
+        for (start, end, num_plot_rows), band_output in zip(bands, pool.imap(_process_band_in_worker, band_args)):
+            for name in band_output:
+                if name not in output:
+                    if scratch_space is None:
+                        output[name] = np.full((rows, columns), _NO_DATA_VALUE, dtype=band_output[name].dtype)
+                    else:
+                        output[name] = scratch_space.full((rows, columns), _NO_DATA_VALUE, band_output[name].dtype)
+                # the values of overlapping bands are set to disjoint pixels
+                band_values = band_output[name]
+                is_set = ~np.isnan(band_values)
+                output[name][start:end][is_set] = band_values[is_set]
+    return output
 
-    functions = _get_functions(indicator_names, rows, columns, x_offset, y_offset)
 
-    for row in np.arange(x_offset, rows, x_size):
-        for column in np.arange(y_offset, columns, y_size):
+def _batched_kde_densities(traits: np.array, mask: np.array) -> Tuple[np.array, np.array]:
+    """
+    Evaluates gaussian kernel density estimates of several plots at the points of the plots. Like
+    scipy.stats.gaussian_kde, each plot uses the covariance of its points scaled by Scott's factor as bandwidth matrix.
+    The densities agree with those of scipy to a relative tolerance of 1e-10. Only points with densities closer than
+    that to an outlier threshold may be classified differently.
+    :param traits: Padded traits of shape (plots, points, traits) as returned by _pad_plots
+    :param mask: The mask of actual points of shape (plots, points)
+    :return: The densities of shape (plots, points), which are NaN for padded points, and a boolean array which is
+    False for plots for which no estimate can be derived, i.e., which have too few points or whose covariance is not
+    positive definite. As with scipy, covariances that are singular but positive definite after rounding are used.
+    """
+    num_plots, num_points, num_traits = traits.shape
+    counts = np.sum(mask, axis=1)
+    derivable = counts > num_traits
+    n = np.maximum(counts, 2)[:, np.newaxis, np.newaxis]
+    weights = mask[:, :, np.newaxis]
+    mean = np.sum(traits * weights, axis=1, keepdims=True) / n
+    centered = (traits - mean) * weights
+    covariances = np.matmul(centered.transpose(0, 2, 1), centered) / (n - 1)
+    covariances[~derivable] = np.eye(num_traits)
+    try:
+        cholesky = np.linalg.cholesky(covariances)
+    except np.linalg.LinAlgError:
+        cholesky = np.empty(covariances.shape)
+        for i in range(num_plots):
+            try:
+                cholesky[i] = np.linalg.cholesky(covariances[i])
+            except np.linalg.LinAlgError:
+                derivable[i] = False
+                cholesky[i] = np.eye(num_traits)
+    cholesky *= (np.maximum(counts, 1) ** (-1. / (num_traits + 4)))[:, np.newaxis, np.newaxis]
+    whitened = np.linalg.solve(cholesky, traits.transpose(0, 2, 1)).transpose(0, 2, 1)
+    kernels = np.exp(-_batched_squared_distances(whitened) / 2)
+    kernels[~(mask[:, :, np.newaxis] & mask[:, np.newaxis, :])] = 0.
+    norms = np.power(2 * np.pi, num_traits / 2.) * np.prod(np.diagonal(cholesky, axis1=1, axis2=2), axis=1)
+    densities = np.sum(kernels, axis=2) / (np.maximum(counts, 1) * norms)[:, np.newaxis]
+    densities[~mask] = np.nan
+    return densities, derivable
+
+
+def _batched_outlier_thresholds(densities: np.array, mask: np.array, required_non_outliers: np.array) -> np.array:
+    """
+    Determines per plot the density above which points are no outliers. This is the 5th percentile of the densities,
+    or the next lower percentile down to the 0th for which at least the required number of points lie above. The
+    densities are sorted only once and the percentiles are interpolated as np.percentile does.
+    :return: The thresholds per plot. These are NaN for plots with NaN densities, for which np.percentile is NaN.
+    """
+    counts = np.sum(mask, axis=1)
+    sorted_densities = np.sort(np.where(mask, densities, np.inf), axis=1)
+    quantiles = np.array(_OUTLIER_PERCENTILES) / 100
+    virtual_indexes = (np.maximum(counts, 1)[:, np.newaxis] - 1) * quantiles
+    previous_indexes = np.floor(virtual_indexes).astype(int)
+    next_indexes = np.minimum(previous_indexes + 1, np.maximum(counts, 1)[:, np.newaxis] - 1)
+    gamma = virtual_indexes - previous_indexes
+    previous_values = np.take_along_axis(sorted_densities, previous_indexes, axis=1)
+    next_values = np.take_along_axis(sorted_densities, next_indexes, axis=1)
+    differences = next_values - previous_values
+    percentiles = np.where(gamma >= 0.5, next_values - differences * (1 - gamma),
+                           previous_values + differences * gamma)
+    num_non_outliers = np.sum(densities[:, :, np.newaxis] > percentiles[:, np.newaxis, :], axis=1)
+    sufficient = num_non_outliers >= required_non_outliers[:, np.newaxis]
+    selected = np.where(np.any(sufficient, axis=1), np.argmax(sufficient, axis=1), len(_OUTLIER_PERCENTILES) - 1)
+    thresholds = percentiles[np.arange(len(densities)), selected]
+    thresholds[np.any(np.isnan(densities) & mask, axis=1)] = np.nan
+    return thresholds
+
+
+def _remove_outliers(plot_traits: List[np.array], plot_num_valids: List[int], valid_threshold: int = _VALID_THRESHOLD) \
+        -> List[np.array]:
+    """
+    Removes the points with the lowest kernel densities from the traits of each plot. The traits of plots for which
+    no kernel density estimate can be derived are kept as they are.
+    """
+    traits, mask = _pad_plots(plot_traits)
+    densities, derivable = _batched_kde_densities(traits, mask)
+    required_non_outliers = valid_threshold / np.array(plot_num_valids)
+    thresholds = _batched_outlier_thresholds(densities, mask, required_non_outliers)
+    filtered_plot_traits = []
+    for i, plot in enumerate(plot_traits):
+        plot_densities = densities[i, :len(plot)]
+        if not derivable[i] or np.sum(np.isfinite(plot_densities)) == 0:
+            filtered_plot_traits.append(plot)
+        else:
+            filtered_plot_traits.append(plot[plot_densities > thresholds[i]])
+    return filtered_plot_traits
+
+
+def _apply_functions(functions: List[FunctionalDiversityMetricsFunction], plot_traits: List[np.array],
+                     plot_num_valids: List[int], plot_rows: List[int], plot_columns: List[int],
+                     valid_threshold: int = _VALID_THRESHOLD):
+    # kernel density estimates to define outliers
+    plot_contexts = [PlotContext(traits) for traits in _remove_outliers(plot_traits, plot_num_valids, valid_threshold)]
+    for func in functions:
+        func.apply_function_to_plots(plot_contexts, plot_rows, plot_columns)
 
-            # read data in moving window
-            r_first_var = first_var[(row - x_offset):(row + x_offset), (column - y_offset):(column + y_offset)]
 
-            num_valid = np.sum(np.isfinite(r_first_var))
-            if num_valid < _VALID_THRESHOLD:
+def _process_band(variable_data: dict, indicator_names: List[str], plot_size: int = _PLOT_SIZE,
+                  stride: int = _PLOT_SIZE, num_plot_rows: Optional[int] = None,
+                  scratch_space: Optional[ScratchSpace] = None) -> dict:
+    first_var_name = list(variable_data.keys())[0]
+    first_var = variable_data[first_var_name]
+    num_vars = 3
+    rows = first_var.shape[0]
+    columns = first_var.shape[1]
+    # values are set to the stride x stride pixels in the center of a plot
+    x_offset = stride // 2
+    y_offset = stride // 2
+    center_offset = (plot_size - stride) // 2 + stride // 2
+    valid_threshold = math.ceil(_VALID_THRESHOLD * plot_size * plot_size / 100)
+
+    functions = _get_functions(indicator_names, rows, columns, x_offset, y_offset, stride, stride, scratch_space)
+    plot_traits = []
+    plot_num_valids = []
+    plot_rows = []
+    plot_columns = []
+
+    row_starts = _get_plot_starts(rows, plot_size, stride)[:num_plot_rows]
+    column_starts = _get_plot_starts(columns, plot_size, stride)
+    num_valids = _get_num_valids(first_var, plot_size, row_starts, column_starts)
+    for i, row_start in enumerate(row_starts):
+        for j, column_start in enumerate(column_starts):
+            num_valid = num_valids[i, j]
+            if num_valid < valid_threshold:
                 logging.warning('Not enough valid pixels found for {}: {} < {}. Will not derive metrics for part of '
-                                'image'.format(first_var_name, num_valid, _VALID_THRESHOLD))
+                                'image'.format(first_var_name, num_valid, valid_threshold))
                 continue
+            # read data in moving window
             concatenate_list = []
             for variable in variable_data:
-                r_var = variable_data[variable][(row - x_offset):(row + x_offset), (column - y_offset):(column + y_offset)]
+                r_var = variable_data[variable][row_start:row_start + plot_size, column_start:column_start + plot_size]
                 concatenate_list.append(np.concatenate(r_var))
             # arrange data#
             traitslist = np.array(concatenate_list)
@@ -197,27 +606,18 @@ def _process(variable_data: dict, indicator_names: List[str]) -> dict:
             est = traitslist[~np.isnan(traitslist)]
             lengthr = int(len(est) / num_vars)
             est = np.reshape(est, (num_vars, lengthr))
-            # kernel density estimates to define outliers
-            try:
-                kde = stats.gaussian_kde(est)
-                density = kde(est)
-                if np.sum(np.isfinite(density)) == 0:
-                    estd = est.T
-                else:
-                    percentile = 5
-                    num_non_outliers = 0
-                    while num_non_outliers < _VALID_THRESHOLD / num_valid and percentile > -1:
-                        noutliers = (density > np.percentile(density, percentile))
-                        num_non_outliers = np.sum(noutliers)
-                        percentile -= 1
-                    # noinspection PyUnboundLocalVariable
-                    estd = est.T[noutliers]
-            except:  # if outlier detection failed
-                estd = est.T
-            for func in functions:
-                func.apply_function(estd, row, column)
-
-    logging.info("Finished derival of functional diversity metrics")
+            plot_traits.append(est.T)
+            plot_num_valids.append(num_valid)
+            plot_rows.append(row_start + center_offset)
+            plot_columns.append(column_start + center_offset)
+            if len(plot_traits) == _PLOT_CHUNK_SIZE:
+                _apply_functions(functions, plot_traits, plot_num_valids, plot_rows, plot_columns, valid_threshold)
+                plot_traits = []
+                plot_num_valids = []
+                plot_rows = []
+                plot_columns = []
+    if len(plot_traits) > 0:
+        _apply_functions(functions, plot_traits, plot_num_valids, plot_rows, plot_columns, valid_threshold)
 
     output = {}
     for func in functions:
@@ -228,6 +628,40 @@ def _process(variable_data: dict, indicator_names: List[str]) -> dict:
 
 class FunctionalDiversityMetricsPostProcessor(VariablePostProcessor):
 
+    def __init__(self, indicator_names: List[str]):
+        super().__init__(indicator_names)
+        self._workers = None
+        self._plot_size = _PLOT_SIZE
+        self._stride = _PLOT_SIZE
+
+    def set_parameters(self, parameters: dict):
+        """
+        Supported parameters are:
+        'workers': The number of processes among which the plots are distributed (default: the post processor's share
+        of the worker budget of the run). It cannot exceed that share. Plots are assigned to the processes in bands of
+        whole plot rows. The results are the same as when computed in a single process.
+        'plot_size': The width and height of a plot in pixels (default 10).
+        'stride': The number of pixels by which plots are moved (default: the plot size). Plots overlap if the stride
+        is smaller than the plot size. The value of a plot is set to the stride x stride pixels in its center.
+        'overlap': The number of pixels by which neighbouring plots overlap (default 0). Alternative to the stride.
+        """
+        plot_size = self._plot_size
+        stride = None
+        overlap = None
+        for parameter_name in parameters:
+            if parameter_name == _WORKERS:
+                self._workers = int(parameters[parameter_name])
+            elif parameter_name == _PLOT_SIZE_PARAMETER:
+                plot_size = int(parameters[parameter_name])
+            elif parameter_name == _STRIDE:
+                stride = int(parameters[parameter_name])
+            elif parameter_name == _OVERLAP:
+                overlap = int(parameters[parameter_name])
+            else:
+                logging.info(f'Parameter {parameter_name} is not supported by post processor {self.get_name()}.')
+        self._stride = _get_stride(plot_size, stride, overlap)
+        self._plot_size = plot_size
+
     @classmethod
     def get_num_time_steps(cls) -> int:
         return 1
@@ -237,7 +671,13 @@ class FunctionalDiversityMetricsPostProcessor(VariablePostProcessor):
             logging.info('No indicator selected. Will not compute.')
             return {}
         pre_processed_variable_data = _pre_process(variable_data)
-        return _process(pre_processed_variable_data, self.indicators)
+        return _process(pre_processed_variable_data, self.indicators, self._get_workers(), self._plot_size,
+                        self._stride, self.get_scratch_space())
+
+    def _get_workers(self) -> int:
+        if self._workers is None:
+            return self.get_num_workers()
+        return min(self._workers, self.get_num_workers())
 
     @classmethod
     def get_name(cls) -> str:
@@ -1,18 +1,47 @@
-import pkg_resources
+import copy
+import os
+import threading
 import yaml
 
 from multiply_core.variables import Variable
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
+_INDICATORS_LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indicators_library.yaml')
+# the library is parsed once, on first use
+_indicators = None
+_indicators_by_name = None
+_lock = threading.Lock()
+
+
+def _load_indicators():
+    global _indicators, _indicators_by_name
+    if _indicators is not None:
+        return
+    with _lock:
+        if _indicators is None:
+            with open(_INDICATORS_LIBRARY) as indicators_library:
+                indicators = yaml.safe_load(indicators_library)
+            _indicators_by_name = {}
+            for indicator in indicators:
+                short_name = indicator['Variable']['short_name']
+                if short_name not in _indicators_by_name:
+                    _indicators_by_name[short_name] = Variable(indicator['Variable'])
+            _indicators = indicators
+
 
 def get_indicators():
-    return yaml.safe_load(pkg_resources.resource_stream(__name__, 'indicators_library.yaml'))
+    _load_indicators()
+    # callers get copies, so they cannot alter the parsed library
+    return copy.deepcopy(_indicators)
 
 
 def get_indicator(indicator_name: str) -> Variable:
-    indicators = get_indicators()
-    for indicator in indicators:
-        if indicator['Variable']['short_name'] == indicator_name:
-            return Variable(indicator['Variable'])
-    return None
+    """
+    :return: A new description of the indicator of the given name, or None if there is no such indicator
+    """
+    _load_indicators()
+    if indicator_name not in _indicators_by_name:
+        return None
+    # as before, each caller gets an object of its own
+    return copy.deepcopy(_indicators_by_name[indicator_name])
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+
+from typing import List
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+MANIFEST_NAME_FORMAT = '{}_manifest.json'
+_VERSION = 1
+
+
+def get_file_identity(path: str) -> List[list]:
+    """
+    :return: The absolute path, size and modification time of the file. For directories, e.g., products consisting
+    of several band files, the identities of all files within are returned.
+    """
+    path = os.path.abspath(path)
+    if not os.path.isdir(path):
+        status = os.stat(path)
+        return [[path, status.st_size, status.st_mtime_ns]]
+    identity = []
+    for directory, directory_names, file_names in os.walk(path):
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            identity.extend(get_file_identity(os.path.join(directory, file_name)))
+    return identity
+
+
+def _normalize(value):
+    # values are compared as they are read back from the manifest file
+    return json.loads(json.dumps(value, sort_keys=True, default=str))
+
+
+class RunManifest(object):
+    """
+    Keeps track of the work units of a post processor, e.g., date pairs or dates, whose outputs have been written.
+    For each unit, the identities of its input files, the parameters of the run and the written output files are
+    recorded in a manifest file in the output directory. On later runs, a unit is up to date if it has been recorded
+    with the same parameters, its inputs have not changed and all its outputs are present. Units are recorded only
+    after their outputs have been written, so a run that has been stopped can be resumed.
+    """
+
+    def __init__(self, output_path: str, post_processor_name: str, parameters: dict):
+        """
+        :param output_path: The directory to which the outputs are written
+        :param post_processor_name: The name of the post processor. Each post processor has a manifest of its own.
+        :param parameters: The parameters of the run that affect the outputs
+        """
+        self._file_name = os.path.join(output_path, MANIFEST_NAME_FORMAT.format(post_processor_name))
+        self._parameters = _normalize(parameters)
+        self._units = {}
+        self._input_identities = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self._file_name):
+            with open(self._file_name) as manifest_file:
+                content = json.load(manifest_file)
+            if content.get('version') == _VERSION:
+                self._units = content['units']
+
+    def get_file_name(self) -> str:
+        return self._file_name
+
+    def is_up_to_date(self, unit_key: str, input_files: List[str]) -> bool:
+        """
+        Determines whether the outputs of a unit need not be derived again. The identities of the input files are
+        kept, so they can be recorded along with the unit.
+        :param unit_key: The key of the unit, e.g., its dates
+        :param input_files: The paths of the files or directories from which the outputs of the unit are derived
+        :return: True, if the unit has been recorded with the same parameters and inputs and all its outputs exist
+        """
+        input_identity = []
+        for input_file in sorted(input_files):
+            input_identity.extend(get_file_identity(input_file))
+        input_identity = _normalize(input_identity)
+        with self._lock:
+            self._input_identities[unit_key] = input_identity
+            unit = self._units.get(unit_key)
+        if unit is None or unit['parameters'] != self._parameters or unit['inputs'] != input_identity:
+            return False
+        return all(os.path.exists(output_file) for output_file in unit['outputs'])
+
+    def record(self, unit_key: str, output_files: List[str]):
+        """
+        Records that the outputs of a unit have been written. is_up_to_date must have been called for the unit
+        before. The manifest file is updated right away.
+        :param unit_key: The key of the unit, e.g., its dates
+        :param output_files: The paths of the files the outputs have been written to
+        """
+        with self._lock:
+            if unit_key not in self._input_identities:
+                raise ValueError(f'Inputs of unit {unit_key} are unknown.')
+            self._units[unit_key] = {'inputs': self._input_identities[unit_key], 'parameters': self._parameters,
+                                     'outputs': [os.path.abspath(output_file) for output_file in output_files]}
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self._file_name)
+        if directory != '' and not os.path.exists(directory):
+            os.makedirs(directory)
+        temporary_file_name = self._file_name + '.part'
+        with open(temporary_file_name, 'w') as manifest_file:
+            json.dump({'version': _VERSION, 'units': self._units}, manifest_file, indent=1, sort_keys=True)
+        # the manifest is replaced at once, so it is never left incomplete
+        os.replace(temporary_file_name, self._file_name)
@@ -1,27 +1,43 @@
 import argparse
 import gdal
 import logging
+import multiprocessing
 import numpy as np
 import os
 import osr
-import pkg_resources
+import time
 
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from multiply_core.observations import GeoTiffWriter, ObservationsFactory, is_valid, get_valid_files
 from multiply_core.util import FileRef, Reprojection, get_time_from_string
-from multiply_core.variables import Variable
 from shapely.geometry import Polygon
 from shapely.wkt import loads
-from typing import List, Optional, Union
+from typing import Iterator, List, Optional, Tuple, Union
 
-from multiply_post_processing.post_processor import EODataPostProcessor, PostProcessor, PostProcessorCreator, \
-    PostProcessorType, VariablePostProcessor
+from multiply_post_processing.caching import DateCache, SharedObservations
+from multiply_post_processing.datacube import DataCubeReader, DataCubeWriter
+from multiply_post_processing.manifest import RunManifest
+from multiply_post_processing.prefetching import Prefetcher
+from multiply_post_processing.post_processor import EODataPostProcessor, PostProcessor, PostProcessorType, \
+    VariablePostProcessor
+from multiply_post_processing.reductions import merge_statistics
+from multiply_post_processing.registry import POST_PROCESSOR_CREATOR_REGISTRY, add_post_processor_creator, \
+    get_available_indicators, get_post_processor, get_post_processor_creators, get_post_processor_description, \
+    get_post_processor_names, get_post_processors
+from multiply_post_processing.scratch import ScratchSpace
+from multiply_post_processing.writers import AsyncWriter, BlockGeoTiffWriter, COMPRESSIONS, write_cogs, \
+    _get_gdal_data_type
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
-POST_PROCESSOR_CREATOR_REGISTRY = []
 SINGLE_NAME_FORMAT = '{}_{}.tif'
 DOUBLE_NAME_FORMAT = '{}_{}_{}.tif'
+CUBE_NAME_FORMAT = '{}.nc'
+DATA_CUBE_EXTENSIONS = ['.nc', '.nc4']
+# the dates of the pair being processed
+_NUM_CACHED_DATES = 2
 
 component_progress_logger = logging.getLogger('ComponentProgress')
 component_progress_logger.setLevel(logging.INFO)
@@ -31,80 +47,6 @@ component_progress_logging_handler.setLevel(logging.INFO)
 component_progress_logging_handler.setFormatter(component_progress_formatter)
 component_progress_logger.addHandler(component_progress_logging_handler)
 
-def add_post_processor_creator(post_processor_creator: PostProcessorCreator):
-    POST_PROCESSOR_CREATOR_REGISTRY.append(post_processor_creator)
-
-
-registered_post_processor_creators = pkg_resources.iter_entry_points('post_processor_creators')
-for registered_post_processor_creator in registered_post_processor_creators:
-    add_post_processor_creator(registered_post_processor_creator.load())
-
-
-def get_post_processor_creators() -> List[PostProcessorCreator]:
-    return POST_PROCESSOR_CREATOR_REGISTRY
-
-
-def get_post_processors(requested_indicator_names: List[str]) -> List[PostProcessor]:
-    """
-    :param requested_indicator_names: Names of the indicators that shall be derived.
-    :return: The post processors that can be used to derive the designated indicators.
-    """
-    post_processors = []
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        indicator_names = []
-        indicator_descriptions = post_processor_creator.get_indicator_descriptions()
-        for indicator_description in indicator_descriptions:
-            if indicator_description.short_name in requested_indicator_names:
-                indicator_names.append(indicator_description.short_name)
-        if len(indicator_names) > 0:
-            post_processors.append(post_processor_creator.create_post_processor(indicator_names))
-    return post_processors
-
-
-def get_post_processor_names() -> List[str]:
-    """
-    :return: the names of all post processors registered in the post processing component
-    """
-    post_processor_names = []
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        post_processor_names.append(post_processor_creator.get_name())
-    return post_processor_names
-
-
-def get_post_processor_description(name: str) -> str:
-    """
-    :param A name of a post-processor
-    :return: the description of the post processor of the requested name
-    """
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        if name == post_processor_creator.get_name():
-            return post_processor_creator.get_description()
-    raise ValueError('No post processor with name {} found.'.format(name))
-
-
-def get_post_processor(name: str, indicator_names: List[str]) -> PostProcessor:
-    """
-    :param A name of a post-processor
-    :return: the post processor of the requested name
-    """
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        if name == post_processor_creator.get_name():
-            return post_processor_creator.create_post_processor(indicator_names)
-    raise ValueError('No post processor with name {} found.'.format(name))
-
-
-def get_available_indicators() -> List[Variable]:
-    """
-    :return: the names of the indicators that can be derived using one of the registered post processors.
-    """
-    indicator_descriptions = []
-    for post_processor_creator in POST_PROCESSOR_CREATOR_REGISTRY:
-        post_processor_indicator_descriptions = post_processor_creator.get_indicator_descriptions()
-        for indicator_description in post_processor_indicator_descriptions:
-            if indicator_description not in indicator_descriptions:
-                indicator_descriptions.append(indicator_description)
-    return indicator_descriptions
-
 
 # todo almost the same method is included in inference engine. Find way to harmonize
 def _get_reprojection(spatial_resolution: int, roi: Union[str, Polygon], roi_grid: Optional[str] = None,
@@ -165,103 +107,969 @@ def _get_dummy_data_set():
     return dataset
 
 
+class DestinationGrid(object):
+    """
+    The grid to which inputs are reprojected and in which outputs are written. The geo transform, the projection and
+    the size of the grid are derived only once, when they are first requested. Instances can be pickled along with
+    these properties, so worker processes do not need to derive them again.
+    """
+
+    def __init__(self, spatial_resolution: int, roi: Union[str, Polygon], roi_grid: Optional[str] = None,
+                 destination_grid: Optional[str] = None):
+        self._spatial_resolution = spatial_resolution
+        self._roi = roi
+        self._roi_grid = roi_grid
+        self._destination_grid = destination_grid
+        self._reprojection = _get_reprojection(spatial_resolution, roi, roi_grid, destination_grid)
+        self._geo_transform = None
+        self._projection = None
+        self._width = None
+        self._height = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        # spatial reference systems cannot be pickled, so the reprojection is set up anew
+        del state['_reprojection']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._reprojection = _get_reprojection(self._spatial_resolution, self._roi, self._roi_grid,
+                                               self._destination_grid)
+
+    def _derive_properties(self):
+        if self._geo_transform is None:
+            reprojected_data_set = self._reprojection.reproject(_get_dummy_data_set())
+            self._width = reprojected_data_set.RasterXSize
+            self._height = reprojected_data_set.RasterYSize
+            self._projection = self._reprojection.get_destination_srs().ExportToWkt()
+            self._geo_transform = reprojected_data_set.GetGeoTransform()
+
+    def get_reprojection(self) -> Reprojection:
+        return self._reprojection
+
+    def get_spatial_resolution(self) -> int:
+        return self._spatial_resolution
+
+    def get_geo_transform(self) -> tuple:
+        self._derive_properties()
+        return self._geo_transform
+
+    def get_projection(self) -> str:
+        """
+        :return: The projection of the grid in WKT representation
+        """
+        self._derive_properties()
+        return self._projection
+
+    def get_width(self) -> int:
+        self._derive_properties()
+        return self._width
+
+    def get_height(self) -> int:
+        self._derive_properties()
+        return self._height
+
+    def get_bounds(self) -> List[float]:
+        """
+        :return: The bounds of the grid in its projection as min x, min y, max x, and max y
+        """
+        return _get_tile_bounds(self.get_geo_transform(), (0, 0, self.get_width(), self.get_height()))
+
+
+def _get_tiles(width: int, height: int, tile_size: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Splits a grid into tiles of at most tile_size x tile_size pixels.
+    :return: A list of tiles, each given as x offset, y offset, width, and height
+    """
+    if tile_size <= 0:
+        raise ValueError('Tile size must be positive, but is {}.'.format(tile_size))
+    tiles = []
+    for y_offset in range(0, height, tile_size):
+        for x_offset in range(0, width, tile_size):
+            tiles.append((x_offset, y_offset, min(tile_size, width - x_offset), min(tile_size, height - y_offset)))
+    return tiles
+
+
+def _get_tile_bounds(geo_transform: tuple, tile: Tuple[int, int, int, int]) -> List[float]:
+    x_offset, y_offset, tile_width, tile_height = tile
+    min_x = geo_transform[0] + x_offset * geo_transform[1]
+    max_x = geo_transform[0] + (x_offset + tile_width) * geo_transform[1]
+    max_y = geo_transform[3] + y_offset * geo_transform[5]
+    min_y = geo_transform[3] + (y_offset + tile_height) * geo_transform[5]
+    return [min_x, min_y, max_x, max_y]
+
+
 def run_post_processing(indicator_names: List[str], data_path: str, output_path: str, roi: Union[str, Polygon],
                         spatial_resolution: int, variable_names: Optional[List[str]] = None,
                         roi_grid: Optional[str] = 'EPSG:4326', destination_grid: Optional[str] = None,
-                        output_format: Optional[str] = 'GeoTiff'):
-    post_processors = get_post_processors(indicator_names)
+                        output_format: Optional[str] = 'GeoTiff', tile_size: Optional[int] = None,
+                        parameters: Optional[dict] = None, workers: int = 1, prefetch_depth: int = 1,
+                        prefetch_memory: Optional[int] = None, write_threads: int = 1, compression: str = 'DEFLATE',
+                        scratch_directory: Optional[str] = None, scratch_threshold: Optional[int] = None,
+                        incremental: bool = False):
+    """
+    Derives indicators using all post processors that provide them. Post processors that share their inputs are run
+    together, so that each input is read only once per date and handed to all of them (see plan_post_processor_groups).
+    :param workers: The total number of processes that may be used. If there are several groups of post processors,
+    as many of them as the budget allows are run concurrently in processes of their own. The remaining budget is split
+    among them. As processes are spawned, scripts calling this with more than one worker must guard their entry point
+    with "if __name__ == '__main__':".
+    """
+    post_processor_groups = plan_post_processor_groups(get_post_processors(indicator_names))
+    wall_times = []
+    if workers <= 1 or len(post_processor_groups) <= 1:
+        for post_processor_group in post_processor_groups:
+            start_time = time.time()
+            run_actual_post_processors(post_processor_group, data_path, output_path, roi, spatial_resolution,
+                                       variable_names, roi_grid, destination_grid, output_format, tile_size,
+                                       parameters, workers, prefetch_depth, prefetch_memory, write_threads,
+                                       compression, scratch_directory, scratch_threshold, incremental)
+            wall_times.append(time.time() - start_time)
+    else:
+        num_concurrent_groups = min(workers, len(post_processor_groups))
+        workers_per_group = workers // num_concurrent_groups
+        with ThreadPoolExecutor(num_concurrent_groups) as executor:
+            futures = []
+            for post_processor_group in post_processor_groups:
+                args = (post_processor_group, data_path, output_path, roi, spatial_resolution, variable_names,
+                        roi_grid, destination_grid, output_format, tile_size, parameters, workers_per_group,
+                        prefetch_depth, prefetch_memory, write_threads, compression, scratch_directory,
+                        scratch_threshold, incremental)
+                futures.append(executor.submit(_run_actual_post_processors_in_process, *args))
+            for future in futures:
+                wall_times.append(future.result())
+    for post_processor_group, wall_time in zip(post_processor_groups, wall_times):
+        logging.getLogger().info(f'Wall time of post processors {_get_post_processor_names(post_processor_group)}: '
+                                 f'{wall_time:.1f} s')
+
+
+def plan_post_processor_groups(post_processors: List[PostProcessor]) -> List[List[PostProcessor]]:
+    """
+    Groups post processors by the inputs they read, so that each group can be run on inputs that are read only once.
+    All variable post processors read the same variables. EO data post processors read the same observations if they
+    support the same EO data types. The bands each group of EO data post processors requires are logged.
+    :return: The groups of post processors, in the order of their first post processors
+    """
+    post_processor_groups = OrderedDict()
     for post_processor in post_processors:
-        run_actual_post_processor(post_processor, data_path, output_path, roi, spatial_resolution, variable_names,
-                                  roi_grid, destination_grid, output_format)
+        if post_processor.get_type() == PostProcessorType.EO_DATA_POST_PROCESSOR:
+            key = tuple(sorted(post_processor.get_names_of_supported_eo_data_types()))
+        else:
+            key = post_processor.get_type()
+        if key not in post_processor_groups:
+            post_processor_groups[key] = []
+        post_processor_groups[key].append(post_processor)
+    for key in post_processor_groups:
+        post_processor_group = post_processor_groups[key]
+        if len(post_processor_group) < 2 or key == PostProcessorType.VARIABLE_POST_PROCESSOR:
+            continue
+        for data_type in key:
+            required_bands = []
+            for post_processor in post_processor_group:
+                for band_name in post_processor.get_names_of_required_bands(data_type):
+                    if band_name not in required_bands:
+                        required_bands.append(band_name)
+            logging.getLogger().info(f'Post processors {_get_post_processor_names(post_processor_group)} share the '
+                                     f'bands {required_bands} of {data_type} data.')
+    return list(post_processor_groups.values())
+
+
+def _run_actual_post_processors_in_process(*args) -> float:
+    """
+    Runs a group of post processors in a spawned process. In contrast to pool workers, that process may start
+    processes of its own, so the post processors can use their share of the worker budget.
+    :return: The wall time of the post processors
+    """
+    start_time = time.time()
+    process = multiprocessing.get_context('spawn').Process(target=run_actual_post_processors, args=args)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f'Post processors {_get_post_processor_names(args[0])} failed with exit code '
+                           f'{process.exitcode}.')
+    return time.time() - start_time
 
 
 def run_post_processor(name: str, data_path: str, output_path: str, roi: Union[str, Polygon],
                        spatial_resolution: int, indicator_names: Optional[List[str]] = [],
                        variable_names: Optional[List[str]] = None, roi_grid: Optional[str] = 'EPSG:4326',
-                       destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff'):
+                       destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff',
+                       tile_size: Optional[int] = None, parameters: Optional[dict] = None, workers: int = 1,
+                       prefetch_depth: int = 1, prefetch_memory: Optional[int] = None, write_threads: int = 1,
+                       compression: str = 'DEFLATE', scratch_directory: Optional[str] = None,
+                       scratch_threshold: Optional[int] = None, incremental: bool = False):
     run_actual_post_processor(get_post_processor(name, indicator_names), data_path, output_path, roi,
-                              spatial_resolution, variable_names, roi_grid, destination_grid, output_format)
+                              spatial_resolution, variable_names, roi_grid, destination_grid, output_format, tile_size,
+                              parameters, workers, prefetch_depth, prefetch_memory, write_threads, compression,
+                              scratch_directory, scratch_threshold, incremental)
 
 
 # noinspection PyTypeChecker
 def run_actual_post_processor(post_processor: PostProcessor, data_path: str, output_path: str,
                               roi: Union[str, Polygon], spatial_resolution: int,
                               variable_names: Optional[List[str]] = None, roi_grid: Optional[str] = 'EPSG:4326',
-                              destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff'):
-    if post_processor.get_type() == PostProcessorType.EO_DATA_POST_PROCESSOR:
-        _run_eo_data_post_processor(post_processor, data_path, output_path, roi, spatial_resolution, roi_grid,
-                                    destination_grid, output_format)
-    elif post_processor.get_type() == PostProcessorType.VARIABLE_POST_PROCESSOR:
-        if variable_names is None:
-            raise ValueError('No list with variable names be provided.')
-        _run_variable_post_processor(post_processor, data_path, output_path, variable_names, roi, spatial_resolution,
-                                     roi_grid, destination_grid, output_format)
-
-
-def _run_eo_data_post_processor(post_processor: EODataPostProcessor, data_path: str, output_path: str,
-                                roi: Union[str, Polygon], spatial_resolution: int, roi_grid: Optional[str],
-                                destination_grid: Optional[str], output_format: Optional[str] = 'GeoTiff'):
-    supported_eo_data_types = post_processor.get_names_of_supported_eo_data_types()
-    file_refs = get_valid_files(data_path, supported_eo_data_types)
-    reprojection = _get_reprojection(spatial_resolution, roi, roi_grid, destination_grid)
-    observations_factory = ObservationsFactory()
-    observations = observations_factory.create_observations(file_refs, reprojection)
-    if observations.get_num_observations() < 2:
-        logging.getLogger().info(f'Not enough observations found. '
-                                 f'Can not conduct post processing for {post_processor.get_name()}')
+                              destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff',
+                              tile_size: Optional[int] = None, parameters: Optional[dict] = None, workers: int = 1,
+                              prefetch_depth: int = 1, prefetch_memory: Optional[int] = None,
+                              write_threads: int = 1, compression: str = 'DEFLATE',
+                              scratch_directory: Optional[str] = None, scratch_threshold: Optional[int] = None,
+                              incremental: bool = False):
+    """
+    Runs a post processor.
+    :param output_format: Either 'GeoTiff', 'COG' or 'NetCDF'. 'COG' writes Cloud-Optimized GeoTiffs with internal
+    tiles, compression and overviews. 'NetCDF' appends the results of all dates to a single datacube per post
+    processor, named after the post processor. Tiled processing does not support 'NetCDF'.
+    :param tile_size: If given, EO data post processors are run on tiles of at most tile_size x tile_size pixels of
+    the destination grid, so that the memory required no longer depends on the size of the scene. Results are written
+    tile by tile. Post processors that depend on scene statistics are run in two passes: The first pass collects the
+    statistics tile by tile, the second one applies them. Variable post processors always operate on the full scene.
+    :param parameters: Parameters that configure the post processor for this run, e.g., {'backend': 'numba'}.
+    :param workers: The number of processes among which the date pairs of EO data post processors are distributed.
+    Variable post processors use this many threads to read the variables of upcoming dates while the current date is
+    processed. Post processors that start processes of their own, e.g., the FunctionalDiversityMetricsPostProcessor,
+    start at most this many. As processes are spawned, scripts calling this with more than one worker must guard
+    their entry point with "if __name__ == '__main__':".
+    :param prefetch_depth: The number of upcoming dates whose inputs are read in the background while EO data post
+    processors work on the current date pair. Applies to post processors that support reading single dates when date
+    pairs are processed one after the other and without tiles. 0 disables reading ahead.
+    :param prefetch_memory: If given, no further dates are read ahead while the dates read ahead occupy more than this
+    many megabytes.
+    :param write_threads: The number of threads that write results in the background while processing continues.
+    Applies to variable post processors and to EO data post processors that are run in a single process without tiles.
+    0 writes results before processing continues. If any result cannot be written, an error is raised after all
+    others have been written.
+    :param compression: The compression of Cloud-Optimized GeoTiffs, one of 'DEFLATE', 'ZSTD', 'LZW' or 'NONE'.
+    :param scratch_directory: The directory in which memory-mapped scratch files are created. Defaults to the
+    system's temporary directory.
+    :param scratch_threshold: If given, post processors allocate large intermediate and output arrays of more than
+    this many megabytes as memory-mapped files in the scratch directory. The files are removed when the post processor
+    has finished, also if it has failed.
+    :param incremental: If True, a manifest is kept in the output directory that records for each date pair or date
+    the identities of its input files (path, size and modification time), the parameters of the run and the files its
+    results have been written to. Date pairs and dates whose results are present and whose inputs and parameters have
+    not changed since they were recorded are skipped, so a run that has been stopped resumes where it stopped.
+    Inputs from datacubes are identified by the whole datacube. Not supported for 'NetCDF' output.
+    """
+    run_actual_post_processors([post_processor], data_path, output_path, roi, spatial_resolution, variable_names,
+                               roi_grid, destination_grid, output_format, tile_size, parameters, workers,
+                               prefetch_depth, prefetch_memory, write_threads, compression, scratch_directory,
+                               scratch_threshold, incremental)
+
+
+# noinspection PyTypeChecker
+def run_actual_post_processors(post_processors: List[PostProcessor], data_path: str, output_path: str,
+                               roi: Union[str, Polygon], spatial_resolution: int,
+                               variable_names: Optional[List[str]] = None, roi_grid: Optional[str] = 'EPSG:4326',
+                               destination_grid: Optional[str] = None, output_format: Optional[str] = 'GeoTiff',
+                               tile_size: Optional[int] = None, parameters: Optional[dict] = None, workers: int = 1,
+                               prefetch_depth: int = 1, prefetch_memory: Optional[int] = None,
+                               write_threads: int = 1, compression: str = 'DEFLATE',
+                               scratch_directory: Optional[str] = None, scratch_threshold: Optional[int] = None,
+                               incremental: bool = False):
+    """
+    Runs a group of post processors that share their inputs, as planned by plan_post_processor_groups. The inputs of
+    each date are read only once and handed to all post processors. The parameters are those of
+    run_actual_post_processor.
+    """
+    if output_format == 'COG' and compression.upper() not in COMPRESSIONS:
+        raise ValueError(f'Compression {compression} is not supported. Choose one of {COMPRESSIONS}.')
+    if len(post_processors) == 0:
         return
-    for i in range(observations.get_num_observations() - 1):
-        component_progress_logger.info(f'{int((i / (observations.get_num_observations() - 1)) * 100)}')
-        start = observations.dates[i]
-        end = observations.dates[i + 1]
-        observations_subset = observations.get_observations_subset(start, end)
-        indicator_dict = post_processor.process_observations(observations_subset)
+    post_processor_type = post_processors[0].get_type()
+    if any(post_processor.get_type() != post_processor_type for post_processor in post_processors):
+        raise ValueError('Post processors that are run together must be of the same type.')
+    if post_processor_type == PostProcessorType.VARIABLE_POST_PROCESSOR and variable_names is None:
+        raise ValueError('No list with variable names be provided.')
+    manifests = []
+    for post_processor in post_processors:
+        post_processor.set_num_workers(workers)
+        if parameters is not None:
+            post_processor.set_parameters(parameters)
+        manifests.append(_create_manifest(post_processor, output_path, roi, spatial_resolution, variable_names,
+                                          roi_grid, destination_grid, output_format, parameters, compression)
+                         if incremental else None)
+    memory_threshold = None if scratch_threshold is None else scratch_threshold * 1024 * 1024
+    with ScratchSpace(scratch_directory, memory_threshold) as scratch_space:
+        for post_processor in post_processors:
+            post_processor.set_scratch_space(scratch_space)
+        if post_processor_type == PostProcessorType.EO_DATA_POST_PROCESSOR:
+            _run_eo_data_post_processors(post_processors, data_path, output_path, roi, spatial_resolution, roi_grid,
+                                         destination_grid, output_format, tile_size, workers, prefetch_depth,
+                                         prefetch_memory, write_threads, compression, manifests)
+        elif post_processor_type == PostProcessorType.VARIABLE_POST_PROCESSOR:
+            _run_variable_post_processors(post_processors, data_path, output_path, variable_names, roi,
+                                          spatial_resolution, roi_grid, destination_grid, output_format, workers,
+                                          write_threads, compression, manifests)
+
+
+def _create_manifest(post_processor: PostProcessor, output_path: str, roi: Union[str, Polygon],
+                     spatial_resolution: int, variable_names: Optional[List[str]], roi_grid: Optional[str],
+                     destination_grid: Optional[str], output_format: Optional[str], parameters: Optional[dict],
+                     compression: str) -> Optional[RunManifest]:
+    if output_format == 'NetCDF':
+        logging.warning('Incremental runs are not supported for output format NetCDF. Processing all dates.')
+        return None
+    run_parameters = {'indicators': post_processor.get_actual_indicators(), 'parameters': parameters, 'roi': roi,
+                      'spatial_resolution': spatial_resolution, 'roi_grid': roi_grid,
+                      'destination_grid': destination_grid, 'variable_names': variable_names,
+                      'output_format': output_format, 'compression': compression}
+    return RunManifest(output_path, post_processor.get_name(), run_parameters)
+
+
+class _EODataPairProcessor(object):
+    """
+    Runs EO data post processors on pairs of consecutive observations and writes the results. The post processors
+    share the observations, so bands required by several of them are read only once per date. Holds everything that
+    needs to be set up only once per run, so that it can be created once in each worker process.
+    """
+
+    def __init__(self, post_processors: List[EODataPostProcessor], file_refs: List[FileRef], output_path: str,
+                 grid: DestinationGrid, output_format: Optional[str], tile_size: Optional[int],
+                 compression: str = 'DEFLATE'):
+        self._post_processors = post_processors
+        self._output_path = output_path
+        self._grid = grid
+        self._output_format = output_format
+        self._compression = compression
+        self._file_refs = file_refs
+        self._tile_size = tile_size
+        self._observations = ObservationsFactory().create_observations(file_refs, grid.get_reprojection())
+        if len(post_processors) > 1 and tile_size is None:
+            self._observations = SharedObservations(self._observations, DateCache(_NUM_CACHED_DATES))
+        self._tiles = None
+        self._tile_observations = None
+        self._async_writer = None
+        self._cube_writers = [None] * len(post_processors)
+        self._manifests = [None] * len(post_processors)
+        self._written_file_names = [[] for _ in post_processors]
+        self.set_num_cached_dates(_NUM_CACHED_DATES)
+
+    def set_num_cached_dates(self, num_dates: int):
+        """
+        Sets the number of dates of which the post processors hold data, so that the data of the later date of a pair
+        can be reused for the next pair. Tiles of a date are not cached, as the tiles of a date pair are processed
+        before the next date pair.
+        """
+        if self._tile_size is None:
+            for post_processor in self._post_processors:
+                post_processor.set_date_cache(DateCache(num_dates))
+            if isinstance(self._observations, SharedObservations):
+                self._observations.set_date_cache(DateCache(num_dates))
+
+    def set_async_writer(self, async_writer: Optional[AsyncWriter]):
+        """
+        Sets a writer to which untiled results are handed over, so that they are written in the background.
+        """
+        self._async_writer = async_writer
+
+    def set_manifests(self, manifests: List[Optional[RunManifest]]):
+        """
+        Sets the manifests, one per post processor, in which date pairs are recorded once their results have been
+        written.
+        """
+        self._manifests = manifests
+
+    def get_written_file_names(self) -> List[List[str]]:
+        """
+        :return: Per post processor, the names of the files the results of the last processed date pair are written to
+        """
+        return self._written_file_names
+
+    def set_cube_writers(self, cube_writers: List[Optional[DataCubeWriter]]):
+        """
+        Sets the datacubes, one per post processor, to which untiled results are appended if the output format is
+        'NetCDF'.
+        """
+        self._cube_writers = cube_writers
+
+    def _set_up_tiles(self):
+        destination_srs = self._grid.get_reprojection().get_destination_srs()
+        spatial_resolution = self._grid.get_spatial_resolution()
+        self._tiles = _get_tiles(self._grid.get_width(), self._grid.get_height(), self._tile_size)
+        observations_factory = ObservationsFactory()
+        self._tile_observations = []
+        for tile in self._tiles:
+            tile_reprojection = Reprojection(_get_tile_bounds(self._grid.get_geo_transform(), tile),
+                                             spatial_resolution, spatial_resolution, destination_srs, destination_srs)
+            self._tile_observations.append(observations_factory.create_observations(self._file_refs,
+                                                                                     tile_reprojection))
+
+    def get_dates(self) -> List[datetime]:
+        return self._observations.dates
+
+    def _get_indices(self, indices: Optional[List[int]]) -> List[int]:
+        return list(range(len(self._post_processors))) if indices is None else indices
+
+    def process(self, start: datetime, end: datetime, indices: Optional[List[int]] = None) -> List[Optional[dict]]:
+        """
+        Processes a date pair and writes the results.
+        :param indices: The indices of the post processors that shall process the date pair. If not given, all do.
+        :return: Per post processor, the results if they are to be appended to a datacube, but no datacube has been
+        set
+        """
+        results = [None] * len(self._post_processors)
+        if self._tile_size is None:
+            observations_subset = self._observations.get_observations_subset(start, end)
+            for index in self._get_indices(indices):
+                indicator_dict = self._post_processors[index].process_observations(observations_subset)
+                results[index] = self._write_results(index, indicator_dict, start, end)
+        else:
+            if self._tiles is None:
+                self._set_up_tiles()
+            for index in self._get_indices(indices):
+                self._process_tiled(index, start, end)
+        return results
+
+    def _get_file_name(self, indicator_name: str, start: datetime, end: datetime) -> str:
+        return os.path.join(self._output_path, DOUBLE_NAME_FORMAT.format(indicator_name, _format(start),
+                                                                         _format(end)))
+
+    def supports_prefetching(self) -> bool:
+        return self._tile_size is None and \
+               all(post_processor.supports_reading_dates() for post_processor in self._post_processors)
+
+    def read_date(self, date: datetime, indices: Optional[List[int]] = None) -> List[Optional[dict]]:
+        """
+        :return: Per post processor, the data of the date, or None for post processors that are not given by indices
+        """
+        date_data = [None] * len(self._post_processors)
+        for index in self._get_indices(indices):
+            date_data[index] = self._post_processors[index].read_date(self._observations, date)
+        return date_data
+
+    def process_date_data(self, start: datetime, end: datetime, date_data: List[List[Optional[dict]]],
+                          indices: Optional[List[int]] = None):
+        """
+        Processes a date pair from data that has been read with read_date and writes the results.
+        """
+        for index in self._get_indices(indices):
+            indicator_dict = self._post_processors[index].process_date_data([data[index] for data in date_data])
+            self._write_results(index, indicator_dict, start, end)
+
+    def _submit(self, function, *args):
+        if self._async_writer is None:
+            function(*args)
+        else:
+            self._async_writer.submit(function, *args)
+
+    def _write_results(self, index: int, indicator_dict: dict, start: datetime, end: datetime) -> Optional[dict]:
+        if self._output_format == 'NetCDF':
+            if self._cube_writers[index] is None:
+                # worker processes cannot share the datacube, so the results are handed back to the parent process
+                return indicator_dict
+            if len(indicator_dict) > 0:
+                self._submit(_append_to_cube, self._cube_writers[index], indicator_dict, start, end)
+            return None
         results = []
         file_names = []
         for indicator_name in indicator_dict:
             results.append(indicator_dict[indicator_name])
-            file_names.append(os.path.join(output_path, DOUBLE_NAME_FORMAT.format(indicator_name,
-                                                                              _format(start), _format(end))))
-        _write(results, file_names, roi, spatial_resolution, roi_grid, destination_grid, output_format)
+            file_names.append(self._get_file_name(indicator_name, start, end))
+        self._written_file_names[index] = file_names
+        self._submit(_write, results, file_names, self._grid, self._output_format, self._compression,
+                     self._manifests[index], _get_unit_key(start, end))
+
+    def _process_tiled(self, index: int, start: datetime, end: datetime):
+        if self._output_format not in ['GeoTiff', 'COG']:
+            logging.warning('Writing of {} not supported. Can not write post-processing results.'.
+                            format(self._output_format))
+            return
+        post_processor = self._post_processors[index]
+        self._written_file_names[index] = []
+        scene_statistics = None
+        for observations in self._tile_observations:
+            observations_subset = observations.get_observations_subset(start, end)
+            scene_statistics = merge_statistics(scene_statistics,
+                                                post_processor.collect_scene_statistics(observations_subset))
+        writer = None
+        for tile, observations in zip(self._tiles, self._tile_observations):
+            observations_subset = observations.get_observations_subset(start, end)
+            if scene_statistics is None:
+                indicator_dict = post_processor.process_observations(observations_subset)
+            else:
+                indicator_dict = post_processor.process_observations(observations_subset, scene_statistics)
+            if len(indicator_dict) == 0:
+                continue
+            if writer is None:
+                file_names = []
+                data_types = []
+                for indicator_name in indicator_dict:
+                    file_names.append(self._get_file_name(indicator_name, start, end))
+                    data_types.append(indicator_dict[indicator_name].dtype)
+                compression = self._compression if self._output_format == 'COG' else None
+                self._written_file_names[index] = file_names
+                writer = BlockGeoTiffWriter(file_names, self._grid.get_geo_transform(), self._grid.get_projection(),
+                                            self._grid.get_width(), self._grid.get_height(), data_types, compression)
+            results = [indicator_dict[indicator_name] for indicator_name in indicator_dict]
+            writer.write_block(results, tile[0], tile[1])
+        if writer is not None:
+            writer.close()
+        if self._manifests[index] is not None:
+            self._manifests[index].record(_get_unit_key(start, end), self._written_file_names[index])
+
+
+_WORKER_EO_DATA_PAIR_PROCESSOR = None
+
+
+def _get_worker_gdal_cache_max(num_workers: int) -> int:
+    """
+    :return: The share of the GDAL block cache of this process each worker may use, but at least 16 MB
+    """
+    return max(gdal.GetCacheMax() // num_workers, 1 << 24)
+
+
+def _init_eo_data_worker(gdal_cache_max: int, *args):
+    # Workers are spawned, not forked, so they do not inherit GDAL's block cache, open datasets or locks from the
+    # parent. The parent determines their share of its cache budget, as their own budget would be GDAL's default.
+    gdal.SetCacheMax(gdal_cache_max)
+    global _WORKER_EO_DATA_PAIR_PROCESSOR
+    _WORKER_EO_DATA_PAIR_PROCESSOR = _EODataPairProcessor(*args)
+
+
+def _process_eo_data_pair_in_worker(task: Tuple[datetime, datetime, List[int]]) \
+        -> Tuple[List[Optional[dict]], List[List[str]]]:
+    indicator_dicts = _WORKER_EO_DATA_PAIR_PROCESSOR.process(*task)
+    # the written files are recorded in the manifests by the parent process, as only one process may update them
+    return indicator_dicts, _WORKER_EO_DATA_PAIR_PROCESSOR.get_written_file_names()
+
+
+def _get_unit_key(start: Union[datetime, str], end: Optional[Union[datetime, str]] = None) -> str:
+    if end is None:
+        return _format(start)
+    return '{}_{}'.format(_format(start), _format(end))
+
+
+def _get_pending_date_pairs(date_pairs: List[Tuple[datetime, datetime]], file_refs: List[FileRef],
+                            manifest: RunManifest) -> List[Tuple[datetime, datetime]]:
+    pending_date_pairs = []
+    for start, end in date_pairs:
+        input_files = [file_ref.url for file_ref in file_refs
+                       if _get_datetime(start) <= _get_datetime(file_ref.start_time) <= _get_datetime(end)]
+        if not manifest.is_up_to_date(_get_unit_key(start, end), input_files):
+            pending_date_pairs.append((start, end))
+    return pending_date_pairs
+
+
+def _get_date_pair_tasks(date_pairs: List[Tuple[datetime, datetime]], file_refs: List[FileRef],
+                         post_processors: List[EODataPostProcessor], manifests: List[Optional[RunManifest]]) \
+        -> List[Tuple[datetime, datetime, List[int]]]:
+    """
+    :return: The date pairs along with the indices of the post processors that need to process them
+    """
+    pending_date_pairs = []
+    for post_processor, manifest in zip(post_processors, manifests):
+        if manifest is None:
+            pending_date_pairs.append(set(date_pairs))
+            continue
+        pending_date_pairs.append(set(_get_pending_date_pairs(date_pairs, file_refs, manifest)))
+        logging.getLogger().info(f'Skipping {len(date_pairs) - len(pending_date_pairs[-1])} of {len(date_pairs)} '
+                                 f'date pairs of post processor {post_processor.get_name()}, as their results are up '
+                                 f'to date.')
+    tasks = []
+    for start, end in date_pairs:
+        indices = [index for index in range(len(post_processors)) if (start, end) in pending_date_pairs[index]]
+        if len(indices) > 0:
+            tasks.append((start, end, indices))
+    return tasks
+
+
+def _get_chunk_size(num_date_pairs: int, num_workers: int) -> int:
+    # consecutive date pairs are handed to the same worker, so it can reuse the data of the date they share,
+    # while each worker still gets several chunks to balance the load
+    return max(1, num_date_pairs // (num_workers * 4))
+
+
+def _get_post_processor_names(post_processors: List[PostProcessor]) -> str:
+    return ', '.join(post_processor.get_name() for post_processor in post_processors)
+
+
+def _run_eo_data_post_processors(post_processors: List[EODataPostProcessor], data_path: str, output_path: str,
+                                 roi: Union[str, Polygon], spatial_resolution: int, roi_grid: Optional[str],
+                                 destination_grid: Optional[str], output_format: Optional[str] = 'GeoTiff',
+                                 tile_size: Optional[int] = None, workers: int = 1, prefetch_depth: int = 1,
+                                 prefetch_memory: Optional[int] = None, write_threads: int = 1,
+                                 compression: str = 'DEFLATE', manifests: Optional[List[Optional[RunManifest]]] = None):
+    """
+    Runs EO data post processors that support the same EO data types. The input data is found and the observations
+    are set up only once, and each date pair is processed by all post processors before the next one, so that bands
+    required by several post processors are read only once.
+    """
+    if manifests is None:
+        manifests = [None] * len(post_processors)
+    supported_eo_data_types = post_processors[0].get_names_of_supported_eo_data_types()
+    file_refs = get_valid_files(data_path, supported_eo_data_types)
+    grid = DestinationGrid(spatial_resolution, roi, roi_grid, destination_grid)
+    if workers > 1:
+        # derive the grid before it is handed to the workers, so they need not derive it again
+        grid.get_geo_transform()
+    pair_processor_args = (post_processors, file_refs, output_path, grid, output_format, tile_size, compression)
+    pair_processor = _EODataPairProcessor(*pair_processor_args)
+    dates = pair_processor.get_dates()
+    if len(dates) < 2:
+        logging.getLogger().info(f'Not enough observations found. '
+                                 f'Can not conduct post processing for {_get_post_processor_names(post_processors)}')
+        return
+    date_pairs = [(dates[i], dates[i + 1]) for i in range(len(dates) - 1)]
+    tasks = _get_date_pair_tasks(date_pairs, file_refs, post_processors, manifests)
+    if len(tasks) == 0:
+        return
+    cube_writers = [None] * len(post_processors)
+    try:
+        if output_format == 'NetCDF' and tile_size is None:
+            for index, post_processor in enumerate(post_processors):
+                cube_writers[index] = _create_cube_writer(output_path, post_processor.get_name(), grid)
+            # time steps must be appended in order, so a single thread writes to the datacubes
+            write_threads = min(write_threads, 1)
+        if workers <= 1 or len(tasks) == 1:
+            pair_processor.set_cube_writers(cube_writers)
+            pair_processor.set_manifests(manifests)
+            with AsyncWriter(write_threads) as async_writer:
+                pair_processor.set_async_writer(async_writer)
+                if prefetch_depth > 0 and pair_processor.supports_prefetching():
+                    _process_eo_data_pairs_with_prefetching(pair_processor, tasks, prefetch_depth, prefetch_memory,
+                                                            _get_post_processor_names(post_processors))
+                    return
+                for i, task in enumerate(tasks):
+                    component_progress_logger.info(f'{int((i / len(tasks)) * 100)}')
+                    pair_processor.process(*task)
+            return
+        num_workers = min(workers, len(tasks))
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(num_workers, initializer=_init_eo_data_worker,
+                          initargs=(_get_worker_gdal_cache_max(num_workers),) + pair_processor_args) as pool:
+            # results are returned in the order of the date pairs, so progress is reported the same way as in serial
+            # runs and results are appended to the datacubes in order
+            component_progress_logger.info('0')
+            chunk_size = _get_chunk_size(len(tasks), num_workers)
+            results = pool.imap(_process_eo_data_pair_in_worker, tasks, chunk_size)
+            for i, (indicator_dicts, file_names) in enumerate(results):
+                start, end, indices = tasks[i]
+                for index in indices:
+                    indicator_dict = indicator_dicts[index]
+                    if cube_writers[index] is not None and indicator_dict is not None and len(indicator_dict) > 0:
+                        _append_to_cube(cube_writers[index], indicator_dict, start, end)
+                    if manifests[index] is not None:
+                        manifests[index].record(_get_unit_key(start, end), file_names[index])
+                if i + 1 < len(tasks):
+                    component_progress_logger.info(f'{int(((i + 1) / len(tasks)) * 100)}')
+    finally:
+        for cube_writer in cube_writers:
+            if cube_writer is not None:
+                cube_writer.close()
+
+
+def _process_eo_data_pairs_with_prefetching(pair_processor: _EODataPairProcessor,
+                                            tasks: List[Tuple[datetime, datetime, List[int]]], prefetch_depth: int,
+                                            prefetch_memory: Optional[int], post_processor_names: str):
+    """
+    Processes date pairs while the inputs of upcoming dates are read in a background thread. Each date is read only
+    once and handed over to both pairs it belongs to. Besides the two dates being processed, at most prefetch_depth
+    dates are held in memory. Date pairs need not be consecutive, e.g., when up-to-date pairs are skipped.
+    :param tasks: The date pairs along with the indices of the post processors that process them
+    """
+    date_arguments = []
+    for start, end, indices in tasks:
+        if len(date_arguments) == 0 or date_arguments[-1][0] != start:
+            date_arguments.append((start, list(indices)))
+        else:
+            # the date has been added as end of the previous pair
+            date_arguments[-1][1].extend(index for index in indices if index not in date_arguments[-1][1])
+        date_arguments.append((end, list(indices)))
+    max_bytes = None if prefetch_memory is None else prefetch_memory * 1024 * 1024
+    # dates read ahead are cached as well, so they must not evict the dates being processed
+    pair_processor.set_num_cached_dates(_NUM_CACHED_DATES + prefetch_depth)
+    with Prefetcher(pair_processor.read_date, date_arguments, prefetch_depth, max_bytes) as prefetcher:
+        date_data = iter(prefetcher)
+        previous_date = None
+        previous_data = None
+        for i, (start, end, indices) in enumerate(tasks):
+            component_progress_logger.info(f'{int((i / len(tasks)) * 100)}')
+            if start != previous_date:
+                previous_data = next(date_data)
+            data = next(date_data)
+            pair_processor.process_date_data(start, end, [previous_data, data], indices)
+            previous_date = end
+            previous_data = data
+    logging.getLogger().info(f'Time post processors {post_processor_names} waited for input: '
+                             f'{prefetcher.get_wait_time():.1f} s')
 
 
 def _format(time: Union[datetime, str]):
     """
     Output: yyyymmdd
     """
+    return _get_datetime(time).strftime('%Y%m%d')
+
+
+def _get_datetime(time: Union[datetime, str]) -> datetime:
     if type(time) == str:
         time = get_time_from_string(time)
-    return time.strftime('%Y%m%d')
-
-
-def _run_variable_post_processor(post_processor: VariablePostProcessor, data_path: str, output_path: str,
-                                 variable_names: List[str], roi: Union[str, Polygon], spatial_resolution: int,
-                                 roi_grid: Optional[str], destination_grid: Optional[str],
-                                 output_format: Optional[str] = 'GeoTiff'):
-    file_refs = get_valid_files(data_path, variable_names)
-    file_ref_groups = _group_file_refs_by_date(file_refs)
-    reprojection = _get_reprojection(spatial_resolution, roi, roi_grid, destination_grid)
-    for i, date in enumerate(file_ref_groups):
-        component_progress_logger.info(f'{int((i / (len(file_ref_groups.keys()))) * 100)}')
-        data_files = {}
-        file_refs_for_date = file_ref_groups[date]
-        for variable_name in variable_names:
-            for file_ref in file_refs_for_date:
-                if is_valid(file_ref.url, variable_name):
-                    data_files[variable_name] = file_ref.url
-                    break
-        variable_data = {}
-        for variable_name in data_files:
-            dataset = gdal.Open(data_files[variable_name])
-            reprojected_data_set = reprojection.reproject(dataset)
-            variable_data[variable_name] = reprojected_data_set.GetRasterBand(1).ReadAsArray()
-        indicator_dict = post_processor.process_variables(variable_data)
-        results = []
-        file_names = []
-        for indicator_name in indicator_dict:
-            results.append(indicator_dict[indicator_name])
-            file_names.append(os.path.join(output_path, SINGLE_NAME_FORMAT.format(indicator_name, _format(date))))
-        _write(results, file_names, roi, spatial_resolution, roi_grid, destination_grid, output_format)
+    return time
+
+
+def _create_cube_writer(output_path: str, post_processor_name: str, grid: DestinationGrid) -> DataCubeWriter:
+    return DataCubeWriter(os.path.join(output_path, CUBE_NAME_FORMAT.format(post_processor_name)),
+                          grid.get_geo_transform(), grid.get_projection(), grid.get_width(), grid.get_height())
+
+
+def _append_to_cube(cube_writer: DataCubeWriter, indicator_dict: dict, start: Union[datetime, str],
+                    end: Optional[Union[datetime, str]] = None):
+    """
+    Appends results to a datacube. Results of date pairs are assigned to the end date of the pair.
+    """
+    if end is None:
+        cube_writer.append(_get_datetime(start), indicator_dict)
+    else:
+        cube_writer.append(_get_datetime(end), indicator_dict, (_get_datetime(start), _get_datetime(end)))
+
+
+def _run_variable_post_processors(post_processors: List[VariablePostProcessor], data_path: str, output_path: str,
+                                  variable_names: List[str], roi: Union[str, Polygon], spatial_resolution: int,
+                                  roi_grid: Optional[str], destination_grid: Optional[str],
+                                  output_format: Optional[str] = 'GeoTiff', workers: int = 1, write_threads: int = 1,
+                                  compression: str = 'DEFLATE',
+                                  manifests: Optional[List[Optional[RunManifest]]] = None):
+    """
+    Runs variable post processors on the same variables. The variables of each date are read only once and handed to
+    all post processors that need to process the date.
+    """
+    if manifests is None:
+        manifests = [None] * len(post_processors)
+    grid = DestinationGrid(spatial_resolution, roi, roi_grid, destination_grid)
+    if _is_data_cube(data_path):
+        data_cube_reader = DataCubeReader(data_path, variable_names)
+        dates = data_cube_reader.get_dates()
+        # the time steps of a datacube cannot be told apart, so all of them depend on the whole datacube
+        date_indices = _get_pending_date_indices(dates, [[data_path]] * len(dates), post_processors, manifests)
+        dates = [dates[index] for index in date_indices]
+        variable_data_per_date = _read_data_cube(data_cube_reader, grid, workers, list(date_indices.keys()))
+    else:
+        data_cube_reader = None
+        file_refs = get_valid_files(data_path, variable_names)
+        file_ref_groups = _group_file_refs_by_date(file_refs)
+        dates = list(file_ref_groups.keys())
+        data_files_per_date = [_get_data_files(file_ref_groups[date], variable_names) for date in dates]
+        date_indices = _get_pending_date_indices(dates, [list(data_files.values()) for data_files in
+                                                         data_files_per_date], post_processors, manifests)
+        dates = [dates[index] for index in date_indices]
+        data_files_per_date = [data_files_per_date[index] for index in date_indices]
+        if workers <= 1:
+            variable_data_per_date = (_read_variables(data_files, grid) for data_files in data_files_per_date)
+        else:
+            # derive the grid before it is shared among the reading threads
+            grid.get_geo_transform()
+            variable_data_per_date = _read_variables_ahead(data_files_per_date, grid, workers)
+    post_processor_indices_per_date = list(date_indices.values())
+    cube_writers = [None] * len(post_processors)
+    try:
+        if output_format == 'NetCDF':
+            for index, post_processor in enumerate(post_processors):
+                cube_writers[index] = _create_cube_writer(output_path, post_processor.get_name(), grid)
+            # time steps must be appended in order, so a single thread writes to the datacubes
+            write_threads = min(write_threads, 1)
+        with AsyncWriter(write_threads) as async_writer:
+            for i, (date, variable_data) in enumerate(zip(dates, variable_data_per_date)):
+                component_progress_logger.info(f'{int((i / (len(dates))) * 100)}')
+                post_processor_indices = post_processor_indices_per_date[i]
+                for j, index in enumerate(post_processor_indices):
+                    if j < len(post_processor_indices) - 1:
+                        # post processors may alter the variables they get, so all but the last one get copies
+                        indicator_dict = post_processors[index].process_variables(_copy_variable_data(variable_data))
+                    else:
+                        indicator_dict = post_processors[index].process_variables(variable_data)
+                    if cube_writers[index] is not None:
+                        if len(indicator_dict) > 0:
+                            async_writer.submit(_append_to_cube, cube_writers[index], indicator_dict, date)
+                        continue
+                    results = []
+                    file_names = []
+                    for indicator_name in indicator_dict:
+                        results.append(indicator_dict[indicator_name])
+                        file_names.append(os.path.join(output_path, SINGLE_NAME_FORMAT.format(indicator_name,
+                                                                                              _format(date))))
+                    async_writer.submit(_write, results, file_names, grid, output_format, compression,
+                                        manifests[index], _get_unit_key(date))
+    finally:
+        # stops reading ahead before the inputs are closed
+        variable_data_per_date.close()
+        for cube_writer in cube_writers:
+            if cube_writer is not None:
+                cube_writer.close()
+        if data_cube_reader is not None:
+            data_cube_reader.close()
+
+
+def _copy_variable_data(variable_data: dict) -> dict:
+    return {variable_name: np.copy(variable_data[variable_name]) for variable_name in variable_data}
+
+
+def _get_pending_date_indices(dates: List[Union[datetime, str]], input_files_per_date: List[List[str]],
+                              post_processors: List[PostProcessor], manifests: List[Optional[RunManifest]]) \
+        -> dict:
+    """
+    :return: The indices of the dates that need to be processed, mapped to the indices of the post processors that
+    need to process them
+    """
+    date_indices = OrderedDict()
+    for index, (post_processor, manifest) in enumerate(zip(post_processors, manifests)):
+        num_pending_dates = 0
+        for date_index, (date, input_files) in enumerate(zip(dates, input_files_per_date)):
+            if manifest is None or not manifest.is_up_to_date(_get_unit_key(date), input_files):
+                if date_index not in date_indices:
+                    date_indices[date_index] = []
+                date_indices[date_index].append(index)
+                num_pending_dates += 1
+        if manifest is not None:
+            logging.getLogger().info(f'Skipping {len(dates) - num_pending_dates} of {len(dates)} dates of post '
+                                     f'processor {post_processor.get_name()}, as their results are up to date.')
+    return OrderedDict(sorted(date_indices.items()))
+
+
+def _is_data_cube(data_path: str) -> bool:
+    return os.path.isfile(data_path) and os.path.splitext(data_path)[1] in DATA_CUBE_EXTENSIONS
+
+
+def _get_data_cube_window(data_cube_reader: DataCubeReader, grid: DestinationGrid) \
+        -> Optional[Tuple[int, int, int, int]]:
+    """
+    :return: The window of the datacube that covers the grid, including a margin of one pixel, or None if the window
+    cannot be determined because the datacube is given in another projection than the grid
+    """
+    if data_cube_reader.get_projection() is None:
+        return None
+    data_cube_srs = osr.SpatialReference()
+    data_cube_srs.ImportFromWkt(data_cube_reader.get_projection())
+    grid_srs = osr.SpatialReference()
+    grid_srs.ImportFromWkt(grid.get_projection())
+    if not data_cube_srs.IsSame(grid_srs):
+        return None
+    geo_transform = data_cube_reader.get_geo_transform()
+    min_x, min_y, max_x, max_y = grid.get_bounds()
+    x_start = max(int(np.floor((min_x - geo_transform[0]) / geo_transform[1])) - 1, 0)
+    x_end = min(int(np.ceil((max_x - geo_transform[0]) / geo_transform[1])) + 1, data_cube_reader.get_width())
+    y_start = max(int(np.floor((max_y - geo_transform[3]) / geo_transform[5])) - 1, 0)
+    y_end = min(int(np.ceil((min_y - geo_transform[3]) / geo_transform[5])) + 1, data_cube_reader.get_height())
+    if x_end <= x_start or y_end <= y_start:
+        raise ValueError('Datacube does not cover the region of interest.')
+    return x_start, y_start, x_end - x_start, y_end - y_start
+
+
+def _warp_array(data: np.array, geo_transform: tuple, projection: str, grid: DestinationGrid) -> np.array:
+    height, width = data.shape
+    data_set = gdal.GetDriverByName('MEM').Create('', width, height, 1, _get_gdal_data_type(data.dtype))
+    data_set.SetGeoTransform(geo_transform)
+    data_set.SetProjection(projection)
+    data_set.GetRasterBand(1).WriteArray(data)
+    warped_data_set = gdal.Warp('', data_set, format='MEM', outputBounds=grid.get_bounds(), width=grid.get_width(),
+                                height=grid.get_height(), dstSRS=grid.get_projection())
+    warped_data = warped_data_set.GetRasterBand(1).ReadAsArray()
+    warped_data_set = None
+    data_set = None
+    return warped_data
+
+
+def _read_data_cube(data_cube_reader: DataCubeReader, grid: DestinationGrid, workers: int = 1,
+                    indices: Optional[List[int]] = None) -> Iterator[dict]:
+    """
+    Reads the variables of a datacube time step by time step and warps them to the grid. If the datacube is given in
+    the projection of the grid, only the window covering the grid is read. With more than one worker, the upcoming
+    time steps are read in the background while the current one is processed. If indices are given, only these time
+    steps are read.
+    """
+    window = _get_data_cube_window(data_cube_reader, grid)
+    geo_transform = data_cube_reader.get_geo_transform()
+    if window is not None:
+        geo_transform = (geo_transform[0] + window[0] * geo_transform[1], geo_transform[1], 0.,
+                         geo_transform[3] + window[1] * geo_transform[5], 0., geo_transform[5])
+    projection = data_cube_reader.get_projection()
+    if projection is None:
+        wgs84_srs = osr.SpatialReference()
+        wgs84_srs.ImportFromEPSG(4326)
+        projection = wgs84_srs.ExportToWkt()
+
+    def _read_time_step(index: int) -> dict:
+        variable_data = data_cube_reader.read(index, window)
+        for variable_name in variable_data:
+            variable_data[variable_name] = _warp_array(variable_data[variable_name], geo_transform, projection, grid)
+        return variable_data
+
+    if indices is None:
+        indices = range(len(data_cube_reader.get_dates()))
+    arguments = [(index,) for index in indices]
+    if workers <= 1:
+        for argument in arguments:
+            yield _read_time_step(*argument)
+        return
+    # a single background thread reads, as the datacube must not be accessed concurrently
+    with Prefetcher(_read_time_step, arguments, queue_depth=workers) as prefetcher:
+        for variable_data in prefetcher:
+            yield variable_data
+
+
+def _get_data_files(file_refs_for_date: List[FileRef], variable_names: List[str]) -> dict:
+    data_files = {}
+    for variable_name in variable_names:
+        for file_ref in file_refs_for_date:
+            if is_valid(file_ref.url, variable_name):
+                data_files[variable_name] = file_ref.url
+                break
+    return data_files
+
+
+def _read_variable(data_file: str, grid: DestinationGrid) -> np.array:
+    """
+    Reads a variable in the destination grid. Instead of warping the full input into memory, a warped VRT is set up
+    that covers only the grid, so that only the input blocks intersecting the region of interest are read and
+    warped. The VRT is read in windows aligned to its blocks. Datasets are closed right after reading.
+    """
+    dataset = gdal.Open(data_file)
+    warped_data_set = gdal.Warp('', dataset, format='VRT', outputBounds=grid.get_bounds(), width=grid.get_width(),
+                                height=grid.get_height(), dstSRS=grid.get_projection())
+    band = warped_data_set.GetRasterBand(1)
+    block_width, block_height = band.GetBlockSize()
+    data = None
+    for y_offset in range(0, grid.get_height(), block_height):
+        for x_offset in range(0, grid.get_width(), block_width):
+            window_width = min(block_width, grid.get_width() - x_offset)
+            window_height = min(block_height, grid.get_height() - y_offset)
+            window = band.ReadAsArray(x_offset, y_offset, window_width, window_height)
+            if data is None:
+                data = np.empty((grid.get_height(), grid.get_width()), dtype=window.dtype)
+            data[y_offset:y_offset + window_height, x_offset:x_offset + window_width] = window
+    band = None
+    warped_data_set = None
+    dataset = None
+    return data
+
+
+def _read_variables(data_files: dict, grid: DestinationGrid) -> dict:
+    variable_data = {}
+    for variable_name in data_files:
+        variable_data[variable_name] = _read_variable(data_files[variable_name], grid)
+    return variable_data
+
+
+def _read_variables_ahead(data_files_per_date: List[dict], grid: DestinationGrid, workers: int) \
+        -> Iterator[dict]:
+    """
+    Reads the variables of upcoming dates in a thread pool while the variables of the current date are processed.
+    GDAL releases the GIL while reading and warping, so all variables of up to 'workers' dates are read concurrently.
+    No further reads are started before a date has been handed out, so at most workers + 1 dates are held in memory.
+    """
+    with ThreadPoolExecutor(workers) as executor:
+        pending_dates = deque()
+        next_date_index = 0
+        while next_date_index < len(data_files_per_date) or len(pending_dates) > 0:
+            while next_date_index < len(data_files_per_date) and len(pending_dates) < workers:
+                data_files = data_files_per_date[next_date_index]
+                futures = {}
+                for variable_name in data_files:
+                    futures[variable_name] = executor.submit(_read_variable, data_files[variable_name], grid)
+                pending_dates.append(futures)
+                next_date_index += 1
+            futures = pending_dates.popleft()
+            yield {variable_name: futures[variable_name].result() for variable_name in futures}
 
 
 def _group_file_refs_by_date(file_refs: List[FileRef]) -> dict:
@@ -274,21 +1082,25 @@ def _group_file_refs_by_date(file_refs: List[FileRef]) -> dict:
     return file_ref_groups
 
 
-def _write(indicators: List[np.array], file_names: List[str], roi: Union[str, Polygon], spatial_resolution: int,
-           roi_grid: Optional[str], destination_grid: Optional[str], output_format: Optional[str] = 'GeoTiff'):
-    reprojection = _get_reprojection(spatial_resolution, roi, roi_grid, destination_grid)
+def _write(indicators: List[np.array], file_names: List[str], grid: DestinationGrid,
+           output_format: Optional[str] = 'GeoTiff', compression: str = 'DEFLATE',
+           manifest: Optional[RunManifest] = None, unit_key: Optional[str] = None):
+    """
+    Writes results. If a manifest is given, the results are recorded in it under the unit key once they have been
+    written.
+    """
     if output_format == 'GeoTiff':
-        reprojected_data_set = reprojection.reproject(_get_dummy_data_set())
-        width = reprojected_data_set.RasterXSize
-        height = reprojected_data_set.RasterYSize
-        geo_transform = reprojected_data_set.GetGeoTransform()
-        srs = reprojection.get_destination_srs()
-        projection = srs.ExportToWkt()
-        writer = GeoTiffWriter(file_names, geo_transform, projection, width, height, None, None)
+        writer = GeoTiffWriter(file_names, grid.get_geo_transform(), grid.get_projection(), grid.get_width(),
+                               grid.get_height(), None, None)
         writer.write(indicators)
         writer.close()
+    elif output_format == 'COG':
+        write_cogs(indicators, file_names, grid.get_geo_transform(), grid.get_projection(), compression)
     else:
         logging.warning('Writing of {} not supported. Can not write post-processing results.'.format(output_format))
+        return
+    if manifest is not None:
+        manifest.record(unit_key, file_names)
 
 
 if __name__ == '__main__':
@@ -297,7 +1109,10 @@ if __name__ == '__main__':
     parser.add_argument("-i", "--input_path", help="The directory where the input data is located.", required=True)
     parser.add_argument("-o", "--output_path", help="The output directory to which the output file shall be "
                                                     "written.", required=True)
-    parser.add_argument("-f", "--format", help="The output format (default is GeoTiff).")
+    parser.add_argument("-f", "--format", help="The output format, either GeoTiff, COG or NetCDF (default is "
+                                               "GeoTiff).")
+    parser.add_argument("-c", "--compression", help="The compression of COG output, one of DEFLATE, ZSTD, LZW or NONE "
+                                                    "(default is DEFLATE).")
     parser.add_argument("-roi", "--roi", help="The region of interest describing the area to be retrieved. Not "
                                               "required if 'state_mask' is given.")
     parser.add_argument("-res", "--spatial_resolution", help="The spatial resolution of the destination grid. "
@@ -310,11 +1125,22 @@ if __name__ == '__main__':
                                                           "the output shall be given, either as EPSG-code or as WKT "
                                                           "representation. If not given, the output is given in the "
                                                           "grid defined by the 'state_mask'.")
+    parser.add_argument("-ts", "--tile_size", help="If given, EO data post processors process the destination grid "
+                                                   "in tiles of at most this size x this size pixels.")
+    parser.add_argument("-inc", "--incremental", action='store_true', help="Skips dates whose results are up to "
+                                                                           "date.")
     args = parser.parse_args()
     if args.format is None:
         output_format = 'GeoTiff'
     else:
         output_format = args.format
+    compression = 'DEFLATE'
+    if args.compression is not None:
+        compression = args.compression
+    tile_size = None
+    if args.tile_size is not None:
+        tile_size = int(args.tile_size)
     run_post_processor(name=args.name, data_path=args.input_path, output_path=args.output_path,
                        output_format=output_format, roi=args.roi, spatial_resolution=int(args.spatial_resolution),
-                       roi_grid=args.roi_grid, destination_grid=args.destination_grid)
+                       roi_grid=args.roi_grid, destination_grid=args.destination_grid, tile_size=tile_size,
+                       compression=compression, incremental=args.incremental)
@@ -2,10 +2,15 @@ import logging
 
 from abc import abstractmethod, ABCMeta
 from enum import Enum
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
 
-from multiply_core.observations import ObservationsWrapper
 from multiply_core.variables import Variable
+from multiply_post_processing.caching import DateCache
+from multiply_post_processing.scratch import ScratchSpace
+
+if TYPE_CHECKING:
+    # the observations are only imported by the post processing, as importing them requires gdal
+    from multiply_core.observations import ObservationsWrapper
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
@@ -38,6 +43,8 @@ class PostProcessor(metaclass=ABCMeta):
         else:
             for indicator_description in indicator_descriptions:
                 self.indicators.append(indicator_description.short_name)
+        self._scratch_space = ScratchSpace()
+        self._num_workers = 1
 
     def get_actual_indicators(self) -> List[Variable]:
         """
@@ -45,6 +52,34 @@ class PostProcessor(metaclass=ABCMeta):
         """
         return self.indicators
 
+    def set_parameters(self, parameters: dict):
+        """
+        Sets parameters that configure how the post processing is performed. Post processors that can be configured
+        must override this.
+        :param parameters: A dictionary mapping parameter names to their values.
+        """
+        for parameter_name in parameters:
+            logging.info(f'Parameter {parameter_name} is not supported by post processor {self.get_name()}.')
+
+    def set_scratch_space(self, scratch_space: ScratchSpace):
+        """
+        Sets the scratch space in which large intermediate and output arrays are allocated. By default, all arrays
+        are held in memory. Post processors that allocate large arrays should do so using the scratch space.
+        """
+        self._scratch_space = scratch_space
+
+    def get_scratch_space(self) -> ScratchSpace:
+        return self._scratch_space
+
+    def set_num_workers(self, num_workers: int):
+        """
+        Sets the number of processes the post processor may use. This is its share of the worker budget of the run
+        (default 1). Post processors that start processes of their own must not start more.
+        """
+        self._num_workers = max(num_workers, 1)
+
+    def get_num_workers(self) -> int:
+        return self._num_workers
 
     @classmethod
     @abstractmethod
@@ -100,6 +135,18 @@ class VariablePostProcessor(PostProcessor):
 class EODataPostProcessor(PostProcessor):
     """A base class for post processors that work on measurements from EO Data."""
 
+    def __init__(self, indicator_names: List[str]):
+        super().__init__(indicator_names)
+        self._date_cache = None
+
+    def set_date_cache(self, date_cache: Optional[DateCache]):
+        """
+        Sets a cache in which data read or derived for a date may be held, so that it can be reused when the date is
+        part of the next pair of observations. Data is cached by date, so a cache is only set when all observations
+        passed to the post processor cover the same area. Post processors that read dates individually should use it.
+        """
+        self._date_cache = date_cache
+
     @classmethod
     def get_type(cls) -> PostProcessorType:
         return PostProcessorType.EO_DATA_POST_PROCESSOR
@@ -119,13 +166,55 @@ class EODataPostProcessor(PostProcessor):
         expected to be passed in the order given by this list.+ get_names_
         """
 
+    def collect_scene_statistics(self, observations: 'ObservationsWrapper') -> Optional[dict]:
+        """
+        Collects statistics over the observations which the post processing depends on. When a scene is processed
+        block by block, this is called for each block first. The statistics of all blocks are merged and then passed
+        to process_observations. Post processors that require statistics over the whole scene must override this.
+        :param observations: A Wrapper around earth observation data. May cover only a block of the scene.
+        :return: A dictionary of online reductions (see multiply_post_processing.reductions) or None, if the post
+        processing does not depend on scene statistics.
+        """
+        return None
+
     @abstractmethod
-    def process_observations(self, observations: ObservationsWrapper) -> dict:
+    def process_observations(self, observations: 'ObservationsWrapper', scene_statistics: Optional[dict] = None) \
+            -> dict:
         """
         Performs the post processing
         :param observations: A Wrapper around earth observation data. Provides a convenience method to access EO Data.
+        :param scene_statistics: Statistics over the whole scene as collected by collect_scene_statistics. If not
+        given, post processors that require them derive them from the passed observations.
+        :return: The result of the post processing
+        """
+
+    def supports_reading_dates(self) -> bool:
+        """
+        :return: True, if the post processor implements read_date and process_date_data. The inputs of upcoming dates
+        can then be read in the background while the current dates are processed, and each date is read only once.
+        """
+        return False
+
+    def read_date(self, observations: 'ObservationsWrapper', date: str) -> dict:
+        """
+        Reads the data of a single date which process_date_data requires. Post processors that support this must
+        override it along with process_date_data and supports_reading_dates. It may be called from a thread other
+        than the one processing the data.
+        :param observations: A Wrapper around earth observation data.
+        :param date: The date for which the data shall be read
+        :return: A dictionary with the data of the date
+        """
+        raise NotImplementedError(f'Post processor {self.get_name()} does not support reading single dates.')
+
+    def process_date_data(self, date_data: List[dict], scene_statistics: Optional[dict] = None) -> dict:
+        """
+        Performs the post processing on data that has been read with read_date.
+        :param date_data: The data of consecutive dates, one dictionary per time step
+        :param scene_statistics: Statistics over the whole scene as collected by collect_scene_statistics. If not
+        given, post processors that require them derive them from the passed data.
         :return: The result of the post processing
         """
+        raise NotImplementedError(f'Post processor {self.get_name()} does not support reading single dates.')
 
 
 class PostProcessorCreator(metaclass=ABCMeta):
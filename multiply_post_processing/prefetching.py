@@ -0,0 +1,106 @@
+import threading
+import time
+
+from collections import deque
+from typing import Any, Callable, Iterator, List, Optional
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+
+def _get_size(value: Any) -> int:
+    """
+    :return: The number of bytes held by the numpy arrays in the value, which may also be a dictionary or a list.
+    """
+    if isinstance(value, dict):
+        return sum(_get_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_get_size(item) for item in value)
+    return getattr(value, 'nbytes', 0)
+
+
+class Prefetcher(object):
+    """
+    Calls a function for a sequence of arguments in a background thread, so that the results are loaded while the
+    consumer works on previous ones. Results are handed out in the order of the arguments. At most queue_depth results
+    are held ahead of the consumer. If max_bytes is given, no further result is loaded while the results held ahead
+    exceed it. The time the consumer spends waiting for results is recorded.
+    """
+
+    def __init__(self, function: Callable, arguments: List[tuple], queue_depth: int = 1,
+                 max_bytes: Optional[int] = None):
+        if queue_depth < 1:
+            raise ValueError('Queue depth must be at least 1, but is {}.'.format(queue_depth))
+        self._function = function
+        self._arguments = arguments
+        self._queue_depth = queue_depth
+        self._max_bytes = max_bytes
+        self._results = deque()
+        self._num_bytes = 0
+        self._closed = False
+        self._wait_time = 0.
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._load, daemon=True)
+        self._thread.start()
+
+    def _is_full(self) -> bool:
+        if len(self._results) >= self._queue_depth:
+            return True
+        return self._max_bytes is not None and len(self._results) > 0 and self._num_bytes >= self._max_bytes
+
+    def _load(self):
+        for arguments in self._arguments:
+            with self._condition:
+                while self._is_full() and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+            try:
+                result = self._function(*arguments)
+                error = None
+            except BaseException as e:
+                result = None
+                error = e
+            size = _get_size(result)
+            with self._condition:
+                self._results.append((result, error, size))
+                self._num_bytes += size
+                self._condition.notify_all()
+            if error is not None:
+                return
+
+    def __iter__(self) -> Iterator[Any]:
+        for _ in range(len(self._arguments)):
+            start_time = time.perf_counter()
+            with self._condition:
+                while len(self._results) == 0:
+                    self._condition.wait()
+                result, error, size = self._results.popleft()
+                self._num_bytes -= size
+                self._condition.notify_all()
+            self._wait_time += time.perf_counter() - start_time
+            if error is not None:
+                raise error
+            yield result
+
+    def get_wait_time(self) -> float:
+        """
+        :return: The time in seconds the consumer has waited for results so far
+        """
+        return self._wait_time
+
+    def close(self):
+        """
+        Stops loading further results and waits for the background thread to finish.
+        """
+        with self._condition:
+            self._closed = True
+            self._results.clear()
+            self._num_bytes = 0
+            self._condition.notify_all()
+        self._thread.join()
+
+    def __enter__(self) -> 'Prefetcher':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,65 @@
+import numpy as np
+
+from typing import Optional
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+
+class MaskedMean(object):
+    """
+    An online reduction that determines the mean over all values not equal to a no data value. It can be updated
+    block by block and instances that have been updated on different blocks can be merged, so the mean of a scene can
+    be derived without ever holding the full scene in memory.
+    """
+
+    def __init__(self, no_data: float):
+        self._no_data = no_data
+        self._sum = 0.0
+        self._count = 0
+
+    def update(self, array: np.array):
+        valid = array != self._no_data
+        self._sum += np.sum(array[valid], dtype=np.float64)
+        self._count += int(np.count_nonzero(valid))
+
+    def add(self, value_sum: float, count: int):
+        """
+        Adds the sum and the number of valid values that have been determined elsewhere.
+        """
+        self._sum += value_sum
+        self._count += count
+
+    def merge(self, other: 'MaskedMean'):
+        if other._no_data != self._no_data:
+            raise ValueError('Cannot merge means with different no data values {} and {}'.
+                             format(self._no_data, other._no_data))
+        self._sum += other._sum
+        self._count += other._count
+
+    def get_count(self) -> int:
+        return self._count
+
+    def get_mean(self) -> float:
+        """
+        :return: The mean of all valid values encountered so far, or the no data value if there were none.
+        """
+        if self._count == 0:
+            return self._no_data
+        return self._sum / self._count
+
+
+def merge_statistics(statistics: Optional[dict], other_statistics: Optional[dict]) -> Optional[dict]:
+    """
+    Merges two dictionaries of online reductions. Reductions of the same name are merged into the first dictionary.
+    :return: The merged dictionary
+    """
+    if statistics is None:
+        return other_statistics
+    if other_statistics is None:
+        return statistics
+    for name in other_statistics:
+        if name in statistics:
+            statistics[name].merge(other_statistics[name])
+        else:
+            statistics[name] = other_statistics[name]
+    return statistics
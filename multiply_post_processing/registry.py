@@ -0,0 +1,185 @@
+"""
+Keeps track of the post processor creators. Creators that are registered as entry points of the group
+'post_processor_creators' are discovered when the registry is first used, so that importing the post processing does
+not require scanning the installed packages.
+"""
+import threading
+
+from collections import OrderedDict
+from multiply_core.variables import Variable
+from typing import List, Optional
+
+from multiply_post_processing.post_processor import PostProcessor, PostProcessorCreator
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+POST_PROCESSOR_CREATOR_REGISTRY = []
+ENTRY_POINT_GROUP = 'post_processor_creators'
+_registered_post_processor_creators_loaded = False
+_post_processor_catalog = None
+_lock = threading.Lock()
+
+
+def _get_entry_points(group: str) -> list:
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python < 3.8
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            import pkg_resources
+            return list(pkg_resources.iter_entry_points(group))
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, 'select'):
+        return list(all_entry_points.select(group=group))
+    return list(all_entry_points.get(group, []))
+
+
+def _load_registered_post_processor_creators():
+    global _registered_post_processor_creators_loaded
+    if _registered_post_processor_creators_loaded:
+        return
+    with _lock:
+        if not _registered_post_processor_creators_loaded:
+            registered_post_processor_creators = [entry_point.load() for entry_point in
+                                                  _get_entry_points(ENTRY_POINT_GROUP)]
+            # registered creators come first, as they did when they were loaded on import
+            POST_PROCESSOR_CREATOR_REGISTRY[0:0] = registered_post_processor_creators
+            _registered_post_processor_creators_loaded = True
+
+
+class PostProcessorCatalog(object):
+    """
+    Indexes post processor creators by their names and by the short names of the indicators they provide, so that
+    creators and indicators can be looked up without scanning all creators. Where several creators have the same name
+    or provide the same indicator, the first one takes precedence in lookups by name and in the list of indicators.
+    """
+
+    def __init__(self, post_processor_creators: List[PostProcessorCreator]):
+        self._post_processor_creators = list(post_processor_creators)
+        self._post_processor_names = [post_processor_creator.get_name() for post_processor_creator in
+                                      self._post_processor_creators]
+        self._creators_by_name = OrderedDict()
+        self._indicator_names_per_creator = []
+        self._creator_indices_by_indicator_name = {}
+        self._indicators_by_name = OrderedDict()
+        for index, post_processor_creator in enumerate(self._post_processor_creators):
+            name = self._post_processor_names[index]
+            if name not in self._creators_by_name:
+                self._creators_by_name[name] = post_processor_creator
+            indicator_names = []
+            for indicator_description in post_processor_creator.get_indicator_descriptions():
+                indicator_name = indicator_description.short_name
+                indicator_names.append(indicator_name)
+                if indicator_name not in self._creator_indices_by_indicator_name:
+                    self._creator_indices_by_indicator_name[indicator_name] = []
+                    self._indicators_by_name[indicator_name] = indicator_description
+                self._creator_indices_by_indicator_name[indicator_name].append(index)
+            self._indicator_names_per_creator.append(indicator_names)
+
+    def get_num_post_processor_creators(self) -> int:
+        return len(self._post_processor_creators)
+
+    def get_post_processor_creator(self, name: str) -> Optional[PostProcessorCreator]:
+        return self._creators_by_name.get(name)
+
+    def get_post_processor_names(self) -> List[str]:
+        return list(self._post_processor_names)
+
+    def get_indicator(self, indicator_name: str) -> Optional[Variable]:
+        return self._indicators_by_name.get(indicator_name)
+
+    def get_indicators(self) -> List[Variable]:
+        return list(self._indicators_by_name.values())
+
+    def get_post_processors(self, requested_indicator_names: List[str]) -> List[PostProcessor]:
+        """
+        :return: The post processors that derive the requested indicators, in the order in which their creators have
+        been registered. Each post processor derives the requested indicators its creator provides.
+        """
+        requested_indicator_names_per_creator = {}
+        for indicator_name in requested_indicator_names:
+            for index in self._creator_indices_by_indicator_name.get(indicator_name, []):
+                if index not in requested_indicator_names_per_creator:
+                    requested_indicator_names_per_creator[index] = set()
+                requested_indicator_names_per_creator[index].add(indicator_name)
+        post_processors = []
+        for index in sorted(requested_indicator_names_per_creator):
+            indicator_names = [indicator_name for indicator_name in self._indicator_names_per_creator[index]
+                               if indicator_name in requested_indicator_names_per_creator[index]]
+            post_processors.append(self._post_processor_creators[index].create_post_processor(indicator_names))
+        return post_processors
+
+
+def get_post_processor_catalog() -> PostProcessorCatalog:
+    """
+    :return: The catalog of the registered post processor creators. It is built on first use and rebuilt when creators
+    have been added.
+    """
+    global _post_processor_catalog
+    _load_registered_post_processor_creators()
+    post_processor_catalog = _post_processor_catalog
+    # creators may have been appended to the registry directly, which is noticed by their number
+    if post_processor_catalog is None or \
+            post_processor_catalog.get_num_post_processor_creators() != len(POST_PROCESSOR_CREATOR_REGISTRY):
+        with _lock:
+            post_processor_catalog = PostProcessorCatalog(POST_PROCESSOR_CREATOR_REGISTRY)
+            _post_processor_catalog = post_processor_catalog
+    return post_processor_catalog
+
+
+def add_post_processor_creator(post_processor_creator: PostProcessorCreator):
+    global _post_processor_catalog
+    with _lock:
+        POST_PROCESSOR_CREATOR_REGISTRY.append(post_processor_creator)
+        _post_processor_catalog = None
+
+
+def get_post_processor_creators() -> List[PostProcessorCreator]:
+    _load_registered_post_processor_creators()
+    return POST_PROCESSOR_CREATOR_REGISTRY
+
+
+def get_post_processors(requested_indicator_names: List[str]) -> List[PostProcessor]:
+    """
+    :param requested_indicator_names: Names of the indicators that shall be derived.
+    :return: The post processors that can be used to derive the designated indicators.
+    """
+    return get_post_processor_catalog().get_post_processors(requested_indicator_names)
+
+
+def get_post_processor_names() -> List[str]:
+    """
+    :return: the names of all post processors registered in the post processing component
+    """
+    return get_post_processor_catalog().get_post_processor_names()
+
+
+def get_post_processor_description(name: str) -> str:
+    """
+    :param A name of a post-processor
+    :return: the description of the post processor of the requested name
+    """
+    post_processor_creator = get_post_processor_catalog().get_post_processor_creator(name)
+    if post_processor_creator is None:
+        raise ValueError('No post processor with name {} found.'.format(name))
+    return post_processor_creator.get_description()
+
+
+def get_post_processor(name: str, indicator_names: List[str]) -> PostProcessor:
+    """
+    :param A name of a post-processor
+    :return: the post processor of the requested name
+    """
+    post_processor_creator = get_post_processor_catalog().get_post_processor_creator(name)
+    if post_processor_creator is None:
+        raise ValueError('No post processor with name {} found.'.format(name))
+    return post_processor_creator.create_post_processor(indicator_names)
+
+
+def get_available_indicators() -> List[Variable]:
+    """
+    :return: the names of the indicators that can be derived using one of the registered post processors.
+    """
+    return get_post_processor_catalog().get_indicators()
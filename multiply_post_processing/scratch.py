@@ -0,0 +1,102 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+
+from typing import Optional, Tuple, Union
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+_PREFIX = 'multiply_scratch_'
+
+
+class ScratchSpace(object):
+    """
+    Allocates large arrays as memory-mapped files in a scratch directory, so that scenes can be processed that do not
+    fit into memory. Arrays larger than the memory threshold are mapped to files, smaller ones are held in memory. If no
+    threshold is given, all arrays are held in memory. Files are created in a directory of their own, which is removed
+    when the scratch space is closed. Where the operating system allows it, files are unlinked as soon as they have
+    been mapped, so they disappear with their arrays even if the process does not end regularly.
+    Scratch spaces that are passed to other processes allocate their files in a subdirectory of the original one, so
+    closing the original one removes them as well.
+    """
+
+    def __init__(self, directory: Optional[str] = None, memory_threshold: Optional[int] = None):
+        """
+        :param directory: The directory in which scratch files are created. Defaults to the system's temporary
+        directory.
+        :param memory_threshold: The size in bytes above which arrays are mapped to files
+        """
+        if memory_threshold is not None and memory_threshold < 0:
+            raise ValueError('Memory threshold must not be negative, but is {}.'.format(memory_threshold))
+        self._directory = directory
+        self._memory_threshold = memory_threshold
+        self._run_directory = None
+        self._is_owner = True
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        if self._memory_threshold is not None:
+            state['_directory'] = self._get_run_directory()
+        state['_run_directory'] = None
+        # only the original scratch space removes the files
+        state['_is_owner'] = False
+        return state
+
+    def _get_run_directory(self) -> str:
+        if self._run_directory is None:
+            if self._directory is not None and not os.path.exists(self._directory):
+                os.makedirs(self._directory)
+            self._run_directory = tempfile.mkdtemp(prefix=_PREFIX, dir=self._directory)
+        return self._run_directory
+
+    def get_memory_threshold(self) -> Optional[int]:
+        return self._memory_threshold
+
+    def exceeds_threshold(self, num_bytes: int) -> bool:
+        """
+        :return: True, if an array of this size would be mapped to a file
+        """
+        return self._memory_threshold is not None and num_bytes > self._memory_threshold
+
+    def empty(self, shape: Union[int, Tuple[int, ...]], dtype: np.dtype = np.float64) -> np.array:
+        """
+        :return: An uninitialized array of the given shape and data type, mapped to a file if it exceeds the threshold
+        """
+        dtype = np.dtype(dtype)
+        num_bytes = int(np.prod(shape)) * dtype.itemsize
+        if not self.exceeds_threshold(num_bytes):
+            return np.empty(shape, dtype=dtype)
+        file_descriptor, file_name = tempfile.mkstemp(suffix='.dat', dir=self._get_run_directory())
+        os.close(file_descriptor)
+        array = np.memmap(file_name, dtype=dtype, mode='w+', shape=shape)
+        try:
+            os.remove(file_name)
+        except OSError:
+            # the file is in use and will be removed along with the directory
+            pass
+        return array
+
+    def full(self, shape: Union[int, Tuple[int, ...]], fill_value, dtype: np.dtype = np.float64) -> np.array:
+        """
+        :return: An array of the given shape and data type filled with the value, mapped to a file if it exceeds the
+        threshold
+        """
+        array = self.empty(shape, dtype)
+        array.fill(fill_value)
+        return array
+
+    def close(self):
+        """
+        Removes all files of the scratch space. Arrays mapped to these files must not be used afterwards.
+        """
+        if self._run_directory is not None:
+            if self._is_owner:
+                shutil.rmtree(self._run_directory, ignore_errors=True)
+            self._run_directory = None
+
+    def __enter__(self) -> 'ScratchSpace':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,226 @@
+import gdal
+import logging
+import numpy as np
+import os
+import queue
+import threading
+
+from typing import Callable, List, Optional
+
+__author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
+
+_GDAL_DATA_TYPES = {
+    np.dtype(np.bool_): gdal.GDT_Byte,
+    np.dtype(np.uint8): gdal.GDT_Byte,
+    np.dtype(np.uint16): gdal.GDT_UInt16,
+    np.dtype(np.int16): gdal.GDT_Int16,
+    np.dtype(np.uint32): gdal.GDT_UInt32,
+    np.dtype(np.int32): gdal.GDT_Int32,
+    np.dtype(np.float32): gdal.GDT_Float32,
+    np.dtype(np.float64): gdal.GDT_Float64
+}
+
+
+COMPRESSIONS = ['DEFLATE', 'ZSTD', 'LZW', 'NONE']
+_COG_BLOCK_SIZE = 512
+
+
+def _get_gdal_data_type(data_type: np.dtype) -> int:
+    data_type = np.dtype(data_type)
+    if data_type in _GDAL_DATA_TYPES:
+        return _GDAL_DATA_TYPES[data_type]
+    return gdal.GDT_Float64
+
+
+def _create_directory(file_name: str):
+    directory = os.path.dirname(file_name)
+    if directory != '' and not os.path.exists(directory):
+        os.makedirs(directory)
+
+
+def _get_compression(compression: str) -> str:
+    if compression.upper() not in COMPRESSIONS:
+        raise ValueError('Compression {} is not supported. Choose one of {}.'.format(compression, COMPRESSIONS))
+    return compression.upper()
+
+
+def _get_overview_factors(width: int, height: int, block_size: int = _COG_BLOCK_SIZE) -> List[int]:
+    """
+    :return: The decimation factors of the overviews, down to the first overview that fits into a single block
+    """
+    factors = []
+    factor = 2
+    while max(width, height) * 2 > block_size * factor:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def copy_to_cog(data_set: gdal.Dataset, file_name: str, compression: str = 'DEFLATE'):
+    """
+    Copies a single-band dataset to a Cloud-Optimized GeoTiff with internal tiles of 512 x 512 pixels and overviews.
+    Overviews and compressed tiles are computed by as many threads as there are CPUs. Unless compression is 'NONE',
+    a predictor suited to the data type is applied.
+    """
+    compression = _get_compression(compression)
+    _create_directory(file_name)
+    cog_driver = gdal.GetDriverByName('COG')
+    if cog_driver is not None:
+        options = ['BLOCKSIZE={}'.format(_COG_BLOCK_SIZE), 'COMPRESS={}'.format(compression), 'NUM_THREADS=ALL_CPUS',
+                   'OVERVIEW_RESAMPLING=AVERAGE']
+        if compression != 'NONE':
+            options.append('PREDICTOR=YES')
+        cog_driver.CreateCopy(file_name, data_set, options=options)
+        return
+    # GDAL versions before 3.1 have no COG driver: overviews are built on the source and copied to a tiled GeoTiff
+    band = data_set.GetRasterBand(1)
+    factors = _get_overview_factors(data_set.RasterXSize, data_set.RasterYSize)
+    if len(factors) > 0 and band.GetOverviewCount() == 0:
+        data_set.BuildOverviews('AVERAGE', factors)
+    options = ['TILED=YES', 'BLOCKXSIZE={}'.format(_COG_BLOCK_SIZE), 'BLOCKYSIZE={}'.format(_COG_BLOCK_SIZE),
+               'COPY_SRC_OVERVIEWS=YES', 'COMPRESS={}'.format(compression), 'NUM_THREADS=ALL_CPUS']
+    if compression != 'NONE':
+        is_float = band.DataType in [gdal.GDT_Float32, gdal.GDT_Float64]
+        options.append('PREDICTOR={}'.format(3 if is_float else 2))
+    gdal.GetDriverByName('GTiff').CreateCopy(file_name, data_set, options=options)
+
+
+def write_cogs(data: List[np.array], file_names: List[str], geo_transform: tuple, projection: str,
+               compression: str = 'DEFLATE'):
+    """
+    Writes one array per file name as Cloud-Optimized GeoTiff.
+    """
+    compression = _get_compression(compression)
+    for array, file_name in zip(data, file_names):
+        if array.dtype == np.bool_:
+            array = array.astype(np.uint8)
+        height, width = array.shape
+        data_set = gdal.GetDriverByName('MEM').Create('', width, height, 1, _get_gdal_data_type(array.dtype))
+        data_set.SetGeoTransform(geo_transform)
+        data_set.SetProjection(projection)
+        data_set.GetRasterBand(1).WriteArray(array)
+        copy_to_cog(data_set, file_name, compression)
+        data_set = None
+
+
+class BlockGeoTiffWriter(object):
+    """
+    Writes indicators to GeoTiff files block by block. In contrast to the GeoTiffWriter, the full extent of an
+    indicator never needs to be held in memory. If a compression is given, the blocks are collected in temporary
+    GeoTiffs, which are copied to Cloud-Optimized GeoTiffs when the writer is closed.
+    """
+
+    def __init__(self, file_names: List[str], geo_transform: tuple, projection: str, width: int, height: int,
+                 data_types: List[np.dtype], compression: Optional[str] = None):
+        driver = gdal.GetDriverByName('GTiff')
+        self._file_names = file_names
+        self._compression = None if compression is None else _get_compression(compression)
+        self._data_sets = []
+        for file_name, data_type in zip(file_names, data_types):
+            _create_directory(file_name)
+            if self._compression is not None:
+                file_name = self._get_temporary_file_name(file_name)
+            data_set = driver.Create(file_name, width, height, 1, _get_gdal_data_type(data_type))
+            data_set.SetGeoTransform(geo_transform)
+            data_set.SetProjection(projection)
+            self._data_sets.append(data_set)
+
+    def write_block(self, data: List[np.array], x_offset: int, y_offset: int):
+        """
+        Writes one block of data per file.
+        :param data: The blocks to be written, in the order of the file names
+        :param x_offset: The column at which the blocks start
+        :param y_offset: The row at which the blocks start
+        """
+        for data_set, block in zip(self._data_sets, data):
+            data_set.GetRasterBand(1).WriteArray(block, x_offset, y_offset)
+
+    @staticmethod
+    def _get_temporary_file_name(file_name: str) -> str:
+        return '{}.part.tif'.format(file_name)
+
+    def close(self):
+        for data_set, file_name in zip(self._data_sets, self._file_names):
+            data_set.FlushCache()
+            if self._compression is not None:
+                copy_to_cog(data_set, file_name, self._compression)
+        data_set = None
+        self._data_sets = []
+        if self._compression is not None:
+            for file_name in self._file_names:
+                os.remove(self._get_temporary_file_name(file_name))
+
+
+class AsyncWriter(object):
+    """
+    Runs write jobs in background threads, so that processing can continue while earlier results are encoded and
+    flushed. Jobs wait in a bounded queue: Submitting a job blocks while the queue is full, so that at most
+    queue_size + num_threads jobs and the results they refer to are held at a time. Errors raised by jobs do not stop
+    the remaining jobs. They are raised when the writer is closed. With 0 threads, jobs are run right away when they
+    are submitted.
+    """
+
+    def __init__(self, num_threads: int = 1, queue_size: Optional[int] = None):
+        if num_threads < 0:
+            raise ValueError('Number of writer threads must not be negative, but is {}.'.format(num_threads))
+        if queue_size is None:
+            queue_size = max(num_threads, 1)
+        self._queue = queue.Queue(queue_size)
+        self._errors = []
+        self._errors_lock = threading.Lock()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(num_threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            function, args = job
+            try:
+                function(*args)
+            except Exception as e:
+                logging.error('Could not write results: {}'.format(e))
+                with self._errors_lock:
+                    self._errors.append(e)
+
+    def submit(self, function: Callable, *args):
+        """
+        Queues a call of function with the given arguments. Blocks while the queue is full.
+        """
+        if self._closed:
+            raise ValueError('Cannot submit write job: Writer has already been closed.')
+        if len(self._threads) == 0:
+            function(*args)
+            return
+        self._queue.put((function, args))
+
+    def close(self):
+        """
+        Waits until all queued jobs have been run.
+        :raises RuntimeError: If any of the jobs has failed
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if len(self._errors) > 0:
+            raise RuntimeError('{} write job(s) failed.'.format(len(self._errors))) from self._errors[0]
+
+    def __enter__(self) -> 'AsyncWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        # do not mask the error that ended processing, but let queued results be written nevertheless
+        try:
+            self.close()
+        except RuntimeError as e:
+            logging.error(str(e))
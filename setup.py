@@ -25,9 +25,9 @@ setup(name='multiply-post-processing',
           ],
           'post_processor_creators': [
               'burned_severity_post_processor_creator = '
-              'multiply_post_processing:burned_severity_post_processor.BurnedSeverityPostProcessorCreator',
-              'functional_diversity_metrics_post_processor_creator = multiply_post_processing:'
-              'functional_diversity_metrics_post_processor.FunctionalDiversityMetricsPostProcessorCreator'
+              'multiply_post_processing.burned_severity_post_processor:BurnedSeverityPostProcessorCreator',
+              'functional_diversity_metrics_post_processor_creator = multiply_post_processing.'
+              'functional_diversity_metrics_post_processor:FunctionalDiversityMetricsPostProcessorCreator'
           ]
       },
       install_requires=requirements
@@ -1,4 +1,5 @@
 from multiply_post_processing.indicators import get_indicator, get_indicators
+from multiply_post_processing.indicators import indicators as indicators_module
 
 __author__ = 'Tonio Fincke (Brockmann Consult GmbH)'
 
@@ -34,3 +35,16 @@ def test_get_indicator_mnnd():
     assert 'Depends on number of considered traits' == mmd_variable.range
     assert 1 == len(mmd_variable.applications)
     assert 'functional diversity' == mmd_variable.applications[0]
+
+
+def test_get_indicator_parses_library_once(monkeypatch):
+    get_indicator('GeoCBI')
+
+    def fail(*args, **kwargs):
+        raise AssertionError('The indicators library is parsed again.')
+    monkeypatch.setattr(indicators_module.yaml, 'safe_load', fail)
+
+    fe_variable = get_indicator('fe')
+    assert 'fe' == fe_variable.short_name
+    assert fe_variable is not get_indicator('fe')
+    assert 5 == len(get_indicators())
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from multiply_post_processing.burned_severity_post_processor import BurnedSeverityPostProcessor, calc_geo_cbi, \
+    calc_scene_statistics
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+pytest.importorskip('numba')
+from multiply_post_processing import burned_severity_kernels
+
+_NO_DATA = -9999
+_SCALE_FACTOR = 0.0001
+
+
+def _create_bands():
+    random_state = np.random.RandomState(0)
+    bands = []
+    for i in range(6):
+        band = random_state.randint(0, 6000, size=(60, 70))
+        band[random_state.rand(60, 70) < 0.05] = _NO_DATA
+        bands.append(band)
+    bands[2][10:40, 10:40] += 3000
+    bands[3][10:40, 10:40] += 3000
+    bands[5][10:40, 10:40] -= 2000
+    return bands
+
+
+def test_calc_scene_statistics():
+    smir_0, swir_0, smir_1, swir_1, nir_0, nir_1 = _create_bands()
+
+    expected = calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, _NO_DATA, _SCALE_FACTOR)
+    actual = burned_severity_kernels.calc_scene_statistics(smir_0, swir_0, smir_1, swir_1, nir_1, _NO_DATA,
+                                                           _SCALE_FACTOR)
+
+    assert expected.keys() == actual.keys()
+    for name in expected:
+        assert expected[name].get_count() == actual[name].get_count()
+        assert pytest.approx(expected[name].get_mean()) == actual[name].get_mean()
+
+
+def test_calc_geo_cbi():
+    bands = _create_bands()
+    scene_statistics = calc_scene_statistics(bands[0], bands[1], bands[2], bands[3], bands[5], _NO_DATA,
+                                             _SCALE_FACTOR)
+
+    expected = calc_geo_cbi(*[band.copy() for band in bands], _NO_DATA, _SCALE_FACTOR, scene_statistics)
+    actual = burned_severity_kernels.calc_geo_cbi(*bands, _NO_DATA, _SCALE_FACTOR, scene_statistics)
+
+    assert expected.shape == actual.shape
+    assert np.any(expected != _NO_DATA)
+    assert np.array_equal(expected, actual)
+
+
+def test_set_backend():
+    post_processor = BurnedSeverityPostProcessor([])
+    post_processor.set_parameters({'backend': 'numba'})
+    assert 'numba' == post_processor._backend
+    post_processor.set_parameters({'backend': 'numpy'})
+    assert 'numpy' == post_processor._backend
+    with pytest.raises(ValueError):
+        post_processor.set_parameters({'backend': 'fortran'})
@@ -1,4 +1,10 @@
-from multiply_post_processing.burned_severity_post_processor import BurnedSeverityPostProcessor
+import numpy as np
+from pytest import approx
+
+from multiply_core.observations import DataTypeConstants
+from multiply_post_processing.burned_severity_post_processor import BurnedSeverityPostProcessor, calc_geo_cbi, \
+    mask_values
+from multiply_post_processing.caching import DateCache
 
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
@@ -6,3 +12,43 @@ __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
 
 def test_get_num_time_steps():
     assert 2 == BurnedSeverityPostProcessor.get_num_time_steps()
+
+
+def test_mask_values():
+    array = np.array([[0.5, -9999], [1.5, -9999]], dtype=np.float32)
+
+    assert approx(1.0) == mask_values(array, -9999)
+    assert -9999 == mask_values(np.full((2, 2), -9999), -9999)
+
+
+def _create_date_data(date: str, random_state: np.random.RandomState) -> dict:
+    date_data = {'data_type': DataTypeConstants.S2_L2, 'date': date}
+    for band in ['smir', 'swir', 'nir']:
+        date_data[band] = random_state.randint(0, 6000, size=(30, 20))
+        date_data[band][random_state.rand(30, 20) < 0.05] = -9999
+    return date_data
+
+
+def test_process_date_data_with_date_cache():
+    random_state = np.random.RandomState(0)
+    date_data = [_create_date_data(date, random_state) for date in ['2017-06-01', '2017-06-11', '2017-06-21']]
+    date_data[1]['smir'][5:20, 5:15] += 3000
+    date_data[1]['swir'][5:20, 5:15] += 3000
+    date_data[1]['nir'][5:20, 5:15] -= 2000
+    post_processor = BurnedSeverityPostProcessor([])
+    expected = [calc_geo_cbi(date_data[i]['smir'], date_data[i]['swir'], date_data[i + 1]['smir'],
+                             date_data[i + 1]['swir'], date_data[i]['nir'], date_data[i + 1]['nir'], -9999, 0.0001)
+                for i in range(2)]
+
+    date_cache = DateCache(2)
+    post_processor.set_date_cache(date_cache)
+    results = [post_processor.process_date_data(date_data[i:i + 2])['geocbi'] for i in range(2)]
+
+    assert np.any(expected[0] != -9999)
+    assert np.array_equal(expected[0], results[0])
+    assert np.array_equal(expected[1], results[1])
+    # the indices of the second date are derived only once
+    assert 5 == date_cache.get_num_hits()
+    assert 15 == date_cache.get_num_misses()
+    assert not date_cache.contains('2017-06-01', 'mirbi')
+    assert date_cache.contains('2017-06-21', 'mirbi')
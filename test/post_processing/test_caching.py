@@ -0,0 +1,125 @@
+import numpy as np
+import pickle
+from pytest import raises
+
+from collections import namedtuple
+
+from multiply_post_processing.caching import DateCache, SharedObservations
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def test_date_cache_derives_data_once():
+    calls = []
+
+    def load(value):
+        calls.append(value)
+        return value * 2
+
+    date_cache = DateCache(2)
+
+    assert 2 == date_cache.get('2017-06-01', 'nir', load, 1)
+    assert 2 == date_cache.get('2017-06-01', 'nir', load, 1)
+    assert 4 == date_cache.get('2017-06-01', 'swir', load, 2)
+    assert [1, 2] == calls
+    assert 1 == date_cache.get_num_hits()
+    assert 2 == date_cache.get_num_misses()
+
+
+def test_date_cache_evicts_least_recently_used_date():
+    date_cache = DateCache(2)
+    date_cache.get('2017-06-01', 'nir', lambda: 1)
+    date_cache.get('2017-06-11', 'nir', lambda: 2)
+    date_cache.get('2017-06-01', 'swir', lambda: 3)
+    date_cache.get('2017-06-21', 'nir', lambda: 4)
+
+    assert date_cache.contains('2017-06-01', 'nir')
+    assert date_cache.contains('2017-06-01', 'swir')
+    assert not date_cache.contains('2017-06-11', 'nir')
+    assert date_cache.contains('2017-06-21', 'nir')
+
+
+def test_date_cache_respects_max_bytes():
+    date_cache = DateCache(3, max_bytes=1000)
+    date_cache.get('2017-06-01', 'nir', np.zeros, 100)
+    date_cache.get('2017-06-11', 'nir', np.zeros, 100)
+
+    assert not date_cache.contains('2017-06-01', 'nir')
+    assert date_cache.contains('2017-06-11', 'nir')
+    # the most recently used date is kept even if it exceeds the limit
+    date_cache.get('2017-06-11', 'swir', np.zeros, 100)
+    assert date_cache.contains('2017-06-11', 'nir')
+    assert date_cache.contains('2017-06-11', 'swir')
+
+
+def test_date_cache_evict_and_clear():
+    date_cache = DateCache(2)
+    date_cache.get('2017-06-01', 'nir', lambda: 1)
+    date_cache.get('2017-06-11', 'nir', lambda: 2)
+
+    date_cache.evict('2017-06-01')
+    assert not date_cache.contains('2017-06-01', 'nir')
+    assert date_cache.contains('2017-06-11', 'nir')
+    date_cache.clear()
+    assert not date_cache.contains('2017-06-11', 'nir')
+
+
+def test_date_cache_invalid_max_dates():
+    with raises(ValueError):
+        DateCache(0)
+
+
+_BandData = namedtuple('_BandData', 'observations uncertainty mask')
+
+
+class _CountingObservations(object):
+
+    def __init__(self):
+        self.reads = []
+        self.no_data_values = {}
+        self.bands_per_observation = {'2017-06-01': 3}
+
+    def set_no_data_value(self, date, band_name, no_data_value):
+        self.no_data_values[(date, band_name)] = no_data_value
+
+    def get_band_data_by_name(self, date, band_name, retrieve_uncertainty=True):
+        self.reads.append((date, band_name))
+        no_data_value = self.no_data_values.get((date, band_name), 0)
+        return _BandData(np.full(4, no_data_value, dtype=np.float32), None, np.ones(4, dtype=bool))
+
+
+def test_shared_observations_read_bands_once():
+    observations = _CountingObservations()
+    shared_observations = SharedObservations(observations, DateCache(2))
+
+    band_data = shared_observations.get_band_data_by_name('2017-06-01', 'nir')
+    band_data.observations[0] = 5
+    other_band_data = shared_observations.get_band_data_by_name('2017-06-01', 'nir')
+
+    assert [('2017-06-01', 'nir')] == observations.reads
+    assert 0 == other_band_data.observations[0]
+    assert 3 == shared_observations.bands_per_observation['2017-06-01']
+
+
+def test_shared_observations_cache_bands_per_no_data_value():
+    observations = _CountingObservations()
+    shared_observations = SharedObservations(observations, DateCache(2))
+
+    shared_observations.get_band_data_by_name('2017-06-01', 'nir')
+    shared_observations.set_no_data_value('2017-06-01', 'nir', -1)
+    band_data = shared_observations.get_band_data_by_name('2017-06-01', 'nir')
+
+    assert 2 == len(observations.reads)
+    assert np.all(band_data.observations == -1)
+
+
+def test_date_cache_pickle():
+    date_cache = DateCache(3, 1024)
+    date_cache.get('2017-06-01', 'nir', lambda: np.zeros(4))
+
+    unpickled_date_cache = pickle.loads(pickle.dumps(date_cache))
+
+    assert not unpickled_date_cache.contains('2017-06-01', 'nir')
+    assert 0 == unpickled_date_cache.get_num_misses()
+    assert 2 == unpickled_date_cache.get('2017-06-01', 'swir', lambda: 2)
+    assert unpickled_date_cache.contains('2017-06-01', 'swir')
@@ -0,0 +1,142 @@
+import numpy as np
+import os
+import pytest
+import shutil
+
+from datetime import datetime
+
+from multiply_post_processing.datacube import DataCubeReader, DataCubeWriter
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+netCDF4 = pytest.importorskip('netCDF4')
+
+_GEO_TRANSFORM = (500000.0, 10.0, 0.0, 4300000.0, 0.0, -10.0)
+_PROJECTION = 'PROJCS["WGS 84 / UTM zone 30N",GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,' \
+              '298.257223563]],PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]],' \
+              'PROJECTION["Transverse_Mercator"],PARAMETER["latitude_of_origin",0],' \
+              'PARAMETER["central_meridian",-3],PARAMETER["scale_factor",0.9996],' \
+              'PARAMETER["false_easting",500000],PARAMETER["false_northing",0],UNIT["metre",1]]'
+_OUTPUT_PATH = './test/test_data/cube_output/'
+
+
+def test_data_cube_writer_appends_time_steps():
+    if os.path.exists(_OUTPUT_PATH):
+        shutil.rmtree(_OUTPUT_PATH)
+    try:
+        file_name = '{}{}'.format(_OUTPUT_PATH, 'cube.nc')
+        writer = DataCubeWriter(file_name, _GEO_TRANSFORM, _PROJECTION, 5, 3, time_chunk_size=4, spatial_chunk_size=2)
+        for day in range(1, 7):
+            writer.append(datetime(2017, 6, day + 1), {'a': np.full((3, 5), day, dtype=np.float32),
+                                                       'b': np.full((3, 5), -day, dtype=np.int16)},
+                          (datetime(2017, 6, day), datetime(2017, 6, day + 1)))
+        writer.close()
+
+        data_set = netCDF4.Dataset(file_name)
+        assert 6 == len(data_set.dimensions['time'])
+        assert (6, 3, 5) == data_set.variables['a'].shape
+        assert (4, 2, 2) == tuple(data_set.variables['a'].chunking())
+        assert np.float32 == data_set.variables['a'].dtype
+        assert np.int16 == data_set.variables['b'].dtype
+        assert np.all(data_set.variables['a'][:, 1, 1] == np.arange(1, 7))
+        assert np.all(data_set.variables['b'][5] == -6)
+        times = netCDF4.num2date(data_set.variables['time'][:], data_set.variables['time'].units)
+        assert datetime(2017, 6, 2) == times[0]
+        assert datetime(2017, 6, 7) == times[5]
+        assert 1 == data_set.variables['time_bounds'][0, 1] - data_set.variables['time_bounds'][0, 0]
+        assert np.allclose([500005.0, 500015.0, 500025.0, 500035.0, 500045.0], data_set.variables['x'][:])
+        assert np.allclose([4299995.0, 4299985.0, 4299975.0], data_set.variables['y'][:])
+        assert _PROJECTION == data_set.variables['crs'].crs_wkt
+        data_set.close()
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_data_cube_writer_rejects_wrong_shape():
+    if os.path.exists(_OUTPUT_PATH):
+        shutil.rmtree(_OUTPUT_PATH)
+    try:
+        writer = DataCubeWriter('{}{}'.format(_OUTPUT_PATH, 'cube.nc'), _GEO_TRANSFORM, _PROJECTION, 5, 3)
+        with pytest.raises(ValueError):
+            writer.append(datetime(2017, 6, 1), {'a': np.zeros((5, 3))})
+        writer.close()
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def _write_cube(file_name: str):
+    writer = DataCubeWriter(file_name, _GEO_TRANSFORM, _PROJECTION, 5, 3)
+    for day in range(1, 4):
+        writer.append(datetime(2017, 6, day), {'lai': np.arange(15, dtype=np.float32).reshape(3, 5) * day,
+                                               'cab': np.full((3, 5), day, dtype=np.float32)})
+    writer.close()
+
+
+def test_data_cube_reader():
+    if os.path.exists(_OUTPUT_PATH):
+        shutil.rmtree(_OUTPUT_PATH)
+    try:
+        file_name = '{}{}'.format(_OUTPUT_PATH, 'cube.nc')
+        _write_cube(file_name)
+
+        with DataCubeReader(file_name, ['lai', 'cab']) as reader:
+            assert [datetime(2017, 6, 1), datetime(2017, 6, 2), datetime(2017, 6, 3)] == reader.get_dates()
+            assert np.allclose(_GEO_TRANSFORM, reader.get_geo_transform())
+            assert _PROJECTION == reader.get_projection()
+            assert 5 == reader.get_width()
+            assert 3 == reader.get_height()
+            variable_data = reader.read(1)
+            assert np.array_equal(np.arange(15).reshape(3, 5) * 2, variable_data['lai'])
+            assert np.all(variable_data['cab'] == 2)
+            window_data = reader.read(2, (1, 1, 3, 2))
+            assert np.array_equal((np.arange(15).reshape(3, 5) * 3)[1:3, 1:4], window_data['lai'])
+            dates = [date for date, _ in reader]
+            assert reader.get_dates() == dates
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_data_cube_reader_flips_south_up_cube():
+    if os.path.exists(_OUTPUT_PATH):
+        shutil.rmtree(_OUTPUT_PATH)
+    try:
+        os.makedirs(_OUTPUT_PATH)
+        file_name = '{}{}'.format(_OUTPUT_PATH, 'south_up.nc')
+        data_set = netCDF4.Dataset(file_name, 'w')
+        data_set.createDimension('time', None)
+        data_set.createDimension('lat', 3)
+        data_set.createDimension('lon', 2)
+        time = data_set.createVariable('time', np.float64, ('time',))
+        time.units = 'days since 2017-01-01'
+        time[:] = [0, 10]
+        data_set.createVariable('lat', np.float64, ('lat',))[:] = [40.5, 41.5, 42.5]
+        data_set.createVariable('lon', np.float64, ('lon',))[:] = [-3.5, -2.5]
+        data_set.createVariable('lai', np.float32, ('time', 'lat', 'lon'))[:] = np.arange(12).reshape(2, 3, 2)
+        data_set.close()
+
+        with DataCubeReader(file_name, ['lai']) as reader:
+            assert np.allclose((-4.0, 1.0, 0.0, 43.0, 0.0, -1.0), reader.get_geo_transform())
+            assert reader.get_projection() is None
+            assert [datetime(2017, 1, 1), datetime(2017, 1, 11)] == reader.get_dates()
+            assert np.array_equal([[10, 11], [8, 9], [6, 7]], reader.read(1)['lai'])
+            assert np.array_equal([[8, 9], [6, 7]], reader.read(1, (0, 1, 2, 2))['lai'])
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_data_cube_reader_missing_variable():
+    if os.path.exists(_OUTPUT_PATH):
+        shutil.rmtree(_OUTPUT_PATH)
+    try:
+        file_name = '{}{}'.format(_OUTPUT_PATH, 'cube.nc')
+        _write_cube(file_name)
+
+        with pytest.raises(ValueError):
+            DataCubeReader(file_name, ['lai', 'cw'])
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
@@ -1,8 +1,14 @@
 from multiply_post_processing.functional_diversity_metrics_post_processor import \
-    CVHFunction, FDIVFunction, FEFunction, MNNDFunction, FunctionalDiversityMetricsPostProcessor, _pre_process, \
-    _pre_process_trait, _process
+    CVHFunction, FDIVFunction, FEFunction, MNNDFunction, FunctionalDiversityMetricsPostProcessor, PlotContext, \
+    _batched_fe, _batched_kde_densities, _batched_minimum_spanning_tree_edges, _batched_mnnd, \
+    _batched_outlier_thresholds, _get_bands, _get_num_valids, _get_plot_starts, _get_stride, _pad_plots, \
+    _pre_process, _pre_process_trait, _process, _remove_outliers
+from multiply_post_processing.scratch import ScratchSpace
 import numpy as np
-from pytest import approx
+import os
+import tempfile
+from pytest import approx, raises
+from scipy import stats
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
 
@@ -160,6 +166,177 @@ def test_process():
     assert approx(0.4698261066849253) == results_dict['fdiv'][0][0].max()
 
 
+def test_get_bands():
+    assert [(0, 10, 1), (10, 20, 1)] == _get_bands(25, 1)
+    assert [(0, 20, 2), (20, 40, 2), (40, 60, 2), (60, 80, 2)] == _get_bands(85, 1)
+    assert [(0, 10, 1), (10, 20, 1), (20, 30, 1), (30, 40, 1)] == _get_bands(45, 1)
+    assert [(0, 10, 2), (8, 18, 2), (16, 26, 2), (24, 30, 1)] == _get_bands(30, 1, plot_size=6, stride=4)
+
+
+def test_get_stride():
+    assert 10 == _get_stride(10)
+    assert 4 == _get_stride(10, stride=4)
+    assert 3 == _get_stride(10, overlap=7)
+    assert 3 == _get_stride(10, stride=3, overlap=7)
+    with raises(ValueError):
+        _get_stride(10, stride=4, overlap=7)
+    with raises(ValueError):
+        _get_stride(10, stride=11)
+    with raises(ValueError):
+        _get_stride(10, overlap=10)
+    with raises(ValueError):
+        _get_stride(1)
+
+
+def test_get_plot_starts():
+    assert [0, 10] == _get_plot_starts(25, 10, 10).tolist()
+    assert [0, 10, 20] == _get_plot_starts(26, 10, 10).tolist()
+    assert [0, 3, 6, 9] == _get_plot_starts(13, 7, 3).tolist()
+
+
+def test_get_num_valids():
+    data = np.ones((5, 6))
+    data[0, 0] = np.nan
+    data[2, 3] = np.nan
+
+    num_valids = _get_num_valids(data, 3, np.array([0, 2, 4]), np.array([0, 3]))
+
+    assert [[8, 8], [9, 8], [3, 3]] == num_valids.tolist()
+
+
+def test_process_in_parallel():
+    random_state = np.random.RandomState(42)
+    variable_data = {'lai': random_state.rand(30, 20) + 0.1, 'cab': random_state.rand(30, 20) + 0.1,
+                     'cw': random_state.rand(30, 20) + 0.1}
+    variable_data = _pre_process(variable_data)
+
+    serial_results = _process(variable_data, ['cvh', 'mnnd', 'fe', 'fdiv'])
+    parallel_results = _process(variable_data, ['cvh', 'mnnd', 'fe', 'fdiv'], workers=2)
+
+    for indicator_name in serial_results:
+        assert np.array_equal(serial_results[indicator_name], parallel_results[indicator_name], equal_nan=True)
+
+
+def test_process_in_scratch_space():
+    random_state = np.random.RandomState(42)
+    variable_data = {'lai': random_state.rand(30, 20) + 0.1, 'cab': random_state.rand(30, 20) + 0.1,
+                     'cw': random_state.rand(30, 20) + 0.1}
+    variable_data = _pre_process(variable_data)
+    in_memory_results = _process(variable_data, ['cvh', 'mnnd', 'fe', 'fdiv'])
+
+    scratch_directory = tempfile.mkdtemp()
+    with ScratchSpace(scratch_directory, memory_threshold=1024) as scratch_space:
+        results = _process(variable_data, ['cvh', 'mnnd', 'fe', 'fdiv'], scratch_space=scratch_space)
+        parallel_results = _process(variable_data, ['cvh', 'mnnd', 'fe', 'fdiv'], workers=2,
+                                    scratch_space=scratch_space)
+        for indicator_name in in_memory_results:
+            assert isinstance(results[indicator_name], np.memmap)
+            assert np.array_equal(in_memory_results[indicator_name], results[indicator_name], equal_nan=True)
+            assert np.array_equal(in_memory_results[indicator_name], parallel_results[indicator_name],
+                                  equal_nan=True)
+    assert [] == os.listdir(scratch_directory)
+    os.rmdir(scratch_directory)
+
+
+def test_batched_kde_densities():
+    random_state = np.random.RandomState(42)
+    traits = random_state.normal(size=(100, 3))
+    other_traits = random_state.normal(size=(97, 3))
+
+    densities, derivable = _batched_kde_densities(*_pad_plots([traits, other_traits, np.ones((5, 3))]))
+
+    assert [True, True, False] == derivable.tolist()
+    np.testing.assert_allclose(stats.gaussian_kde(traits.T)(traits.T), densities[0], rtol=1e-10)
+    np.testing.assert_allclose(stats.gaussian_kde(other_traits.T)(other_traits.T), densities[1, :97], rtol=1e-10)
+    assert np.all(np.isnan(densities[1, 97:]))
+
+
+def test_remove_outliers_of_plot_with_constant_trait():
+    random_state = np.random.RandomState(42)
+    traits = random_state.normal(size=(40, 3))
+    traits[:, 2] = 0.1
+    # the covariance is singular, but positive definite after rounding, so scipy derives an estimate
+    density = stats.gaussian_kde(traits.T)(traits.T)
+
+    densities, derivable = _batched_kde_densities(*_pad_plots([traits]))
+    filtered_traits = _remove_outliers([traits], [40])
+
+    assert derivable[0]
+    assert np.array_equal(traits[density > np.percentile(density, 5)], filtered_traits[0])
+
+
+def test_batched_outlier_thresholds():
+    densities = np.array([[0.3, 0.1, 0.4, 0.2, 0.5, np.nan],
+                          [0.2, 0.2, 0.2, 0.2, 0.2, 0.2],
+                          [0.1, 0.2, np.nan, 0.3, 0.4, 0.5]])
+    mask = np.array([[True, True, True, True, True, False],
+                     [True, True, True, True, True, True],
+                     [True, True, True, True, True, True]])
+
+    thresholds = _batched_outlier_thresholds(densities, mask, np.array([0.95, 0.95, 0.95]))
+
+    assert np.percentile(densities[0, :5], 5) == thresholds[0]
+    assert 0.2 == thresholds[1]
+    assert np.isnan(thresholds[2])
+
+
+def test_remove_outliers():
+    random_state = np.random.RandomState(42)
+    traits = random_state.normal(size=(100, 3))
+    density = stats.gaussian_kde(traits.T)(traits.T)
+
+    filtered_traits = _remove_outliers([traits, np.ones((96, 3))], [100, 96])
+
+    assert np.array_equal(traits[density > np.percentile(density, 5)], filtered_traits[0])
+    assert np.array_equal(np.ones((96, 3)), filtered_traits[1])
+
+
+def test_process_overlapping_plots():
+    random_state = np.random.RandomState(42)
+    variable_data = {'lai': random_state.rand(30, 20) + 0.1, 'cab': random_state.rand(30, 20) + 0.1,
+                     'cw': random_state.rand(30, 20) + 0.1}
+    variable_data = _pre_process(variable_data)
+
+    results = _process(variable_data, ['cvh', 'mnnd', 'fe', 'fdiv'], plot_size=10, stride=5)
+    parallel_results = _process(variable_data, ['cvh', 'mnnd', 'fe', 'fdiv'], workers=2, plot_size=10, stride=5)
+
+    cvh_function = CVHFunction(1, 1, 0, 0)
+    for row_start in [0, 5, 10, 15]:
+        for column_start in [0, 5, 10]:
+            traits = np.array([variable_data[name][row_start:row_start + 10, column_start:column_start + 10].ravel()
+                               for name in variable_data]).T
+            traits = _remove_outliers([traits], [100])[0]
+            assert approx(cvh_function._func(traits)) == results['cvh'][row_start + 2, column_start + 2]
+            assert approx(cvh_function._func(traits)) == results['cvh'][row_start + 6, column_start + 6]
+    assert np.all(np.isnan(results['cvh'][:2]))
+    assert np.all(np.isnan(results['cvh'][:, 17:]))
+    for indicator_name in results:
+        assert np.array_equal(results[indicator_name], parallel_results[indicator_name], equal_nan=True)
+
+
+def test_set_parameters():
+    post_processor = FunctionalDiversityMetricsPostProcessor([])
+    post_processor.set_parameters({'plot_size': '8', 'overlap': '6', 'workers': '3'})
+
+    assert 8 == post_processor._plot_size
+    assert 2 == post_processor._stride
+    assert 3 == post_processor._workers
+
+
+def test_workers_are_bound_by_worker_budget():
+    post_processor = FunctionalDiversityMetricsPostProcessor([])
+    assert 1 == post_processor._get_workers()
+
+    post_processor.set_num_workers(2)
+    assert 2 == post_processor._get_workers()
+
+    post_processor.set_parameters({'workers': '3'})
+    assert 2 == post_processor._get_workers()
+
+    post_processor.set_num_workers(4)
+    assert 3 == post_processor._get_workers()
+
+
 def test_cvh_function_get_name():
     assert 'cvh' == CVHFunction.get_name()
 
@@ -184,6 +361,30 @@ def test_mnnd_function_func():
     assert approx(1.1353556579106137) == mnnd_function._func(traits.T)
 
 
+def test_pad_plots():
+    traits, mask = _pad_plots([np.ones((2, 3)), np.ones((4, 3))])
+
+    assert (2, 4, 3) == traits.shape
+    assert [[True, True, False, False], [True, True, True, True]] == mask.tolist()
+    assert 0. == traits[0, 2:].max()
+
+
+def test_batched_mnnd():
+    mnnd_function = MNNDFunction(3, 3, 1, 1)
+    traits = np.array([[0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.1, 0.1, 0.2],
+                       [0.2, 0.3, 0.2, 0.1, 0.5, 0.3, 0.5, 0.7, 0.2],
+                       [0.4, 0.2, 0.2, 0.4, 0.6, 0.6, 0.3, 0.3, 0.2]])
+    other_traits = np.array([[0.1, 0.2, 0.3, 0.4, 0.4],
+                             [0.5, 0.5, 0.5, 0.5, 0.5],
+                             [0.4, 0.2, 0.2, 0.4, 0.4]])
+
+    mnnd = _batched_mnnd(*_pad_plots([traits.T, other_traits.T, traits.T[:1]]))
+
+    assert approx(1.1353556579106137) == mnnd[0]
+    assert approx(mnnd_function._func(other_traits.T)) == mnnd[1]
+    assert np.isnan(mnnd[2])
+
+
 def test_fe_function_get_name():
     assert 'fe' == FEFunction.get_name()
 
@@ -196,6 +397,39 @@ def test_fe_function_func():
     assert approx(0.8506660240031859) == fe_function._func(traits.T)
 
 
+def test_batched_minimum_spanning_tree_edges():
+    distances = np.array([[[0., 1., 4., 0.],
+                           [1., 0., 2., 0.],
+                           [4., 2., 0., 0.],
+                           [0., 0., 0., 0.]],
+                          [[0., 0., 3., 5.],
+                           [0., 0., 3., 5.],
+                           [3., 3., 0., 1.],
+                           [5., 5., 1., 0.]]])
+    mask = np.array([[True, True, True, False], [True, True, True, True]])
+
+    edges = _batched_minimum_spanning_tree_edges(distances, mask)
+
+    assert [1., 2.] == sorted(edges[0][edges[0] > 0].tolist())
+    assert [1., 3., 3.] == sorted(edges[1][edges[1] > 0].tolist())
+
+
+def test_batched_fe():
+    fe_function = FEFunction(3, 3, 1, 1)
+    traits = np.array([[0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.1, 0.1, 0.2],
+                       [0.2, 0.3, 0.2, 0.1, 0.5, 0.3, 0.5, 0.7, 0.2],
+                       [0.4, 0.2, 0.2, 0.4, 0.6, 0.6, 0.3, 0.3, 0.2]])
+    duplicate_traits = np.array([[0.1, 0.1, 0.3, 0.4],
+                                 [0.2, 0.2, 0.2, 0.1],
+                                 [0.4, 0.4, 0.2, 0.6]])
+
+    fe = _batched_fe(*_pad_plots([traits.T, duplicate_traits.T, traits.T[:1]]))
+
+    assert approx(0.8506660240031859) == fe[0]
+    assert approx(fe_function._func(duplicate_traits.T)) == fe[1]
+    assert np.isnan(fe[2])
+
+
 def test_fdiv_function_get_name():
     assert 'fdiv' == FDIVFunction.get_name()
 
@@ -206,3 +440,37 @@ def test_fdiv_function_func():
                        [0.2, 0.3, 0.2, 0.1, 0.5, 0.3, 0.5, 0.7, 0.2],
                        [0.4, 0.2, 0.2, 0.4, 0.6, 0.6, 0.3, 0.3, 0.2]])
     assert approx(0.252741939118282) == fdiv_function._func(traits.T)
+
+
+def test_fdiv_function_func_four_dimensions():
+    fdiv_function = FDIVFunction(3, 3, 1, 1)
+    traits = np.array([[0., 1., 0., 0., 0.],
+                       [0., 0., 1., 0., 0.],
+                       [0., 0., 0., 1., 0.],
+                       [0., 0., 0., 0., 1.]])
+    assert approx((0.4 + 4 * np.sqrt(0.76)) / 5) == fdiv_function._func(traits.T)
+
+
+def test_plot_context_shares_hull():
+    traits = np.array([[0.1, 0.2, 0.3, 0.4, 0.4, 0.3, 0.1, 0.1, 0.2],
+                       [0.2, 0.3, 0.2, 0.1, 0.5, 0.3, 0.5, 0.7, 0.2],
+                       [0.4, 0.2, 0.2, 0.4, 0.6, 0.6, 0.3, 0.3, 0.2]])
+    context = PlotContext(traits.T)
+    cvh_function = CVHFunction(3, 3, 1, 1)
+    fdiv_function = FDIVFunction(3, 3, 1, 1)
+
+    cvh_function.apply_function_to_plots([context], [1], [1])
+    hull = context.get_hull()
+    fdiv_function.apply_function_to_plots([context], [1], [1])
+
+    assert hull is context.get_hull()
+    assert approx(0.02) == cvh_function.get_array()[1][1]
+    assert approx(0.252741939118282) == fdiv_function.get_array()[1][1]
+
+
+def test_plot_context_invalid_hull():
+    context = PlotContext(np.ones((5, 3)))
+
+    assert context.get_hull() is None
+    assert np.isnan(CVHFunction(3, 3, 1, 1)._func(np.ones((5, 3))))
+    assert np.isnan(FDIVFunction(3, 3, 1, 1)._func(np.ones((5, 3))))
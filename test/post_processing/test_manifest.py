@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+from pytest import raises
+
+from multiply_post_processing.manifest import MANIFEST_NAME_FORMAT, RunManifest, get_file_identity
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+_OUTPUT_PATH = './test/test_data/manifest_output/'
+_PARAMETERS = {'roi': 'POLYGON ((0 0, 1 0, 1 1, 0 0))', 'spatial_resolution': 10, 'parameters': None}
+
+
+def _write_file(file_name: str, content: str):
+    directory = os.path.dirname(file_name)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(file_name, 'w') as file:
+        file.write(content)
+
+
+def _set_up() -> tuple:
+    if os.path.exists(_OUTPUT_PATH):
+        shutil.rmtree(_OUTPUT_PATH)
+    input_file = os.path.join(_OUTPUT_PATH, 'input', 'lai_20170605.tif')
+    output_file = os.path.join(_OUTPUT_PATH, 'indicator_20170605.tif')
+    _write_file(input_file, 'input')
+    _write_file(output_file, 'output')
+    manifest = RunManifest(_OUTPUT_PATH, 'dummy', _PARAMETERS)
+    assert not manifest.is_up_to_date('20170605', [input_file])
+    manifest.record('20170605', [output_file])
+    return input_file, output_file
+
+
+def test_manifest_unit_up_to_date():
+    try:
+        input_file, output_file = _set_up()
+
+        assert os.path.exists(os.path.join(_OUTPUT_PATH, MANIFEST_NAME_FORMAT.format('dummy')))
+        manifest = RunManifest(_OUTPUT_PATH, 'dummy', dict(_PARAMETERS))
+        assert manifest.is_up_to_date('20170605', [input_file])
+        assert not manifest.is_up_to_date('20170615', [input_file])
+        assert not RunManifest(_OUTPUT_PATH, 'other', _PARAMETERS).is_up_to_date('20170605', [input_file])
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_manifest_unit_outdated_when_input_changed():
+    try:
+        input_file, output_file = _set_up()
+        _write_file(input_file, 'changed input')
+
+        assert not RunManifest(_OUTPUT_PATH, 'dummy', _PARAMETERS).is_up_to_date('20170605', [input_file])
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_manifest_unit_outdated_when_parameters_changed():
+    try:
+        input_file, output_file = _set_up()
+        parameters = dict(_PARAMETERS)
+        parameters['spatial_resolution'] = 20
+
+        assert not RunManifest(_OUTPUT_PATH, 'dummy', parameters).is_up_to_date('20170605', [input_file])
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_manifest_unit_outdated_when_output_missing():
+    try:
+        input_file, output_file = _set_up()
+        os.remove(output_file)
+
+        assert not RunManifest(_OUTPUT_PATH, 'dummy', _PARAMETERS).is_up_to_date('20170605', [input_file])
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_manifest_ignores_other_version():
+    try:
+        input_file, output_file = _set_up()
+        manifest_file_name = os.path.join(_OUTPUT_PATH, MANIFEST_NAME_FORMAT.format('dummy'))
+        with open(manifest_file_name) as manifest_file:
+            content = json.load(manifest_file)
+        content['version'] = 0
+        with open(manifest_file_name, 'w') as manifest_file:
+            json.dump(content, manifest_file)
+
+        assert not RunManifest(_OUTPUT_PATH, 'dummy', _PARAMETERS).is_up_to_date('20170605', [input_file])
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_manifest_record_unknown_unit():
+    try:
+        manifest = RunManifest(_OUTPUT_PATH, 'dummy', _PARAMETERS)
+        with raises(ValueError):
+            manifest.record('20170605', [])
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
+
+
+def test_get_file_identity_of_directory():
+    try:
+        _write_file(os.path.join(_OUTPUT_PATH, 'product', 'B11_sur.tif'), 'b11')
+        _write_file(os.path.join(_OUTPUT_PATH, 'product', 'B12_sur.tif'), 'b12 band')
+
+        identity = get_file_identity(os.path.join(_OUTPUT_PATH, 'product'))
+
+        assert 2 == len(identity)
+        assert identity[0][0].endswith('B11_sur.tif')
+        assert 3 == identity[0][1]
+        assert 8 == identity[1][1]
+    finally:
+        if os.path.exists(_OUTPUT_PATH):
+            shutil.rmtree(_OUTPUT_PATH)
@@ -1,7 +1,10 @@
 from typing import List, Optional
 
+import gdal
+import multiprocessing
 import numpy as np
 import os
+import pickle
 import shutil
 
 from multiply_core.observations import get_valid_files
@@ -9,7 +12,12 @@ from multiply_core.util import FileRef
 from multiply_core.variables import Variable
 import multiply_post_processing
 from multiply_post_processing import PostProcessorCreator, VariablePostProcessor, PostProcessorType
-from multiply_post_processing.post_processing import _group_file_refs_by_date, run_post_processing
+from multiply_post_processing.burned_severity_post_processor import BurnedSeverityPostProcessor
+from multiply_post_processing.caching import DateCache
+from multiply_post_processing.manifest import MANIFEST_NAME_FORMAT
+from multiply_post_processing.post_processing import DestinationGrid, _get_tile_bounds, _get_tiles, \
+    _group_file_refs_by_date, _process_eo_data_pairs_with_prefetching, _read_variable, \
+    _get_worker_gdal_cache_max, plan_post_processor_groups, run_post_processing
 
 __author__ = "Tonio Fincke (Brockmann Consult GmbH)"
 
@@ -49,6 +57,69 @@ def test_group_file_refs_by_date():
     assert 2 == len(file_refs_by_date['1999-01-03'])
 
 
+def test_get_tiles():
+    tiles = _get_tiles(25, 12, 10)
+
+    assert 6 == len(tiles)
+    assert (0, 0, 10, 10) == tiles[0]
+    assert (10, 0, 10, 10) == tiles[1]
+    assert (20, 0, 5, 10) == tiles[2]
+    assert (0, 10, 10, 2) == tiles[3]
+    assert (10, 10, 10, 2) == tiles[4]
+    assert (20, 10, 5, 2) == tiles[5]
+
+
+def test_get_tiles_single_tile():
+    tiles = _get_tiles(25, 12, 100)
+
+    assert 1 == len(tiles)
+    assert (0, 0, 25, 12) == tiles[0]
+
+
+def test_get_tile_bounds():
+    geo_transform = (500000.0, 10.0, 0.0, 4300000.0, 0.0, -10.0)
+
+    tile_bounds = _get_tile_bounds(geo_transform, (20, 10, 5, 2))
+
+    assert [500200.0, 4299880.0, 500250.0, 4299900.0] == tile_bounds
+
+
+def test_destination_grid():
+    grid = DestinationGrid(SPATIAL_RESOLUTION, ROI, ROI_GRID, DESTINATION_GRID)
+
+    geo_transform = grid.get_geo_transform()
+    assert 10 == geo_transform[1]
+    assert -10 == geo_transform[5]
+    assert 0 < grid.get_width()
+    assert 0 < grid.get_height()
+    assert 'UTM zone 30N' in grid.get_projection()
+    assert grid.get_reprojection() is not None
+
+
+def test_destination_grid_pickle():
+    grid = DestinationGrid(SPATIAL_RESOLUTION, ROI, ROI_GRID, DESTINATION_GRID)
+    grid.get_geo_transform()
+
+    unpickled_grid = pickle.loads(pickle.dumps(grid))
+
+    assert grid.get_geo_transform() == unpickled_grid.get_geo_transform()
+    assert grid.get_projection() == unpickled_grid.get_projection()
+    assert grid.get_width() == unpickled_grid.get_width()
+    assert grid.get_height() == unpickled_grid.get_height()
+    assert unpickled_grid.get_reprojection() is not None
+
+
+def test_read_variable():
+    grid = DestinationGrid(SPATIAL_RESOLUTION, ROI, ROI_GRID, DESTINATION_GRID)
+    data_file = './test/test_data/lai_A2017156.tif'
+    expected_data = grid.get_reprojection().reproject(gdal.Open(data_file)).GetRasterBand(1).ReadAsArray()
+
+    data = _read_variable(data_file, grid)
+
+    assert (grid.get_height(), grid.get_width()) == data.shape
+    assert np.array_equal(expected_data, data)
+
+
 def test_get_valid_files():
     data_path = './test/test_data/'
     cab_files = get_valid_files(data_path, ['cab'])
@@ -100,6 +171,127 @@ def test_run_post_processing():
             shutil.rmtree(output_path)
 
 
+def test_run_post_processing_incremental():
+    output_path = './test/test_data/output/'
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    try:
+        run_post_processing(['indicator_1'], data_path='./test/test_data/', output_path=output_path, roi=ROI,
+                            spatial_resolution=SPATIAL_RESOLUTION, variable_names=['cdm', 'psoil'],
+                            roi_grid=ROI_GRID, destination_grid=DESTINATION_GRID, incremental=True)
+        assert os.path.exists('{}{}'.format(output_path, MANIFEST_NAME_FORMAT.format('dummy')))
+        first_file_name = '{}{}'.format(output_path, 'indicator_1_20170605.tif')
+        second_file_name = '{}{}'.format(output_path, 'indicator_1_20170615.tif')
+        modification_time = os.stat(first_file_name).st_mtime_ns
+        os.remove(second_file_name)
+
+        run_post_processing(['indicator_1'], data_path='./test/test_data/', output_path=output_path, roi=ROI,
+                            spatial_resolution=SPATIAL_RESOLUTION, variable_names=['cdm', 'psoil'],
+                            roi_grid=ROI_GRID, destination_grid=DESTINATION_GRID, incremental=True)
+        assert modification_time == os.stat(first_file_name).st_mtime_ns
+        assert os.path.exists(second_file_name)
+    finally:
+        if os.path.exists(output_path):
+            shutil.rmtree(output_path)
+
+
+class _RecordingPairProcessor(object):
+
+    def __init__(self):
+        self.read_dates = []
+        self.processed = []
+
+    def set_num_cached_dates(self, num_dates: int):
+        pass
+
+    def read_date(self, date: str, indices: Optional[List[int]] = None) -> List[str]:
+        self.read_dates.append((date, indices))
+        return ['data_{}_{}'.format(date, index) for index in indices]
+
+    def process_date_data(self, start: str, end: str, date_data: List[List[str]],
+                          indices: Optional[List[int]] = None):
+        self.processed.append((start, end, date_data, indices))
+
+
+def test_process_eo_data_pairs_with_prefetching_skips_dates():
+    pair_processor = _RecordingPairProcessor()
+
+    _process_eo_data_pairs_with_prefetching(pair_processor, [('a', 'b', [0]), ('b', 'c', [0]), ('d', 'e', [0])], 1,
+                                            None, 'dummy')
+
+    assert [('a', [0]), ('b', [0]), ('c', [0]), ('d', [0]), ('e', [0])] == pair_processor.read_dates
+    assert [('a', 'b', [['data_a_0'], ['data_b_0']], [0]), ('b', 'c', [['data_b_0'], ['data_c_0']], [0]),
+            ('d', 'e', [['data_d_0'], ['data_e_0']], [0])] == pair_processor.processed
+
+
+def test_process_eo_data_pairs_with_prefetching_reads_shared_dates_once():
+    pair_processor = _RecordingPairProcessor()
+
+    _process_eo_data_pairs_with_prefetching(pair_processor, [('a', 'b', [0]), ('b', 'c', [0, 1])], 1, None, 'dummy')
+
+    assert [('a', [0]), ('b', [0, 1]), ('c', [0, 1])] == pair_processor.read_dates
+    assert ('b', 'c', [['data_b_0', 'data_b_1'], ['data_c_0', 'data_c_1']], [0, 1]) == pair_processor.processed[1]
+
+
+def test_plan_post_processor_groups():
+    burned_severity = BurnedSeverityPostProcessor([])
+    burned_severity_2 = BurnedSeverityPostProcessor([])
+    dummy_1 = DummyPostProcessor(['indicator_1'])
+    dummy_2 = DummyPostProcessor(['indicator_2'])
+
+    groups = plan_post_processor_groups([dummy_1, burned_severity, dummy_2, burned_severity_2])
+
+    assert [[dummy_1, dummy_2], [burned_severity, burned_severity_2]] == groups
+
+
+def test_get_worker_gdal_cache_max(monkeypatch):
+    monkeypatch.setattr(gdal, 'GetCacheMax', lambda: 1 << 30, raising=False)
+
+    assert 1 << 28 == _get_worker_gdal_cache_max(4)
+    assert 1 << 24 == _get_worker_gdal_cache_max(128)
+
+
+def test_run_post_processing_with_workers():
+    output_path = './test/test_data/output/'
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    try:
+        run_post_processing(['indicator_1'], data_path='./test/test_data/', output_path=output_path, roi=ROI,
+                            spatial_resolution=SPATIAL_RESOLUTION, variable_names=['cdm', 'psoil'],
+                            roi_grid=ROI_GRID, destination_grid=DESTINATION_GRID, workers=2)
+        assert os.path.exists('{}{}'.format(output_path, 'indicator_1_20170605.tif'))
+        assert os.path.exists('{}{}'.format(output_path, 'indicator_1_20170615.tif'))
+    finally:
+        if os.path.exists(output_path):
+            shutil.rmtree(output_path)
+
+
+_WORKER_POST_PROCESSORS = None
+
+
+def _init_worker(post_processors: List[BurnedSeverityPostProcessor]):
+    global _WORKER_POST_PROCESSORS
+    _WORKER_POST_PROCESSORS = post_processors
+
+
+def _use_worker_date_cache(index: int) -> int:
+    post_processor = _WORKER_POST_PROCESSORS[index]
+    post_processor._get_cached('2017-06-01', 'nir', np.zeros, 4)
+    post_processor._get_cached('2017-06-01', 'nir', np.zeros, 4)
+    return post_processor._date_cache.get_num_hits()
+
+
+def test_eo_data_post_processors_with_date_caches_are_passed_to_spawned_workers():
+    # the pool of EO data post processors spawns its workers with the post processors the parent has set up
+    post_processors = [BurnedSeverityPostProcessor([]), BurnedSeverityPostProcessor([])]
+    for post_processor in post_processors:
+        post_processor.set_date_cache(DateCache(3))
+        post_processor._get_cached('2017-06-01', 'nir', np.zeros, 4)
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(2, initializer=_init_worker, initargs=(post_processors,)) as pool:
+        assert [1, 1] == pool.map(_use_worker_date_cache, [0, 1])
+
+
 class DummyPostProcessor(VariablePostProcessor):
 
     @classmethod
@@ -0,0 +1,81 @@
+import numpy as np
+import threading
+import time
+from pytest import raises
+
+from multiply_post_processing.prefetching import Prefetcher
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def test_prefetcher_preserves_order():
+    with Prefetcher(lambda value: value * 2, [(i,) for i in range(10)], queue_depth=3) as prefetcher:
+        results = list(prefetcher)
+
+    assert [i * 2 for i in range(10)] == results
+
+
+def test_prefetcher_raises_error_of_function():
+    def load(value):
+        if value == 2:
+            raise IOError('Cannot read')
+        return value
+
+    with Prefetcher(load, [(i,) for i in range(5)]) as prefetcher:
+        results = []
+        with raises(IOError):
+            for result in prefetcher:
+                results.append(result)
+
+    assert [0, 1] == results
+
+
+def test_prefetcher_respects_queue_depth():
+    loaded = []
+    lock = threading.Lock()
+
+    def load(value):
+        with lock:
+            loaded.append(value)
+        return value
+
+    with Prefetcher(load, [(i,) for i in range(10)], queue_depth=2) as prefetcher:
+        iterator = iter(prefetcher)
+        assert 0 == next(iterator)
+        time.sleep(0.2)
+        with lock:
+            # the consumed result plus two results held ahead
+            assert 3 == len(loaded)
+
+
+def test_prefetcher_respects_max_bytes():
+    loaded = []
+    lock = threading.Lock()
+
+    def load(value):
+        with lock:
+            loaded.append(value)
+        return {'band': np.zeros(100, dtype=np.float64)}
+
+    with Prefetcher(load, [(i,) for i in range(10)], queue_depth=5, max_bytes=800) as prefetcher:
+        iterator = iter(prefetcher)
+        next(iterator)
+        time.sleep(0.2)
+        with lock:
+            assert 2 == len(loaded)
+
+
+def test_prefetcher_records_wait_time():
+    def load(value):
+        time.sleep(0.05)
+        return value
+
+    with Prefetcher(load, [(i,) for i in range(3)]) as prefetcher:
+        list(prefetcher)
+
+    assert prefetcher.get_wait_time() > 0.05
+
+
+def test_prefetcher_invalid_queue_depth():
+    with raises(ValueError):
+        Prefetcher(lambda value: value, [(1,)], queue_depth=0)
@@ -0,0 +1,57 @@
+import numpy as np
+from pytest import approx, raises
+
+from multiply_post_processing.reductions import MaskedMean, merge_statistics
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def test_masked_mean():
+    masked_mean = MaskedMean(-9999)
+    masked_mean.update(np.array([[1.0, 2.0], [-9999, 6.0]]))
+
+    assert 3 == masked_mean.get_count()
+    assert approx(3.0) == masked_mean.get_mean()
+
+
+def test_masked_mean_no_valid_values():
+    masked_mean = MaskedMean(-9999)
+    masked_mean.update(np.array([-9999, -9999]))
+
+    assert 0 == masked_mean.get_count()
+    assert -9999 == masked_mean.get_mean()
+
+
+def test_masked_mean_merge_equals_full_scene():
+    scene = np.array([[1.0, 2.0, -9999, 4.0], [5.0, -9999, 7.0, 8.0]])
+    full_mean = MaskedMean(-9999)
+    full_mean.update(scene)
+    left_mean = MaskedMean(-9999)
+    left_mean.update(scene[:, :2])
+    right_mean = MaskedMean(-9999)
+    right_mean.update(scene[:, 2:])
+
+    left_mean.merge(right_mean)
+
+    assert full_mean.get_count() == left_mean.get_count()
+    assert full_mean.get_mean() == left_mean.get_mean()
+
+
+def test_masked_mean_merge_different_no_data():
+    with raises(ValueError):
+        MaskedMean(-9999).merge(MaskedMean(0))
+
+
+def test_merge_statistics():
+    first_statistics = {'a': MaskedMean(-1)}
+    first_statistics['a'].update(np.array([1.0, 3.0]))
+    second_statistics = {'a': MaskedMean(-1), 'b': MaskedMean(-1)}
+    second_statistics['a'].update(np.array([5.0, -1]))
+    second_statistics['b'].update(np.array([2.0]))
+
+    merged_statistics = merge_statistics(first_statistics, second_statistics)
+
+    assert approx(3.0) == merged_statistics['a'].get_mean()
+    assert approx(2.0) == merged_statistics['b'].get_mean()
+    assert merged_statistics is merge_statistics(merged_statistics, None)
+    assert merged_statistics is merge_statistics(None, merged_statistics)
@@ -0,0 +1,74 @@
+from typing import List
+
+from multiply_core.variables import Variable
+from multiply_post_processing import PostProcessorCreator, PostProcessorType
+from multiply_post_processing.registry import POST_PROCESSOR_CREATOR_REGISTRY, PostProcessorCatalog, \
+    add_post_processor_creator, get_post_processor_catalog, get_post_processor_creators, get_post_processor_names
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+_A = Variable({'short_name': 'a', 'display_name': 'A'})
+_B = Variable({'short_name': 'b', 'display_name': 'B'})
+_C = Variable({'short_name': 'c', 'display_name': 'C'})
+
+
+class _RecordingPostProcessorCreator(PostProcessorCreator):
+
+    def __init__(self, name: str, indicator_descriptions: List[Variable]):
+        self._name = name
+        self._indicator_descriptions = indicator_descriptions
+
+    def get_type(self) -> PostProcessorType:
+        return PostProcessorType.VARIABLE_POST_PROCESSOR
+
+    def get_required_input_data_types(self) -> List[str]:
+        return []
+
+    def get_name(self) -> str:
+        return self._name
+
+    def get_description(self) -> str:
+        return 'Describes {}'.format(self._name)
+
+    def get_indicator_descriptions(self) -> List[Variable]:
+        return self._indicator_descriptions
+
+    def create_post_processor(self, indicator_names: List[str]):
+        return self._name, indicator_names
+
+
+def test_post_processor_catalog():
+    first_creator = _RecordingPostProcessorCreator('first', [_A, _B])
+    second_creator = _RecordingPostProcessorCreator('second', [_C, _B])
+    catalog = PostProcessorCatalog([first_creator, second_creator])
+
+    assert ['first', 'second'] == catalog.get_post_processor_names()
+    assert second_creator == catalog.get_post_processor_creator('second')
+    assert catalog.get_post_processor_creator('third') is None
+    assert [_A, _B, _C] == catalog.get_indicators()
+    assert _C == catalog.get_indicator('c')
+    assert catalog.get_indicator('d') is None
+
+
+def test_post_processor_catalog_get_post_processors():
+    catalog = PostProcessorCatalog([_RecordingPostProcessorCreator('first', [_A, _B]),
+                                    _RecordingPostProcessorCreator('second', [_C, _B])])
+
+    assert [('first', ['a', 'b']), ('second', ['b'])] == catalog.get_post_processors(['b', 'a', 'd'])
+    assert [('second', ['c'])] == catalog.get_post_processors(['c'])
+    assert [] == catalog.get_post_processors([])
+
+
+def test_post_processor_catalog_is_rebuilt_when_creators_are_added():
+    registered_post_processor_creators = list(get_post_processor_creators())
+    try:
+        catalog = get_post_processor_catalog()
+        assert catalog is get_post_processor_catalog()
+
+        add_post_processor_creator(_RecordingPostProcessorCreator('registry_test', [_A]))
+
+        assert catalog is not get_post_processor_catalog()
+        assert 'registry_test' in get_post_processor_names()
+    finally:
+        POST_PROCESSOR_CREATOR_REGISTRY[:] = registered_post_processor_creators
+    assert 'registry_test' not in get_post_processor_names()
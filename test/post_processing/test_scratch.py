@@ -0,0 +1,81 @@
+import numpy as np
+import os
+import pickle
+import shutil
+import tempfile
+from pytest import raises
+
+from multiply_post_processing.scratch import ScratchSpace
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+
+def _create_directory() -> str:
+    return tempfile.mkdtemp()
+
+
+def test_scratch_space_keeps_small_arrays_in_memory():
+    directory = _create_directory()
+    try:
+        with ScratchSpace(directory, memory_threshold=800) as scratch_space:
+            array = scratch_space.full((10, 10), 2.0)
+            assert not isinstance(array, np.memmap)
+            assert np.all(array == 2.0)
+            assert [] == os.listdir(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_scratch_space_maps_large_arrays_to_files():
+    directory = _create_directory()
+    try:
+        with ScratchSpace(directory, memory_threshold=800) as scratch_space:
+            array = scratch_space.full((30, 10), np.nan, np.float32)
+            assert isinstance(array, np.memmap)
+            assert (30, 10) == array.shape
+            assert np.float32 == array.dtype
+            assert np.all(np.isnan(array))
+            array[3, 4] = 1.0
+            assert 1.0 == array[3, 4]
+        assert [] == os.listdir(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_scratch_space_without_threshold_keeps_arrays_in_memory():
+    scratch_space = ScratchSpace()
+    assert not scratch_space.exceeds_threshold(10 ** 12)
+    assert not isinstance(scratch_space.empty((100, 100)), np.memmap)
+    scratch_space.close()
+
+
+def test_scratch_space_removes_files_on_failure():
+    directory = _create_directory()
+    try:
+        with raises(RuntimeError):
+            with ScratchSpace(directory, memory_threshold=0) as scratch_space:
+                scratch_space.empty((5, 5))
+                raise RuntimeError('Processing failed')
+        assert [] == os.listdir(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_scratch_space_passed_to_other_process_allocates_in_subdirectory():
+    directory = _create_directory()
+    try:
+        scratch_space = ScratchSpace(directory, memory_threshold=0)
+        other_scratch_space = pickle.loads(pickle.dumps(scratch_space))
+        other_scratch_space.empty((5, 5))
+        assert 1 == len(os.listdir(directory))
+        other_scratch_space.close()
+        assert 1 == len(os.listdir(directory))
+        scratch_space.close()
+        assert [] == os.listdir(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_scratch_space_invalid_threshold():
+    with raises(ValueError):
+        ScratchSpace(memory_threshold=-1)
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+# generous, so that the benchmark does not fail on slow machines, but far below the time the heavy imports take
+_MAX_STARTUP_TIME = 2.0
+_HEAVY_MODULES = ['gdal', 'osr', 'pkg_resources', 'scipy', 'shapely', 'sklearn', 'multiply_core.observations',
+                  'multiply_post_processing.post_processing']
+_STARTUP_SCRIPT = '''
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import multiply_post_processing
+post_processor_names = multiply_post_processing.get_post_processor_names()
+multiply_post_processing.get_available_indicators()
+startup_time = time.perf_counter() - start
+print(json.dumps({'startup_time': startup_time, 'modules': sorted(sys.modules.keys())}))
+'''
+
+
+def _run_startup_script() -> dict:
+    root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+    environment = dict(os.environ)
+    python_path = [root_path] + [path for path in sys.path if path != '']
+    environment['PYTHONPATH'] = os.pathsep.join(python_path)
+    output = subprocess.check_output([sys.executable, '-c', _STARTUP_SCRIPT], cwd=root_path, env=environment)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def test_startup_does_not_import_heavy_modules():
+    startup = _run_startup_script()
+
+    for heavy_module in _HEAVY_MODULES:
+        assert heavy_module not in startup['modules']
+
+
+def test_startup_time():
+    startup = _run_startup_script()
+
+    assert startup['startup_time'] < _MAX_STARTUP_TIME
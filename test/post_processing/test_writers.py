@@ -0,0 +1,140 @@
+import gdal
+import numpy as np
+import os
+import shutil
+import threading
+from pytest import raises
+
+from multiply_post_processing.writers import AsyncWriter, BlockGeoTiffWriter, write_cogs, _get_overview_factors
+
+__author__ = "Tonio Fincke (Brockmann Consult GmbH)"
+
+_GEO_TRANSFORM = (500000.0, 10.0, 0.0, 4300000.0, 0.0, -10.0)
+_PROJECTION = 'PROJCS["WGS 84 / UTM zone 30N",GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,' \
+              '298.257223563]],PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]],' \
+              'PROJECTION["Transverse_Mercator"],PARAMETER["latitude_of_origin",0],' \
+              'PARAMETER["central_meridian",-3],PARAMETER["scale_factor",0.9996],' \
+              'PARAMETER["false_easting",500000],PARAMETER["false_northing",0],UNIT["metre",1]]'
+
+
+def test_block_geotiff_writer():
+    output_path = './test/test_data/block_output/'
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    try:
+        file_names = ['{}{}'.format(output_path, 'a.tif'), '{}{}'.format(output_path, 'b.tif')]
+        writer = BlockGeoTiffWriter(file_names, _GEO_TRANSFORM, _PROJECTION, 5, 3, [np.float32, np.float64])
+        writer.write_block([np.full((3, 3), 1.0, dtype=np.float32), np.full((3, 3), 3.0)], 0, 0)
+        writer.write_block([np.full((3, 2), 2.0, dtype=np.float32), np.full((3, 2), 4.0)], 3, 0)
+        writer.close()
+
+        data_set_a = gdal.Open(file_names[0])
+        assert gdal.GDT_Float32 == data_set_a.GetRasterBand(1).DataType
+        assert _GEO_TRANSFORM == data_set_a.GetGeoTransform()
+        data_a = data_set_a.GetRasterBand(1).ReadAsArray()
+        assert (3, 5) == data_a.shape
+        assert np.all(data_a[:, :3] == 1.0)
+        assert np.all(data_a[:, 3:] == 2.0)
+        data_b = gdal.Open(file_names[1]).GetRasterBand(1).ReadAsArray()
+        assert np.all(data_b[:, :3] == 3.0)
+        assert np.all(data_b[:, 3:] == 4.0)
+    finally:
+        if os.path.exists(output_path):
+            shutil.rmtree(output_path)
+
+
+def test_write_cogs():
+    output_path = './test/test_data/cog_output/'
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    try:
+        file_names = ['{}{}'.format(output_path, 'a.tif'), '{}{}'.format(output_path, 'b.tif')]
+        data_a = np.arange(1200 * 1100, dtype=np.float32).reshape(1100, 1200)
+        data_b = np.full((1100, 1200), 3, dtype=np.int16)
+        write_cogs([data_a, data_b], file_names, _GEO_TRANSFORM, _PROJECTION, compression='LZW')
+
+        data_set_a = gdal.Open(file_names[0])
+        band_a = data_set_a.GetRasterBand(1)
+        assert gdal.GDT_Float32 == band_a.DataType
+        assert _GEO_TRANSFORM == data_set_a.GetGeoTransform()
+        assert [512, 512] == band_a.GetBlockSize()
+        assert 2 == band_a.GetOverviewCount()
+        assert 'LZW' == data_set_a.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE')
+        assert np.array_equal(data_a, band_a.ReadAsArray())
+        data_set_b = gdal.Open(file_names[1])
+        assert gdal.GDT_Int16 == data_set_b.GetRasterBand(1).DataType
+        assert np.array_equal(data_b, data_set_b.GetRasterBand(1).ReadAsArray())
+    finally:
+        if os.path.exists(output_path):
+            shutil.rmtree(output_path)
+
+
+def test_write_cogs_unsupported_compression():
+    with raises(ValueError):
+        write_cogs([np.zeros((3, 3))], ['./test/test_data/cog_output/a.tif'], _GEO_TRANSFORM, _PROJECTION,
+                   compression='JPEG2000')
+
+
+def test_get_overview_factors():
+    assert [] == _get_overview_factors(512, 300)
+    assert [2] == _get_overview_factors(1000, 600)
+    assert [2, 4, 8] == _get_overview_factors(3000, 4000)
+
+
+def test_async_writer_runs_all_jobs():
+    written = []
+    lock = threading.Lock()
+
+    def write(value):
+        with lock:
+            written.append(value)
+
+    with AsyncWriter(2) as writer:
+        for i in range(10):
+            writer.submit(write, i)
+
+    assert list(range(10)) == sorted(written)
+
+
+def test_async_writer_bounds_queue():
+    release = threading.Event()
+    submitted = []
+
+    def submit_all(writer):
+        for i in range(5):
+            writer.submit(release.wait)
+            submitted.append(i)
+
+    writer = AsyncWriter(1, queue_size=2)
+    thread = threading.Thread(target=submit_all, args=(writer,))
+    thread.start()
+    thread.join(0.2)
+    # one job is being run, two are queued, the fourth one cannot be submitted
+    assert 3 == len(submitted)
+    release.set()
+    thread.join()
+    writer.close()
+    assert 5 == len(submitted)
+
+
+def test_async_writer_raises_errors_on_close():
+    written = []
+
+    def write(value):
+        if value == 1:
+            raise IOError('Disk full')
+        written.append(value)
+
+    writer = AsyncWriter(1)
+    for i in range(3):
+        writer.submit(write, i)
+    with raises(RuntimeError):
+        writer.close()
+    assert [0, 2] == written
+
+
+def test_async_writer_without_threads_writes_synchronously():
+    written = []
+    with AsyncWriter(0) as writer:
+        writer.submit(written.append, 1)
+        assert [1] == written